@@ -60,7 +60,21 @@ SIMULTANEOUS_SIMULATION = 10
 # May increase clustering if you have a high density of workers.
 GOOD_ENOUGH = 0.1
 
-# Seconds to sleep after failing to find an eligible worker before trying again.
+# Plan which workers will visit the known spawns of the next this many seconds
+# as a batch, instead of choosing the best worker for each spawn when it
+# happens. Can lower the number of skipped spawns when workers are scarce.
+#PLANNER_WINDOW = 60
+
+# Visit known spawns that happen within this many seconds of each other and
+# within COALESCE_RADIUS meters of a point together, from that point.
+#COALESCE_WINDOW = 10
+# Coalesced visits aren't randomized, so this only needs to stay well below
+# the 70 meters that Pokemon are visible within.
+#COALESCE_RADIUS = 25
+
+# Points that no worker can reach are checked again when a worker becomes
+# available or an idle one has waited long enough to reach them, or after
+# this many seconds at the most.
 SEARCH_SLEEP = 2.5
 
 ## alternatively define a Polygon to use as boundaries (requires shapely)
@@ -87,6 +101,10 @@ SEARCH_SLEEP = 2.5
 # Only swap if it's been active for more than x minutes
 #MINIMUM_RUNTIME = 10
 
+# Keep this many extra accounts logged in ahead of time, so that workers can
+# swap accounts without waiting for a login and app simulation.
+#STANDBY_ACCOUNTS = 0
+
 ### these next 6 options use more requests but look more like the real client
 APP_SIMULATION = True     # mimic the actual app's login requests
 COMPLETE_TUTORIAL = True  # complete the tutorial process and configure avatar for all accounts that haven't yet
@@ -100,6 +118,10 @@ INCUBATE_EGGS = True      # incubate eggs if available
 # None will never encounter Pokémon
 ENCOUNTER = None
 #ENCOUNTER_IDS = (3, 6, 9, 45, 62, 71, 80, 85, 87, 89, 91, 94, 114, 130, 131, 134)
+# Pokémon are encountered after the visit that finds them, by the nearest idle
+# workers, with those eligible for notification first and then ENCOUNTER_IDS.
+# maximum number of encounters at once (default is a quarter of the workers)
+#ENCOUNTER_LIMIT = 25
 
 # PokéStops
 SPIN_POKESTOPS = True  # spin all PokéStops that are within range
@@ -176,7 +198,9 @@ REPORT_MAPS = True  # Show maps on reports
 ## Get new accounts from the CAPTCHA queue first if it's not empty
 #FAVOR_CAPTCHA = True
 
-# allow displaying the live location of workers on the map
+# allow displaying the live location of workers on the map, the web server
+# reads it from pickles/workers.snapshot in DIRECTORY, so it must run on the
+# same machine as the scanner or share that folder with it
 MAP_WORKERS = True
 # filter these Pokemon from the map to reduce traffic and browser load
 #MAP_FILTER_IDS = [161, 165, 16, 19, 167]
@@ -194,6 +218,8 @@ FAILURES_ALLOWED = 2
 
 # set of proxy addresses and ports
 # SOCKS requires aiosocks to be installed
+# workers get the proxies with the lowest latency and fewest errors, proxies
+# that are IP banned or keep failing are rested for a while
 #PROXIES = {'http://127.0.0.1:8080', 'https://127.0.0.1:8443', 'socks5://127.0.0.1:1080'}
 
 # convert spawn_id to integer for more efficient DB storage, set to False if
@@ -205,11 +231,29 @@ FAILURES_ALLOWED = 2
 # Address to use for manager, leave commented if you're not sure.
 #MANAGER_ADDRESS = r'\\.\pipe\monocle'  # must be in this format for Windows
 #MANAGER_ADDRESS = 'monocle.sock'       # the socket name for Unix systems
-#MANAGER_ADDRESS = ('127.0.0.1', 5002)  # could be used for CAPTCHA solving and live worker maps on remote systems
+#MANAGER_ADDRESS = ('127.0.0.1', 5002)  # could be used for CAPTCHA solving on remote systems
+# The manager no longer serves the worker map, see MAP_WORKERS.
 
 # Store the cell IDs so that they don't have to be recalculated every visit.
-# Enabling will (potentially drastically) increase memory usage.
+# Takes 4 bytes for every 0.0001 degree point in the bounding box of the scan
+# area, up to 16MB, plus the distinct sets of cell IDs.
 #CACHE_CELLS = False
+# Calculate the cell IDs of every point at startup, using this many processes.
+#PRECOMPUTE_CELLS = 4
+
+# Maximum number of entries to keep in each of the sighting, mystery and
+# notification caches. Entries closest to expiring are evicted first.
+#CACHE_LIMIT = None
+
+# The sighting and mystery caches are saved on exit and restored on startup.
+# Set to also save them every this many seconds, in case of a crash.
+#CACHE_PICKLE_INTERVAL = 1800
+
+# Save up to this many queued items to the database with multi-row INSERTs,
+# waiting at most DB_BATCH_WAIT seconds to fill a batch. Set to 1 to save
+# items one at a time.
+#DB_BATCH_SIZE = 500
+#DB_BATCH_WAIT = 1
 
 # Only for use with web_sanic (requires PostgreSQL)
 #DB = {'host': '127.0.0.1', 'user': 'monocle_role', 'password': 'pik4chu', 'port': '5432', 'database': 'monocle'}
@@ -219,6 +263,9 @@ FAILURES_ALLOWED = 2
 
 # The number of coroutines that are allowed to run simultaneously.
 #COROUTINES_LIMIT = GRID[0] * GRID[1]
+# Let the limit adapt, up to this many, to the skipped spawns, the time visits
+# wait for a worker and the event loop's lag (starts at COROUTINES_LIMIT).
+#COROUTINES_MAX = GRID[0] * GRID[1] * 4
 
 ### FRONTEND CONFIGURATION
 LOAD_CUSTOM_HTML_FILE = False # File path MUST be 'templates/custom.html'
@@ -0,0 +1,146 @@
+"""Accounts that aren't in use by a worker, kept in the scanner process
+
+Workers check accounts out and back in directly, without a round trip to a
+manager process. Other processes, like solve_captchas.py, reach the same
+queues through the scanner's manager with QueueFacade.
+"""
+
+from asyncio import Future
+from collections import deque
+from heapq import heappop, heappush
+from itertools import count
+from queue import Empty
+from threading import Condition
+from time import monotonic
+
+from .shared import LOOP
+
+
+class AccountQueue:
+    """Accounts waiting to be used, the ones that have rested longest first
+
+    Accounts are ordered by the time of their last request, so an account
+    that was just swapped out cools down behind the others, then by level,
+    highest first. Accounts can be put from any thread, coroutines in the
+    event loop wait for them with get() and wait_below().
+    """
+    def __init__(self, loop=LOOP):
+        self.loop = loop
+        self.heap = []
+        self.sequence = count()
+        self.condition = Condition()
+        # futures of coroutines waiting for an account
+        self.getters = deque()
+        # (maxsize, future) of coroutines waiting for the queue to shrink
+        self.drainers = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def qsize(self):
+        return len(self.heap)
+
+    def empty(self):
+        return not self.heap
+
+    @staticmethod
+    def priority(account):
+        return account.get('time') or 0, -(account.get('level') or 0)
+
+    def put(self, account):
+        with self.condition:
+            heappush(self.heap, (self.priority(account), next(self.sequence), account))
+            self.condition.notify()
+        self._notify()
+
+    def get_nowait(self):
+        with self.condition:
+            if not self.heap:
+                raise Empty
+            account = heappop(self.heap)[-1]
+        if self.drainers:
+            self._notify()
+        return account
+
+    def get_blocking(self, timeout=None):
+        """Wait for an account from a thread other than the event loop's."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.heap, timeout):
+                raise Empty
+            account = heappop(self.heap)[-1]
+        self._notify()
+        return account
+
+    async def get(self):
+        while True:
+            try:
+                return self.get_nowait()
+            except Empty:
+                future = Future(loop=self.loop)
+                self.getters.append(future)
+                await future
+
+    async def wait_below(self, maxsize):
+        """Wait until fewer than maxsize accounts are queued, return the
+        number of seconds waited.
+        """
+        start = monotonic()
+        while len(self.heap) >= maxsize:
+            future = Future(loop=self.loop)
+            self.drainers.append((maxsize, future))
+            await future
+        return monotonic() - start
+
+    def _notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # the event loop is closed
+            pass
+
+    def _wake(self):
+        size = len(self.heap)
+        getters = self.getters
+        woken = 0
+        while getters and woken < size:
+            future = getters.popleft()
+            # cancelled getters don't take an account
+            if not future.done():
+                future.set_result(None)
+                woken += 1
+        if self.drainers:
+            waiting = []
+            for maxsize, future in self.drainers:
+                if size < maxsize:
+                    if not future.done():
+                        future.set_result(None)
+                else:
+                    waiting.append((maxsize, future))
+            self.drainers = waiting
+
+
+class QueueFacade:
+    """The subset of queue.Queue that other processes use, served by the
+    scanner's manager
+    """
+    def __init__(self, queue):
+        self._queue = queue
+
+    def put(self, account, block=True, timeout=None):
+        self._queue.put(account)
+
+    def get(self, block=True, timeout=None):
+        return self._queue.get_blocking(timeout if block else 0)
+
+    def get_nowait(self):
+        return self._queue.get_blocking(0)
+
+    def empty(self):
+        return self._queue.empty()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+EXTRA_QUEUE = AccountQueue()
+CAPTCHA_QUEUE = AccountQueue()
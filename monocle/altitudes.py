@@ -1,5 +1,6 @@
 import sys
 
+from array import array
 from asyncio import gather, CancelledError
 from statistics import mean
 
@@ -10,7 +11,8 @@ from cyrandom import uniform
 
 from . import bounds, sanitized as conf
 from .shared import get_logger, LOOP, run_threaded
-from .utils import dump_pickle, float_range, load_pickle, round_coords
+from .snapshot import dump_snapshot, load_snapshot, iter_points, points_array
+from .utils import float_range, load_pickle, round_coords
 
 
 class Altitudes:
@@ -100,12 +102,15 @@ class Altitudes:
 
     def load(self):
         try:
-            state = load_pickle('altitudes', raise_exception=True)
+            state = self.load_snapshot()
         except FileNotFoundError:
-            self.log.info('No altitudes pickle found.')
-            self.altitudes = {}
-            LOOP.run_until_complete(self.get_all())
-            return
+            try:
+                state = load_pickle('altitudes', raise_exception=True)
+            except FileNotFoundError:
+                self.log.info('No altitudes snapshot found.')
+                self.altitudes = {}
+                LOOP.run_until_complete(self.get_all())
+                return
 
         if state['bounds_hash'] == hash(bounds):
             if state['precision'] == conf.ALT_PRECISION and state['altitudes']:
@@ -131,15 +136,36 @@ class Altitudes:
         self.altitudes = {}
         LOOP.run_until_complete(self.get_all())
 
+    def load_snapshot(self):
+        try:
+            snapshot = load_snapshot('altitudes')
+            return {
+                'altitudes': dict(zip(iter_points(snapshot['points']),
+                                      snapshot['altitudes'])),
+                'precision': snapshot.meta['precision'],
+                'bounds_hash': snapshot.meta['bounds_hash']
+            }
+        except (ValueError, KeyError):
+            self.log.warning('Invalid altitudes snapshot.')
+            raise FileNotFoundError
+
     def pickle(self):
         if self.changed:
-            state = {
-                'altitudes': self.altitudes,
-                'precision': conf.ALT_PRECISION,
-                'bounds_hash': hash(bounds)
-            }
-            dump_pickle('altitudes', state)
+            # cleared before copying so that altitudes added meanwhile are
+            # saved next time, and set again if the snapshot isn't written
             self.changed = False
+            altitudes = self.altitudes.copy()
+            try:
+                dump_snapshot('altitudes', {
+                    'precision': conf.ALT_PRECISION,
+                    'bounds_hash': hash(bounds)
+                }, {
+                    'points': points_array(altitudes.keys()),
+                    'altitudes': array('d', altitudes.values())
+                })
+            except Exception:
+                self.changed = True
+                raise
 
     def get_coords(self, bounds=bounds, precision=conf.ALT_PRECISION):
         coords = []
@@ -0,0 +1,197 @@
+"""Cell IDs for the points workers visit, rounded to 4 decimal places
+
+Points within the bounding box of the scan area are looked up in a dense
+array that holds, for every rounded point, an index into a table of the
+distinct sets of cell IDs. The array is filled in as points are visited,
+or all at once at startup by precompute(). Points outside of the box are
+kept in a small LRU cache.
+"""
+
+from array import array, typecodes
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .shared import get_logger
+from .snapshot import dump_snapshot, load_snapshot, iter_points
+from .utils import load_pickle
+
+if 'Q' in typecodes:
+    from pogeo import get_cell_ids_compact as _pogeo_cell_ids
+else:
+    from pogeo import get_cell_ids as _pogeo_cell_ids
+
+SCALE = 10000
+# largest number of points to keep in the array, 4 bytes each
+MAX_GRID_SIZE = 4000000
+VERSION = 2
+
+log = get_logger('cells')
+
+
+def _compute_rows(row0, column0, first, last, columns):
+    """Calculate the cell IDs for rows first to last of a grid.
+
+    Returns the index of each point into the returned list of distinct sets
+    of cell IDs. Runs in a separate process when precomputing in a pool.
+    """
+    indexes = array('I')
+    sets = []
+    interned = {}
+    for row in range(first, last):
+        lat = (row + row0) / SCALE
+        for column in range(column0, column0 + columns):
+            key = tuple(_pogeo_cell_ids((lat, column / SCALE)))
+            try:
+                indexes.append(interned[key])
+            except KeyError:
+                interned[key] = len(sets)
+                indexes.append(len(sets))
+                sets.append(key)
+    return first, indexes.tobytes(), sets
+
+
+class CellGrid:
+    """Cell IDs of the rounded points within a bounding box"""
+    def __init__(self, south, west, north, east, limit=MAX_GRID_SIZE, lru_size=4096):
+        self.row0 = round(south * SCALE)
+        self.column0 = round(west * SCALE)
+        self.rows = round(north * SCALE) - self.row0 + 1
+        self.columns = round(east * SCALE) - self.column0 + 1
+        if self.rows * self.columns > limit:
+            log.warning('The scan area is too large to keep every cell, {} '
+                        'points would be needed.', self.rows * self.columns)
+            self.grid = None
+        else:
+            self.grid = array('I', bytes(4 * self.rows * self.columns))
+        # distinct sets of cell IDs, 0 means unknown
+        self.sets = [None]
+        # {cell IDs tuple: index in sets}
+        self.interned = {}
+        # {rounded point: cell IDs} for points outside of the grid
+        self.lru = OrderedDict()
+        self.lru_size = lru_size
+
+    def __len__(self):
+        return len(self.sets) - 1
+
+    @property
+    def bbox(self):
+        return [self.row0, self.column0, self.rows, self.columns]
+
+    def intern(self, ids):
+        """Return the index of a set of cell IDs, adding it if it's new."""
+        key = tuple(ids)
+        try:
+            return self.interned[key]
+        except KeyError:
+            index = len(self.sets)
+            self.interned[key] = index
+            self.sets.append(array('Q', key) if 'Q' in typecodes else key)
+            return index
+
+    def get(self, point):
+        """Return the cell IDs for a point rounded to 4 decimal places."""
+        row = round(point[0] * SCALE)
+        column = round(point[1] * SCALE)
+        r = row - self.row0
+        c = column - self.column0
+        grid = self.grid
+        if grid is not None and 0 <= r < self.rows and 0 <= c < self.columns:
+            position = r * self.columns + c
+            index = grid[position]
+            if not index:
+                index = self.intern(_pogeo_cell_ids((row / SCALE, column / SCALE)))
+                grid[position] = index
+            return self.sets[index]
+
+        lru = self.lru
+        try:
+            ids = lru[row, column]
+            lru.move_to_end((row, column))
+            return ids
+        except KeyError:
+            ids = _pogeo_cell_ids((row / SCALE, column / SCALE))
+            lru[row, column] = ids
+            if len(lru) > self.lru_size:
+                lru.popitem(last=False)
+            return ids
+
+    def add(self, point, ids):
+        """Store the cell IDs of a rounded point if it's within the grid."""
+        r = round(point[0] * SCALE) - self.row0
+        c = round(point[1] * SCALE) - self.column0
+        if self.grid is not None and 0 <= r < self.rows and 0 <= c < self.columns:
+            self.grid[r * self.columns + c] = self.intern(ids)
+
+    def precompute(self, processes=None):
+        """Calculate the cell IDs of every point in the grid, split between
+        a pool of processes if processes is more than 1.
+        """
+        if self.grid is None:
+            return
+        rows, columns = self.rows, self.columns
+        step = max(rows // (max(processes or 1, 1) * 8), 1)
+        chunks = [(self.row0, self.column0, first, min(first + step, rows), columns)
+                  for first in range(0, rows, step)
+                  if 0 in self.grid[first * columns:min(first + step, rows) * columns]]
+        if not chunks:
+            return
+        log.warning('Calculating the cell IDs of {} rows of points.', rows)
+        if processes and processes > 1:
+            with ProcessPoolExecutor(processes) as executor:
+                results = executor.map(_compute_rows, *zip(*chunks))
+                self._merge(results)
+        else:
+            self._merge(_compute_rows(*chunk) for chunk in chunks)
+
+    def _merge(self, results):
+        grid = self.grid
+        columns = self.columns
+        for first, indexes, sets in results:
+            local = array('I')
+            local.frombytes(indexes)
+            mapping = [self.intern(ids) for ids in sets]
+            start = first * columns
+            for offset, index in enumerate(local):
+                if not grid[start + offset]:
+                    grid[start + offset] = mapping[index]
+
+    def dump(self):
+        sets = self.sets[1:]
+        sections = {
+            'counts': array('B', (len(x) for x in sets)),
+            'cell_ids': array('Q', (i for x in sets for i in x))
+        }
+        if self.grid is not None:
+            sections['grid'] = self.grid
+        dump_snapshot('cells', {'version': VERSION, 'bbox': self.bbox}, sections)
+
+    def restore(self, snapshot):
+        """Load a snapshot from this or an older version."""
+        ids = snapshot['cell_ids']
+        start = 0
+        if snapshot.meta.get('version') == VERSION:
+            if snapshot.meta['bbox'] != self.bbox:
+                # the scan area changed
+                return
+            for count in snapshot['counts']:
+                self.intern(ids[start:start + count])
+                start += count
+            if self.grid is not None and 'grid' in snapshot:
+                self.grid = snapshot.array('grid')
+        else:
+            for point, count in zip(iter_points(snapshot['points']), snapshot['counts']):
+                self.add(point, ids[start:start + count])
+                start += count
+
+    @classmethod
+    def load(cls, bounds):
+        cells = cls(bounds.south, bounds.west, bounds.north, bounds.east)
+        try:
+            cells.restore(load_snapshot('cells'))
+        except FileNotFoundError:
+            for point, ids in (load_pickle('cells') or {}).items():
+                cells.add(point, ids)
+        except (ValueError, KeyError):
+            pass
+        return cells
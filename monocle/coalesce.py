@@ -0,0 +1,124 @@
+from math import ceil
+
+from pogeo import get_distance
+
+from .spatial import GridMap
+
+
+class Coalescer:
+    """Groups known spawns that happen within window seconds of each other
+    and fit within radius meters of a point into a single visit
+
+    The first spawn of a group is visited at the centroid of the group once
+    the last one has spawned, and the others are marked as covered so the
+    launcher skips them.
+    """
+    def __init__(self, window, radius, ref_lat=0.0):
+        self.window = window
+        self.radius = radius
+        self.ref_lat = ref_lat
+        self.schedule = None
+        # {row: point} of the schedule's spawns
+        self.index = None
+        # {spawn_id: spawn_time} of spawns covered by another spawn's visit
+        self.covered = {}
+        self.groups = 0
+        self.coalesced = 0
+
+    def reindex(self, schedule, now=None):
+        index = GridMap(self.radius * 2, self.ref_lat)
+        for row, point in enumerate(schedule):
+            index.set(row, point)
+        self.index = index
+        self.schedule = schedule
+        if now:
+            for spawn_id, spawn_time in list(self.covered.items()):
+                if spawn_time < now - 3600:
+                    del self.covered[spawn_id]
+
+    def covers(self, spawn_id, spawn_time):
+        """Is this spawn covered by the visit to another?"""
+        if self.covered.pop(spawn_id, None) == spawn_time:
+            self.coalesced += 1
+            return True
+        return False
+
+    def group(self, point, spawn_id, spawn_time):
+        """Return the point and time to visit a spawn at, and the other
+        spawns the visit covers as {spawn_id: (point, spawn_time)}.
+        """
+        schedule = self.schedule
+        try:
+            anchor = schedule.row(spawn_id)
+        except (AttributeError, KeyError):
+            return point, spawn_time, ()
+        radius = self.radius
+        window = self.window
+        seconds = schedule.seconds
+        spawn_ids = schedule.spawn_ids
+        spawn_seconds = spawn_time % 3600
+        covered = self.covered
+
+        candidates = []
+        rings = ceil(radius * 2 / self.index.cell_size)
+        points = self.index.points
+        for _, rows in self.index.rings(point, rings):
+            for row in rows:
+                offset = (seconds[row] - spawn_seconds) % 3600
+                # spawns at the same second are launched in schedule order
+                if offset > window or (offset == 0 and row <= anchor):
+                    continue
+                if spawn_ids[row] in covered:
+                    continue
+                distance = get_distance(point, points[row])
+                if distance <= radius * 2:
+                    candidates.append((distance, row, offset))
+        if not candidates:
+            return point, spawn_time, ()
+
+        candidates.sort()
+        members = [point]
+        others = []
+        latest = 0
+        centroid = point
+        for _, row, offset in candidates:
+            trial = members + [points[row]]
+            center = (sum(p[0] for p in trial) / len(trial),
+                      sum(p[1] for p in trial) / len(trial))
+            if all(get_distance(center, p) <= radius for p in trial):
+                members = trial
+                centroid = center
+                others.append(row)
+                latest = max(latest, offset)
+        if not others:
+            return point, spawn_time, ()
+
+        covering = {}
+        for row in others:
+            member_id = spawn_ids[row]
+            member_time = spawn_time + (seconds[row] - spawn_seconds) % 3600
+            covered[member_id] = member_time
+            covering[member_id] = points[row], member_time
+        self.groups += 1
+        return centroid, spawn_time + latest, covering
+
+    def release(self, covering):
+        """Stop covering the spawns of a visit that didn't happen.
+
+        Spawns the launcher hasn't reached yet will be launched as usual,
+        the ones it already skipped are returned as (spawn_id, point,
+        spawn_time) tuples to be visited on their own.
+        """
+        skipped = []
+        for spawn_id, (point, spawn_time) in covering.items():
+            if self.covered.get(spawn_id) == spawn_time:
+                self.covered.pop(spawn_id, None)
+            else:
+                self.coalesced -= 1
+                skipped.append((spawn_id, point, spawn_time))
+        return skipped
+
+    @property
+    def status(self):
+        return 'Coalesced visits: {}, spawns covered: {}'.format(
+            self.groups, self.coalesced)
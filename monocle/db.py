@@ -1,19 +1,34 @@
+from array import array
 from datetime import datetime
 from collections import OrderedDict
 from contextlib import contextmanager
 from enum import Enum
 from time import time, mktime
 
-from sqlalchemy import Column, Integer, String, Float, SmallInteger, BigInteger, ForeignKey, UniqueConstraint, create_engine, cast, func, desc, asc, and_, exists
+from sqlalchemy import Column, Integer, String, Float, SmallInteger, BigInteger, ForeignKey, UniqueConstraint, create_engine, cast, func, literal_column, bindparam, desc, asc, and_, exists
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.types import TypeDecorator, Numeric, Text
 from sqlalchemy.dialects.mysql import TINYINT, MEDIUMINT, BIGINT, DOUBLE
-from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, insert as pg_insert
 from sqlalchemy.ext.declarative import declarative_base
 
+try:
+    from sqlalchemy.dialects.mysql import insert as mysql_insert
+except ImportError:
+    # ON DUPLICATE KEY UPDATE requires SQLAlchemy 1.2
+    mysql_insert = None
+
+try:
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+except ImportError:
+    # ON CONFLICT requires SQLAlchemy 1.4
+    sqlite_insert = None
+
 from . import bounds, spawns, db_proc, sanitized as conf
 from .utils import time_until_time, dump_pickle, load_pickle
-from .shared import call_at, get_logger
+from .shared import get_logger
+from .expiring import ExpiringMap
+from .snapshot import dump_snapshot, load_snapshot, SnapshotError
 
 try:
     assert conf.LAST_MIGRATION < time()
@@ -76,32 +91,107 @@ def combine_key(sighting):
     return sighting['encounter_id'], sighting['spawn_id']
 
 
+def pack_ids(ids):
+    """Store integer IDs in an array, or string IDs in a list, to be saved
+    in a snapshot
+    """
+    if all(isinstance(x, int) for x in ids):
+        return array('Q', ids)
+    return list(ids)
+
+
+def unpack_ids(ids):
+    """Restore IDs from a snapshot section, converting any saved as strings
+    back to integers if spawn IDs are integers
+    """
+    if isinstance(ids, list) and conf.SPAWN_ID_INT:
+        return [int(x) for x in ids]
+    return ids
+
+
+def is_lured(spawn_id):
+    return spawn_id == -1 or spawn_id == 'LURED'
+
+
+class Journal:
+    """Changes made to the caches since the last commit
+
+    The DB processor undoes them if the transaction is rolled back, so that
+    nothing is cached as saved unless it was.
+    """
+    def __init__(self):
+        self.undo = []
+
+    def record(self, func, *args):
+        self.undo.append((func, args))
+
+    def commit(self):
+        self.undo.clear()
+
+    def rollback(self):
+        undo = self.undo
+        while undo:
+            func, args = undo.pop()
+            func(*args)
+
+
 class SightingCache:
     """Simple cache for storing actual sightings
 
     It's used in order not to make as many queries to the database.
-    It schedules sightings to be removed as soon as they expire.
+    Sightings are removed as soon as they expire.
     """
     def __init__(self):
-        self.store = {}
+        self.store = ExpiringMap(maxsize=conf.CACHE_LIMIT)
+        self.class_version = 1
 
     def __len__(self):
         return len(self.store)
 
     def add(self, sighting):
-        self.store[sighting['spawn_id']] = sighting['expire_timestamp']
-        call_at(sighting['expire_timestamp'], self.remove, sighting['spawn_id'])
+        spawn_id = sighting['spawn_id']
+        JOURNAL.record(self.restore, spawn_id, self.store.get(spawn_id))
+        self.store.set(spawn_id, sighting['expire_timestamp'],
+                       sighting['expire_timestamp'])
+
+    def restore(self, spawn_id, expire_timestamp):
+        if expire_timestamp is None:
+            self.store.discard(spawn_id)
+        else:
+            self.store.set(spawn_id, expire_timestamp, expire_timestamp)
 
     def remove(self, spawn_id):
+        self.store.discard(spawn_id)
+
+    def pickle(self):
+        # lured sightings share a placeholder spawn ID and aren't saved
+        spawn_ids, expirations = tuple(zip(*(
+            x for x in self.store.items() if not is_lured(x[0])))) or ((), ())
+        dump_snapshot('sightings', {
+            'class_version': self.class_version,
+            'db_hash': spawns.db_hash.hex()
+        }, {
+            'spawn_ids': pack_ids(spawn_ids),
+            'expirations': array('q', expirations)
+        })
+
+    def unpickle(self):
         try:
-            del self.store[spawn_id]
-        except KeyError:
+            snapshot = load_snapshot('sightings')
+            if not all((snapshot.meta['class_version'] == self.class_version,
+                        snapshot.meta['db_hash'] == spawns.db_hash.hex())):
+                return
+            now = time()
+            for spawn_id, expiration in zip(unpack_ids(snapshot['spawn_ids']),
+                                            snapshot['expirations']):
+                if expiration > now:
+                    self.store.set(spawn_id, expiration, expiration)
+        except (FileNotFoundError, SnapshotError, KeyError):
             pass
 
     def __contains__(self, raw_sighting):
-        try:
-            expire_timestamp = self.store[raw_sighting['spawn_id']]
-        except KeyError:
+        expire_timestamp = self.store.get(raw_sighting['spawn_id'])
+        if expire_timestamp is None:
             return False
         return (
             expire_timestamp > raw_sighting['expire_timestamp'] - 2 and
@@ -112,33 +202,57 @@ class MysteryCache:
     """Simple cache for storing Pokemon with unknown expiration times
 
     It's used in order not to make as many queries to the database.
-    It schedules sightings to be removed an hour after being seen.
+    Sightings are removed an hour after being first seen, and their last
+    seen time is saved if it changed.
     """
     def __init__(self):
-        self.store = {}
+        self.store = ExpiringMap(maxsize=conf.CACHE_LIMIT,
+                                 on_expire=self.expire)
+        self.class_version = 1
 
     def __len__(self):
         return len(self.store)
 
     def add(self, sighting):
-        key = combine_key(sighting)
-        self.store[combine_key(sighting)] = [sighting['seen']] * 2
-        call_at(sighting['seen'] + 3510, self.remove, key)
+        self.set(combine_key(sighting), sighting['seen'], sighting['seen'])
+
+    def set(self, key, first, last):
+        previous = self.store.get(key)
+        JOURNAL.record(self.restore, key, previous and tuple(previous))
+        self._set(key, first, last)
+
+    def _set(self, key, first, last):
+        self.store.set(key, [first, last], first + 3510)
+
+    def restore(self, key, times):
+        if times is None:
+            self.store.discard(key)
+        else:
+            self._set(key, *times)
 
     def __contains__(self, raw_sighting):
-        key = combine_key(raw_sighting)
-        try:
-            first, last = self.store[key]
-        except (KeyError, TypeError):
+        # seeing a cached sighting again extends its last seen time
+        return self.update_last_seen(raw_sighting)
+
+    def update_last_seen(self, raw_sighting):
+        """Extend the last seen time of a cached sighting, return whether
+        it was cached.
+        """
+        times = self.store.get(combine_key(raw_sighting))
+        if times is None:
             return False
         new_time = raw_sighting['seen']
-        if new_time > last:
-            self.store[key][1] = new_time
+        if new_time > times[1]:
+            times[1] = new_time
         return True
 
     def remove(self, key):
-        first, last = self.store[key]
-        del self.store[key]
+        times = self.store.pop(key)
+        if times:
+            self.expire(key, times)
+
+    def expire(self, key, times):
+        first, last = times
         if last != first:
             encounter_id, spawn_id = key
             db_proc.add({
@@ -149,8 +263,46 @@ class MysteryCache:
                 'last': last
             })
 
-    def items(self):
-        return self.store.items()
+    def items(self, include_expired=False):
+        return self.store.items(include_expired)
+
+    def pickle(self):
+        # expired sightings are included so their last seen time is saved
+        keys, times = tuple(zip(*(
+            x for x in self.store.items(include_expired=True)
+            if not is_lured(x[0][1])))) or ((), ())
+        encounter_ids, spawn_ids = tuple(zip(*keys)) or ((), ())
+        firsts, lasts = tuple(zip(*times)) or ((), ())
+        dump_snapshot('mysteries', {
+            'class_version': self.class_version,
+            'db_hash': spawns.db_hash.hex()
+        }, {
+            'encounter_ids': pack_ids(encounter_ids),
+            'spawn_ids': pack_ids(spawn_ids),
+            'firsts': array('q', firsts),
+            'lasts': array('q', lasts)
+        })
+
+    def unpickle(self):
+        """Restore unexpired sightings, and save the last seen time of any
+        that expired while stopped.
+        """
+        try:
+            snapshot = load_snapshot('mysteries')
+            if not all((snapshot.meta['class_version'] == self.class_version,
+                        snapshot.meta['db_hash'] == spawns.db_hash.hex())):
+                return
+            now = time()
+            for encounter_id, spawn_id, first, last in zip(
+                    map(int, snapshot['encounter_ids']),
+                    unpack_ids(snapshot['spawn_ids']),
+                    snapshot['firsts'], snapshot['lasts']):
+                if first + 3510 > now:
+                    self._set((encounter_id, spawn_id), first, last)
+                else:
+                    self.expire((encounter_id, spawn_id), (first, last))
+        except (FileNotFoundError, SnapshotError, KeyError):
+            pass
 
 
 class FortCache:
@@ -165,7 +317,20 @@ class FortCache:
         return len(self.gyms)
 
     def add(self, sighting):
-        self.gyms[sighting['external_id']] = sighting['last_modified']
+        external_id = sighting['external_id']
+        JOURNAL.record(self.restore, external_id, self.gyms.get(external_id))
+        self.gyms[external_id] = sighting['last_modified']
+
+    def restore(self, external_id, last_modified):
+        if last_modified is None:
+            self.gyms.pop(external_id, None)
+        else:
+            self.gyms[external_id] = last_modified
+
+    def add_pokestops(self, pokestop_ids):
+        new = [x for x in pokestop_ids if x not in self.pokestops]
+        JOURNAL.record(self.pokestops.difference_update, new)
+        self.pokestops.update(new)
 
     def __contains__(self, sighting):
         try:
@@ -190,9 +355,130 @@ class FortCache:
             pass
 
 
+class SpawnpointState:
+    """Mutable copy of a row in the spawnpoints table"""
+    __slots__ = ('id', 'despawn_time', 'duration', 'failures', 'updated')
+
+    def __init__(self, id, despawn_time, duration, failures, updated):
+        self.id = id
+        self.despawn_time = despawn_time
+        self.duration = duration
+        self.failures = failures
+        self.updated = updated
+
+
+class SpawnpointCache:
+    """Write-back cache of spawnpoint rows, keyed by spawn_id
+
+    Reads are served from memory, falling back to a query for spawnpoints
+    that haven't been loaded yet. Modified rows are written in bulk by
+    flush() before the DB processor commits.
+    """
+    def __init__(self):
+        self.store = {}
+        self.dirty = set()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, spawn_id):
+        return spawn_id in self.store
+
+    def add(self, spawnpoint):
+        """Cache a row unless a newer copy is already cached."""
+        if spawnpoint.spawn_id not in self.store:
+            self.store[spawnpoint.spawn_id] = SpawnpointState(
+                spawnpoint.id, spawnpoint.despawn_time, spawnpoint.duration,
+                spawnpoint.failures, spawnpoint.updated)
+
+    def get(self, session, spawn_id):
+        try:
+            return self.store[spawn_id]
+        except KeyError:
+            pass
+        spawnpoint = session.query(Spawnpoint) \
+            .filter(Spawnpoint.spawn_id == spawn_id) \
+            .first()
+        if spawnpoint is None:
+            return None
+        self.add(spawnpoint)
+        return self.store[spawn_id]
+
+    def preload(self, session, spawn_ids):
+        """Cache the spawnpoints that aren't cached yet with one query per
+        500 spawn_ids, instead of one query each.
+        """
+        missing = [spawn_id for spawn_id in spawn_ids if spawn_id not in self.store]
+        for i in range(0, len(missing), 500):
+            query = session.query(Spawnpoint.id, Spawnpoint.spawn_id,
+                                  Spawnpoint.despawn_time, Spawnpoint.duration,
+                                  Spawnpoint.failures, Spawnpoint.updated) \
+                .filter(Spawnpoint.spawn_id.in_(missing[i:i + 500]))
+            for spawnpoint in query:
+                self.add(spawnpoint)
+
+    def set(self, spawn_id, **kwargs):
+        JOURNAL.record(self.forget, spawn_id)
+        state = SpawnpointState(**kwargs)
+        self.store[spawn_id] = state
+        return state
+
+    def changed(self, spawn_id):
+        JOURNAL.record(self.forget, spawn_id)
+        self.dirty.add(spawn_id)
+
+    def forget(self, spawn_id):
+        """Drop a spawnpoint whose changes were rolled back, so that it's
+        read from the database again.
+        """
+        self.store.pop(spawn_id, None)
+        self.dirty.discard(spawn_id)
+
+    def load(self):
+        """Cache every spawnpoint within the boundaries."""
+        with session_scope() as session:
+            query = session.query(Spawnpoint.id, Spawnpoint.spawn_id,
+                                  Spawnpoint.despawn_time, Spawnpoint.duration,
+                                  Spawnpoint.failures, Spawnpoint.updated)
+            if bounds or conf.STAY_WITHIN_MAP:
+                query = query.filter(Spawnpoint.lat >= bounds.south,
+                                     Spawnpoint.lat <= bounds.north,
+                                     Spawnpoint.lon >= bounds.west,
+                                     Spawnpoint.lon <= bounds.east)
+            for spawnpoint in query:
+                self.add(spawnpoint)
+
+    def flush(self, session):
+        """Write modified spawnpoints with a single executemany UPDATE."""
+        if not self.dirty:
+            return 0
+        dirty, self.dirty = self.dirty, set()
+        store = self.store
+        rows = [{
+            '_spawn_id': spawn_id,
+            'despawn_time': store[spawn_id].despawn_time,
+            'duration': store[spawn_id].duration,
+            'failures': store[spawn_id].failures,
+            'updated': store[spawn_id].updated
+        } for spawn_id in dirty]
+        # rows added through the ORM must exist before they're updated
+        session.flush()
+        table = Spawnpoint.__table__
+        session.execute(table.update()
+                        .where(table.c.spawn_id == bindparam('_spawn_id'))
+                        .values(despawn_time=bindparam('despawn_time'),
+                                duration=bindparam('duration'),
+                                failures=bindparam('failures'),
+                                updated=bindparam('updated')),
+                        rows)
+        return len(rows)
+
+
+JOURNAL = Journal()
 SIGHTING_CACHE = SightingCache()
 MYSTERY_CACHE = MysteryCache()
 FORT_CACHE = FortCache()
+SPAWNPOINT_CACHE = SpawnpointCache()
 
 Base = declarative_base()
 
@@ -331,153 +617,307 @@ def session_scope(autoflush=False):
         session.close()
 
 
+def sighting_row(pokemon):
+    return {
+        'pokemon_id': pokemon['pokemon_id'],
+        'spawn_id': pokemon['spawn_id'],
+        'encounter_id': pokemon['encounter_id'],
+        'expire_timestamp': pokemon['expire_timestamp'],
+        'lat': pokemon['lat'],
+        'lon': pokemon['lon'],
+        'atk_iv': pokemon.get('individual_attack'),
+        'def_iv': pokemon.get('individual_defense'),
+        'sta_iv': pokemon.get('individual_stamina'),
+        'move_1': pokemon.get('move_1'),
+        'move_2': pokemon.get('move_2')
+    }
+
+
+def mystery_row(pokemon):
+    seconds = pokemon['seen'] % 3600
+    return {
+        'pokemon_id': pokemon['pokemon_id'],
+        'spawn_id': pokemon['spawn_id'],
+        'encounter_id': pokemon['encounter_id'],
+        'lat': pokemon['lat'],
+        'lon': pokemon['lon'],
+        'first_seen': pokemon['seen'],
+        'first_seconds': seconds,
+        'last_seconds': seconds,
+        'seen_range': 0,
+        'atk_iv': pokemon.get('individual_attack'),
+        'def_iv': pokemon.get('individual_defense'),
+        'sta_iv': pokemon.get('individual_stamina'),
+        'move_1': pokemon.get('move_1'),
+        'move_2': pokemon.get('move_2')
+    }
+
+
+def insert_ignore(table):
+    """Return an INSERT for table that skips rows violating a unique
+    constraint, or None if the dialect has no native way to do so.
+    """
+    if DB_TYPE == 'postgresql':
+        return pg_insert(table).on_conflict_do_nothing()
+    elif DB_TYPE == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    elif DB_TYPE == 'sqlite':
+        return table.insert().prefix_with('OR IGNORE')
+
+
+def upsert_mystery():
+    """Return an INSERT for mystery sightings that updates the last seen time
+    of an existing (encounter_id, spawn_id) row, or None if unsupported.
+    """
+    table = Mystery.__table__
+    first_seen = table.c.first_seen
+    if DB_TYPE == 'postgresql':
+        stmt = pg_insert(table)
+        seen = stmt.excluded.first_seen
+        return stmt.on_conflict_do_update(
+            constraint='unique_encounter',
+            set_=dict(last_seconds=seen - (first_seen - first_seen % 3600),
+                      seen_range=seen - first_seen))
+    elif DB_TYPE == 'mysql' and mysql_insert:
+        stmt = mysql_insert(table)
+        # stmt.inserted is rendered as VALUES() of the assigned column
+        seen = literal_column('VALUES(first_seen)', Integer)
+        return stmt.on_duplicate_key_update(
+            last_seconds=seen - (first_seen - first_seen % 3600),
+            seen_range=seen - first_seen)
+    elif DB_TYPE == 'sqlite' and sqlite_insert:
+        # imported here since only SQLite deployments need _sqlite3
+        from sqlite3 import sqlite_version_info
+        if sqlite_version_info < (3, 24):
+            return None
+        stmt = sqlite_insert(table)
+        seen = stmt.excluded.first_seen
+        return stmt.on_conflict_do_update(
+            index_elements=('encounter_id', 'spawn_id'),
+            set_=dict(last_seconds=seen - (first_seen - first_seen % 3600),
+                      seen_range=seen - first_seen))
+
+
+def bulk_insert(session, stmt, rows):
+    """Insert rows using as few multi-row INSERT statements as possible,
+    returns the number of affected rows.
+    """
+    if not rows:
+        return 0
+    if _engine.dialect.supports_sane_multi_rowcount:
+        # an executemany is compiled once and looped over by the driver,
+        # while a multi-row VALUES takes longer to compile than to run
+        return session.execute(stmt, rows).rowcount
+    if DB_TYPE == 'sqlite':
+        # stay below SQLITE_MAX_VARIABLE_NUMBER, which defaults to 999
+        size = 999 // len(rows[0])
+    else:
+        size = max(conf.DB_BATCH_SIZE, 1)
+    count = 0
+    for i in range(0, len(rows), size):
+        count += session.execute(stmt.values(rows[i:i + size])).rowcount
+    return count
+
+
 def add_sighting(session, pokemon):
+    """Save a sighting, returns the number of rows inserted"""
     # Check if there isn't the same entry already
     if pokemon in SIGHTING_CACHE:
-        return
-    if session.query(exists().where(and_(
+        return 0
+    stmt = insert_ignore(Sighting.__table__)
+    if stmt is not None:
+        count = session.execute(stmt.values(sighting_row(pokemon))).rowcount
+    elif session.query(exists().where(and_(
                 Sighting.expire_timestamp == pokemon['expire_timestamp'],
                 Sighting.encounter_id == pokemon['encounter_id']))
             ).scalar():
         SIGHTING_CACHE.add(pokemon)
-        return
-    obj = Sighting(
-        pokemon_id=pokemon['pokemon_id'],
-        spawn_id=pokemon['spawn_id'],
-        encounter_id=pokemon['encounter_id'],
-        expire_timestamp=pokemon['expire_timestamp'],
-        lat=pokemon['lat'],
-        lon=pokemon['lon'],
-        atk_iv=pokemon.get('individual_attack'),
-        def_iv=pokemon.get('individual_defense'),
-        sta_iv=pokemon.get('individual_stamina'),
-        move_1=pokemon.get('move_1'),
-        move_2=pokemon.get('move_2')
-    )
-    session.add(obj)
+        return 0
+    else:
+        session.add(Sighting(**sighting_row(pokemon)))
+        count = 1
     SIGHTING_CACHE.add(pokemon)
+    return count
 
 
-def add_spawnpoint(session, pokemon):
+def restore_despawn_time(spawn_id, despawn_time):
+    if despawn_time is None:
+        spawns.despawn_times.pop(spawn_id)
+    else:
+        spawns.despawn_times[spawn_id] = despawn_time
+
+
+def add_spawnpoint(session, pokemon, ranges=None, new_rows=None):
+    """Save the spawnpoint of a sighting, returns the number of rows inserted
+
+    ranges maps spawn_ids to their widest range, if the spawnpoints were
+    preloaded and their ranges queried in bulk. New rows are appended to new_rows
+    instead of being inserted, if given.
+    """
     # Check if the same entry already exists
     spawn_id = pokemon['spawn_id']
     new_time = pokemon['expire_timestamp'] % 3600
     try:
         if new_time == spawns.despawn_times[spawn_id]:
-            return
+            return 0
     except KeyError:
         pass
-    existing = session.query(Spawnpoint) \
-        .filter(Spawnpoint.spawn_id == spawn_id) \
-        .first()
+    if ranges is None:
+        existing = SPAWNPOINT_CACHE.get(session, spawn_id)
+    else:
+        # preloaded, so a spawnpoint that isn't cached doesn't exist
+        existing = SPAWNPOINT_CACHE.store.get(spawn_id)
     now = round(time())
     point = pokemon['lat'], pokemon['lon']
+    JOURNAL.record(restore_despawn_time, spawn_id, spawns.despawn_times.get(spawn_id))
     spawns.add_known(spawn_id, new_time, point)
     if existing:
         existing.updated = now
         existing.failures = 0
+        SPAWNPOINT_CACHE.changed(spawn_id)
 
         if (existing.despawn_time is None or
                 existing.updated < conf.LAST_MIGRATION):
-            widest = get_widest_range(session, spawn_id)
+            if ranges is None:
+                widest = get_widest_range(session, spawn_id)
+            else:
+                widest = ranges.get(spawn_id)
             if widest and widest > 1800:
                 existing.duration = 60
         elif new_time == existing.despawn_time:
-            return
+            return 0
 
         existing.despawn_time = new_time
+        return 0
     else:
-        widest = get_widest_range(session, spawn_id)
+        if ranges is None:
+            widest = get_widest_range(session, spawn_id)
+        else:
+            widest = ranges.get(spawn_id)
 
         duration = 60 if widest and widest > 1800 else None
 
-        session.add(Spawnpoint(
-            spawn_id=spawn_id,
-            despawn_time=new_time,
-            lat=pokemon['lat'],
-            lon=pokemon['lon'],
-            updated=now,
-            duration=duration,
-            failures=0
-        ))
+        row = {
+            'spawn_id': spawn_id,
+            'despawn_time': new_time,
+            'lat': pokemon['lat'],
+            'lon': pokemon['lon'],
+            'updated': now,
+            'duration': duration,
+            'failures': 0
+        }
+        count = 1
+        if new_rows is not None:
+            new_rows.append(row)
+        else:
+            stmt = insert_ignore(Spawnpoint.__table__)
+            if stmt is not None:
+                count = session.execute(stmt.values(row)).rowcount
+            else:
+                session.add(Spawnpoint(**row))
+        SPAWNPOINT_CACHE.set(spawn_id, id=None, despawn_time=new_time,
+                             duration=duration, failures=0, updated=now)
+        return count
 
 
 def add_mystery_spawnpoint(session, pokemon):
     # Check if the same entry already exists
     spawn_id = pokemon['spawn_id']
     point = pokemon['lat'], pokemon['lon']
-    if point in spawns.unknown or session.query(exists().where(
-            Spawnpoint.spawn_id == spawn_id)).scalar():
+    if point in spawns.unknown:
         return
 
-    session.add(Spawnpoint(
-        spawn_id=spawn_id,
-        despawn_time=None,
-        lat=pokemon['lat'],
-        lon=pokemon['lon'],
-        updated=0,
-        duration=None,
-        failures=0
-    ))
+    row = {
+        'spawn_id': spawn_id,
+        'despawn_time': None,
+        'lat': pokemon['lat'],
+        'lon': pokemon['lon'],
+        'updated': 0,
+        'duration': None,
+        'failures': 0
+    }
+    if spawn_id in SPAWNPOINT_CACHE:
+        return
+    stmt = insert_ignore(Spawnpoint.__table__)
+    if stmt is not None:
+        if not session.execute(stmt.values(row)).rowcount:
+            return
+    elif session.query(exists().where(
+            Spawnpoint.spawn_id == spawn_id)).scalar():
+        return
+    else:
+        session.add(Spawnpoint(**row))
+    SPAWNPOINT_CACHE.set(spawn_id, id=None, despawn_time=None, duration=None,
+                         failures=0, updated=0)
 
     if point in bounds:
         spawns.add_unknown(point)
 
 
 def add_mystery(session, pokemon):
+    """Save a mystery sighting, returns the number of rows affected"""
     if pokemon in MYSTERY_CACHE:
-        return
+        return 0
     add_mystery_spawnpoint(session, pokemon)
+    stmt = upsert_mystery()
+    if stmt is not None:
+        session.execute(stmt.values(mystery_row(pokemon)))
+        MYSTERY_CACHE.add(pokemon)
+        return 1
     existing = session.query(Mystery) \
         .filter(Mystery.encounter_id == pokemon['encounter_id']) \
         .filter(Mystery.spawn_id == pokemon['spawn_id']) \
         .first()
     if existing:
-        key = combine_key(pokemon)
-        MYSTERY_CACHE.store[key] = [existing.first_seen, pokemon['seen']]
-        return
-    seconds = pokemon['seen'] % 3600
-    obj = Mystery(
-        pokemon_id=pokemon['pokemon_id'],
-        spawn_id=pokemon['spawn_id'],
-        encounter_id=pokemon['encounter_id'],
-        lat=pokemon['lat'],
-        lon=pokemon['lon'],
-        first_seen=pokemon['seen'],
-        first_seconds=seconds,
-        last_seconds=seconds,
-        seen_range=0,
-        atk_iv=pokemon.get('individual_attack'),
-        def_iv=pokemon.get('individual_defense'),
-        sta_iv=pokemon.get('individual_stamina'),
-        move_1=pokemon.get('move_1'),
-        move_2=pokemon.get('move_2')
-    )
-    session.add(obj)
+        MYSTERY_CACHE.set(combine_key(pokemon), existing.first_seen, pokemon['seen'])
+        return 0
+    session.add(Mystery(**mystery_row(pokemon)))
     MYSTERY_CACHE.add(pokemon)
+    return 1
+
+
+def fort_sighting_row(raw_fort, fort_id):
+    return {
+        'fort_id': fort_id,
+        'team': raw_fort['team'],
+        'prestige': raw_fort['prestige'],
+        'guard_pokemon_id': raw_fort['guard_pokemon_id'],
+        'last_modified': raw_fort['last_modified']
+    }
 
 
 def add_fort_sighting(session, raw_fort):
+    """Save a fort sighting, returns the number of rows inserted"""
     if raw_fort in FORT_CACHE:
-        return
+        return 0
+    stmt = insert_ignore(FortSighting.__table__)
     # Check if fort exists
     fort = session.query(Fort) \
         .filter(Fort.external_id == raw_fort['external_id']) \
         .first()
+    count = 0
     if not fort:
+        count = 1
         fort = Fort(
             external_id=raw_fort['external_id'],
             lat=raw_fort['lat'],
             lon=raw_fort['lon'],
         )
         session.add(fort)
+        if stmt is not None:
+            # the sighting is inserted outside of the ORM, so it needs the id
+            session.flush()
+    if stmt is not None:
+        count += session.execute(stmt.values(fort_sighting_row(raw_fort, fort.id))).rowcount
+        FORT_CACHE.add(raw_fort)
+        return count
     if fort.id and session.query(exists().where(and_(
                 FortSighting.fort_id == fort.id,
                 FortSighting.last_modified == raw_fort['last_modified']
             ))).scalar():
         # Why is it not in the cache? It should be there!
         FORT_CACHE.add(raw_fort)
-        return
+        return count
     obj = FortSighting(
         fort=fort,
         team=raw_fort['team'],
@@ -487,43 +927,213 @@ def add_fort_sighting(session, raw_fort):
     )
     session.add(obj)
     FORT_CACHE.add(raw_fort)
+    return count + 1
 
 
 def add_pokestop(session, raw_pokestop):
+    """Save a pokestop, returns the number of rows inserted"""
     pokestop_id = raw_pokestop['external_id']
     if pokestop_id in FORT_CACHE.pokestops:
-        return
-    if session.query(exists().where(
+        return 0
+    row = {
+        'external_id': pokestop_id,
+        'lat': raw_pokestop['lat'],
+        'lon': raw_pokestop['lon']
+    }
+    stmt = insert_ignore(Pokestop.__table__)
+    if stmt is not None:
+        count = session.execute(stmt.values(row)).rowcount
+    elif session.query(exists().where(
             Pokestop.external_id == pokestop_id)).scalar():
-        FORT_CACHE.pokestops.add(pokestop_id)
-        return
+        FORT_CACHE.add_pokestops((pokestop_id,))
+        return 0
+    else:
+        session.add(Pokestop(**row))
+        count = 1
+    FORT_CACHE.add_pokestops((pokestop_id,))
+    return count
+
+
+def add_sightings(session, sightings):
+    """Save a batch of sightings, returns the number of rows inserted"""
+    new = {}
+    for pokemon in sightings:
+        if pokemon not in SIGHTING_CACHE:
+            new[pokemon['encounter_id'], pokemon['expire_timestamp']] = pokemon
+    if not new:
+        return 0
+    stmt = insert_ignore(Sighting.__table__)
+    if stmt is None:
+        stmt = Sighting.__table__.insert()
+        existing = session.query(Sighting.encounter_id, Sighting.expire_timestamp) \
+            .filter(Sighting.encounter_id.in_({key[0] for key in new}))
+        for key in existing:
+            pokemon = new.pop(tuple(key), None)
+            if pokemon:
+                SIGHTING_CACHE.add(pokemon)
+    count = bulk_insert(session, stmt,
+                        [sighting_row(pokemon) for pokemon in new.values()])
+    for pokemon in new.values():
+        SIGHTING_CACHE.add(pokemon)
+    return count
 
-    pokestop = Pokestop(
-        external_id=pokestop_id,
-        lat=raw_pokestop['lat'],
-        lon=raw_pokestop['lon']
-    )
-    session.add(pokestop)
-    FORT_CACHE.pokestops.add(pokestop_id)
+
+def add_spawnpoints(session, sightings):
+    """Save the spawnpoints of a batch of sightings, returns the number of
+    rows inserted
+
+    The spawnpoints and widest ranges that are needed are queried for the
+    whole batch at once, and new spawnpoints are inserted together.
+    """
+    changed = {}
+    despawn_times = spawns.despawn_times
+    for pokemon in sightings:
+        if pokemon['inferred']:
+            continue
+        spawn_id = pokemon['spawn_id']
+        if despawn_times.get(spawn_id) != pokemon['expire_timestamp'] % 3600:
+            changed[spawn_id] = pokemon
+    if not changed:
+        return 0
+    SPAWNPOINT_CACHE.preload(session, changed)
+    store = SPAWNPOINT_CACHE.store
+    migrated = time() >= conf.LAST_MIGRATION
+    ranges = get_widest_ranges(session, [
+        spawn_id for spawn_id in changed
+        if spawn_id not in store or store[spawn_id].despawn_time is None
+        or not migrated])
+    rows = []
+    for pokemon in changed.values():
+        add_spawnpoint(session, pokemon, ranges, rows)
+    stmt = insert_ignore(Spawnpoint.__table__)
+    if stmt is None:
+        # preload() showed that none of these exist yet
+        stmt = Spawnpoint.__table__.insert()
+    return bulk_insert(session, stmt, rows)
+
+
+def add_mysteries(session, mysteries):
+    """Save a batch of mystery sightings, returns the number of rows affected"""
+    new = {}
+    repeated = []
+    for pokemon in mysteries:
+        if pokemon in MYSTERY_CACHE:
+            continue
+        key = combine_key(pokemon)
+        if key in new:
+            repeated.append(pokemon)
+            continue
+        add_mystery_spawnpoint(session, pokemon)
+        new[key] = pokemon
+    if not new:
+        return 0
+    stmt = upsert_mystery()
+    if stmt is None:
+        stmt = Mystery.__table__.insert()
+        existing = session.query(Mystery.encounter_id, Mystery.spawn_id, Mystery.first_seen) \
+            .filter(Mystery.encounter_id.in_({key[0] for key in new}))
+        for encounter_id, spawn_id, first_seen in existing:
+            pokemon = new.pop((encounter_id, spawn_id), None)
+            if pokemon:
+                MYSTERY_CACHE.set((encounter_id, spawn_id), first_seen, pokemon['seen'])
+    bulk_insert(session, stmt,
+                [mystery_row(pokemon) for pokemon in new.values()])
+    for pokemon in new.values():
+        MYSTERY_CACHE.add(pokemon)
+    # update the last seen time of Pokemon that were seen twice in this batch
+    for pokemon in repeated:
+        MYSTERY_CACHE.update_last_seen(pokemon)
+    return len(new)
+
+
+def add_fort_sightings(session, raw_forts):
+    """Save a batch of fort sightings, returns the number of rows inserted"""
+    new = {}
+    for raw_fort in raw_forts:
+        if raw_fort not in FORT_CACHE:
+            new[raw_fort['external_id'], raw_fort['last_modified']] = raw_fort
+    if not new:
+        return 0
+    external_ids = {key[0] for key in new}
+    fort_ids = dict(session.query(Fort.external_id, Fort.id)
+                    .filter(Fort.external_id.in_(external_ids)))
+    missing = {}
+    for raw_fort in new.values():
+        if raw_fort['external_id'] not in fort_ids:
+            missing[raw_fort['external_id']] = {
+                'external_id': raw_fort['external_id'],
+                'lat': raw_fort['lat'],
+                'lon': raw_fort['lon']
+            }
+    if missing:
+        bulk_insert(session, Fort.__table__.insert(), list(missing.values()))
+        fort_ids.update(session.query(Fort.external_id, Fort.id)
+                        .filter(Fort.external_id.in_(missing)))
+    stmt = insert_ignore(FortSighting.__table__)
+    if stmt is None:
+        stmt = FortSighting.__table__.insert()
+        existing = session.query(FortSighting.fort_id, FortSighting.last_modified) \
+            .filter(FortSighting.fort_id.in_(fort_ids.values()),
+                    FortSighting.last_modified.in_({key[1] for key in new}))
+        existing = set(tuple(x) for x in existing)
+    else:
+        existing = ()
+    rows = []
+    for raw_fort in new.values():
+        fort_id = fort_ids[raw_fort['external_id']]
+        if (fort_id, raw_fort['last_modified']) not in existing:
+            rows.append(fort_sighting_row(raw_fort, fort_id))
+        FORT_CACHE.add(raw_fort)
+    return bulk_insert(session, stmt, rows) + len(missing)
+
+
+def add_pokestops(session, raw_pokestops):
+    """Save a batch of pokestops, returns the number of rows inserted"""
+    new = {}
+    for raw_pokestop in raw_pokestops:
+        pokestop_id = raw_pokestop['external_id']
+        if pokestop_id not in FORT_CACHE.pokestops:
+            new[pokestop_id] = raw_pokestop
+    if not new:
+        return 0
+    stmt = insert_ignore(Pokestop.__table__)
+    if stmt is None:
+        stmt = Pokestop.__table__.insert()
+        existing = session.query(Pokestop.external_id) \
+            .filter(Pokestop.external_id.in_(new))
+        for pokestop_id, in existing:
+            del new[pokestop_id]
+            FORT_CACHE.add_pokestops((pokestop_id,))
+    count = bulk_insert(session, stmt, [{
+        'external_id': raw_pokestop['external_id'],
+        'lat': raw_pokestop['lat'],
+        'lon': raw_pokestop['lon']
+    } for raw_pokestop in new.values()])
+    FORT_CACHE.add_pokestops(new)
+    return count
 
 
 def update_failures(session, spawn_id, success, allowed=conf.FAILURES_ALLOWED):
-    spawnpoint = session.query(Spawnpoint) \
-        .filter(Spawnpoint.spawn_id == spawn_id) \
-        .first()
-    try:
-        if success:
+    spawnpoint = SPAWNPOINT_CACHE.get(session, spawn_id)
+    if spawnpoint is None:
+        return
+    if success:
+        if spawnpoint.failures:
             spawnpoint.failures = 0
-        elif spawnpoint.failures >= allowed:
+            SPAWNPOINT_CACHE.changed(spawn_id)
+        return
+    SPAWNPOINT_CACHE.changed(spawn_id)
+    try:
+        if spawnpoint.failures >= allowed:
+            spawns.changed.add(spawn_id)
             if spawnpoint.duration == 60:
                 spawnpoint.duration = None
                 log.warning('{} consecutive failures on {}, no longer treating as an hour spawn.', allowed + 1, spawn_id)
             else:
                 spawnpoint.updated = 0
-                try:
-                    del spawns.despawn_times[spawn_id]
-                except KeyError:
-                    pass
+                despawn_time = spawns.despawn_times.pop(spawn_id)
+                if despawn_time is not None:
+                    JOURNAL.record(restore_despawn_time, spawn_id, despawn_time)
                 log.warning('{} consecutive failures on {}, will treat as an unknown from now on.', allowed + 1, spawn_id)
             spawnpoint.failures = 0
         else:
@@ -541,7 +1151,28 @@ def update_mystery(session, mystery):
         return
     hour = encounter.first_seen - (encounter.first_seen % 3600)
     encounter.last_seconds = mystery['last'] - hour
-    encounter.seen_range = mystery['last'] - mystery['first']
+    encounter.seen_range = mystery['last'] - encounter.first_seen
+
+
+def update_encounter(session, pokemon):
+    """Add the IVs and moves from an encounter to a saved sighting."""
+    values = {
+        'atk_iv': pokemon.get('individual_attack'),
+        'def_iv': pokemon.get('individual_defense'),
+        'sta_iv': pokemon.get('individual_stamina'),
+        'move_1': pokemon['move_1'],
+        'move_2': pokemon['move_2']
+    }
+    if pokemon['kind'] == 'mystery':
+        session.query(Mystery) \
+            .filter(Mystery.encounter_id == pokemon['encounter_id']) \
+            .filter(Mystery.spawn_id == pokemon['spawn_id']) \
+            .update(values, synchronize_session=False)
+    else:
+        session.query(Sighting) \
+            .filter(Sighting.encounter_id == pokemon['encounter_id']) \
+            .filter(Sighting.expire_timestamp == pokemon['expire_timestamp']) \
+            .update(values, synchronize_session=False)
 
 
 def get_pokestops(session):
@@ -624,6 +1255,17 @@ def get_widest_range(session, spawn_id):
         .scalar()
 
 
+def get_widest_ranges(session, spawn_ids):
+    """Return a dict of the widest range of each spawn_id that has one"""
+    ranges = {}
+    for i in range(0, len(spawn_ids), 500):
+        ranges.update(session.query(Mystery.spawn_id, func.max(Mystery.seen_range))
+                      .filter(Mystery.spawn_id.in_(spawn_ids[i:i + 500]))
+                      .filter(Mystery.first_seen > conf.LAST_MIGRATION)
+                      .group_by(Mystery.spawn_id))
+    return ranges
+
+
 def estimate_remaining_time(session, spawn_id, seen):
     first, last = get_first_last(session, spawn_id)
 
@@ -1,9 +1,12 @@
 import sys
 
-from queue import Queue
+from collections import defaultdict
+from queue import Queue, Empty
 from threading import Thread
+from time import monotonic
 
-from . import db
+from . import db, sanitized as conf
+from .metrics import METRICS
 from .shared import get_logger, LOOP
 
 class DatabaseProcessor(Thread):
@@ -15,6 +18,17 @@ class DatabaseProcessor(Thread):
         self.running = True
         self.count = 0
         self._commit = False
+        self.batch_size = conf.DB_BATCH_SIZE
+        self.batch_wait = conf.DB_BATCH_WAIT
+        # rows inserted and the insertion rate as of the last commit
+        self.rows = 0
+        self.rate = 0.0
+        self._last_rows = 0
+        self._last_commit = monotonic()
+        # items saved since the last commit, replayed if it fails
+        self.unsaved = []
+        # queue waits of unbatched items, recorded once per commit
+        self.waits = []
 
     def __len__(self):
         return self.queue.qsize()
@@ -22,10 +36,11 @@ class DatabaseProcessor(Thread):
     def stop(self):
         self.update_mysteries()
         self.running = False
-        self.queue.put({'type': False})
+        self.add({'type': False})
 
     def add(self, obj):
-        self.queue.put(obj)
+        # items are queued with the time, to measure how long they wait
+        self.queue.put((monotonic(), obj))
 
     def run(self):
         session = db.Session()
@@ -33,47 +48,161 @@ class DatabaseProcessor(Thread):
 
         while self.running or not self.queue.empty():
             try:
-                item = self.queue.get()
-                item_type = item['type']
-
-                if item_type == 'pokemon':
-                    db.add_sighting(session, item)
-                    self.count += 1
-                    if not item['inferred']:
-                        db.add_spawnpoint(session, item)
-                elif item_type == 'mystery':
-                    db.add_mystery(session, item)
-                    self.count += 1
-                elif item_type == 'fort':
-                    db.add_fort_sighting(session, item)
-                elif item_type == 'pokestop':
-                    db.add_pokestop(session, item)
-                elif item_type == 'target':
-                    db.update_failures(session, item['spawn_id'], item['seen'])
-                elif item_type == 'mystery-update':
-                    db.update_mystery(session, item)
-                elif item_type is False:
-                    break
-                self.log.debug('Item saved to db')
-                if self._commit:
-                    session.commit()
+                if self.batch_size > 1:
+                    items, stop = self.get_batch()
+                    self.unsaved.extend(items)
+                    self.save_batch(session, items)
+                else:
+                    queued, item = self.queue.get()
+                    self.waits.append(monotonic() - queued)
+                    stop = item['type'] is False
+                    if not stop:
+                        self.unsaved.append(item)
+                        self.save_item(session, item)
+                if self._commit or stop:
+                    self.commit_session(session)
                     self._commit = False
+                    if self.waits:
+                        self.waited(self.waits)
+                        self.waits = []
+                if stop:
+                    break
             except Exception as e:
-                session.rollback()
                 self.log.exception('A wild {} appeared in the DB processor!', e.__class__.__name__)
+                self.recover(session)
+        session.close()
+
+    def commit_session(self, session):
+        db.SPAWNPOINT_CACHE.flush(session)
+        session.commit()
+        db.JOURNAL.commit()
+        self.unsaved.clear()
+
+    def recover(self, session):
+        """Roll back, then save the items since the last commit one at a
+        time, so that a bad item doesn't take the others with it.
+        """
+        session.rollback()
+        db.JOURNAL.rollback()
+        items, self.unsaved = self.unsaved, []
+        for item in items:
+            try:
+                self.save_item(session, item)
+                self.commit_session(session)
+            except Exception as e:
+                session.rollback()
+                db.JOURNAL.rollback()
+                self.log.error('Dropped a {} item that failed to save: {!r}', item['type'], e)
+
+    def get_batch(self):
+        """Wait for an item, then collect more until the batch is full or
+        DB_BATCH_WAIT seconds have passed.
+
+        Returns the items and whether the stop signal was received.
+        """
+        queued, item = self.queue.get()
+        if item['type'] is False:
+            return (), True
+        items = [item]
+        start = monotonic()
+        waits = [start - queued]
+        deadline = start + self.batch_wait
+        stop = False
+        while len(items) < self.batch_size:
+            remaining = deadline - monotonic()
+            try:
+                if remaining > 0:
+                    queued, item = self.queue.get(timeout=remaining)
+                else:
+                    queued, item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item['type'] is False:
+                stop = True
+                break
+            items.append(item)
+            waits.append(monotonic() - queued)
+        self.waited(waits)
+        return items, stop
+
+    def waited(self, waits):
+        """Record how long items waited in the queue, in the loop's thread."""
         try:
-            session.commit()
-        except Exception:
+            LOOP.call_soon_threadsafe(METRICS.record_many, 'DB queue', waits)
+        except RuntimeError:
+            # the loop is closed
             pass
-        session.close()
+
+    def save_batch(self, session, items):
+        if not items:
+            return
+        start = monotonic()
+        groups = defaultdict(list)
+        for item in items:
+            groups[item['type']].append(item)
+
+        rows = 0
+        sightings = groups['pokemon']
+        if sightings:
+            rows += db.add_sightings(session, sightings)
+            rows += db.add_spawnpoints(session, sightings)
+            self.count += len(sightings)
+        mysteries = groups['mystery']
+        if mysteries:
+            rows += db.add_mysteries(session, mysteries)
+            self.count += len(mysteries)
+        if groups['fort']:
+            rows += db.add_fort_sightings(session, groups['fort'])
+        if groups['pokestop']:
+            rows += db.add_pokestops(session, groups['pokestop'])
+        for item in groups['target']:
+            db.update_failures(session, item['spawn_id'], item['seen'])
+        for item in groups['mystery-update']:
+            db.update_mystery(session, item)
+        for item in groups['encounter']:
+            db.update_encounter(session, item)
+        self.rows += rows
+        self.log.debug('Saved a batch of {} items, {} new rows in {:.3f}s',
+                       len(items), rows, monotonic() - start)
+
+    def save_item(self, session, item):
+        item_type = item['type']
+
+        rows = 0
+        if item_type == 'pokemon':
+            rows += db.add_sighting(session, item)
+            self.count += 1
+            if not item['inferred']:
+                rows += db.add_spawnpoint(session, item)
+        elif item_type == 'mystery':
+            rows += db.add_mystery(session, item)
+            self.count += 1
+        elif item_type == 'fort':
+            rows += db.add_fort_sighting(session, item)
+        elif item_type == 'pokestop':
+            rows += db.add_pokestop(session, item)
+        elif item_type == 'target':
+            db.update_failures(session, item['spawn_id'], item['seen'])
+        elif item_type == 'mystery-update':
+            db.update_mystery(session, item)
+        elif item_type == 'encounter':
+            db.update_encounter(session, item)
+        self.rows += rows
+        self.log.debug('Item saved to db')
 
     def commit(self):
+        now = monotonic()
+        rows = self.rows
+        self.rate = (rows - self._last_rows) / (now - self._last_commit)
+        self._last_rows = rows
+        self._last_commit = now
         self._commit = True
         if self.running:
             LOOP.call_later(5, self.commit)
 
     def update_mysteries(self):
-       for key, times in db.MYSTERY_CACHE.items():
+       # expired sightings that weren't swept yet still need their last update
+       for key, times in db.MYSTERY_CACHE.items(include_expired=True):
            first, last = times
            if last != first:
                encounter_id, spawn_id = key
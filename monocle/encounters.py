@@ -0,0 +1,125 @@
+from asyncio import CancelledError, PriorityQueue
+from itertools import count
+from time import monotonic, time
+
+from . import db_proc, sanitized as conf
+from .metrics import METRICS
+from .shared import get_logger, LOOP
+
+# priority classes of encounters, the lowest goes first
+NOTIFY = 0
+WANTED = 1
+OTHER = 2
+
+
+class Encounter:
+    __slots__ = ('pokemon', 'spawn_point_id', 'priority', 'notify', 'time_of_day', 'queued')
+
+    def __init__(self, pokemon, spawn_point_id, priority, notify, time_of_day):
+        self.pokemon = pokemon
+        self.spawn_point_id = spawn_point_id
+        self.priority = priority
+        self.notify = notify
+        self.time_of_day = time_of_day
+        self.queued = monotonic()
+
+
+class EncounterQueue:
+    """Encounters waiting for a worker, served apart from the visits
+
+    Workers queue the Pokemon they see instead of encountering them during
+    their visits. A limited number of runners take the encounters in order
+    of priority, those eligible for notification first and then those in
+    ENCOUNTER_IDS, and give each to the best idle worker that can reach it.
+    The sighting is saved right away, and its IVs and moves are added once
+    the encounter is done.
+    """
+    def __init__(self, overseer, limit, notifier=None, give_up=conf.GIVE_UP_UNKNOWN):
+        self.overseer = overseer
+        self.limit = limit
+        self.notifier = notifier
+        self.give_up = give_up
+        self.log = get_logger('encounters')
+        self.queue = PriorityQueue(loop=LOOP)
+        self.sequence = count()
+        # {encounter_id: Encounter} of queued and running encounters
+        self.pending = {}
+        self.runners = []
+        self.done = 0
+        self.failed = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def start(self):
+        self.runners = [LOOP.create_task(self.run()) for _ in range(self.limit)]
+
+    def add(self, pokemon, spawn_point_id, priority, notify=False, time_of_day=None):
+        encounter_id = pokemon['encounter_id']
+        job = self.pending.get(encounter_id)
+        if job is None:
+            # a copy, the sighting may still be waiting to be saved
+            job = Encounter(dict(pokemon), spawn_point_id, priority, notify, time_of_day)
+            self.pending[encounter_id] = job
+        else:
+            if notify and not job.notify:
+                job.notify = True
+                job.time_of_day = time_of_day
+            if job.priority is None or priority >= job.priority:
+                # already being encountered or queued ahead
+                return
+            # queued again ahead of the old entry, which is then skipped
+            job.priority = priority
+        self.queue.put_nowait((priority, next(self.sequence), job))
+
+    async def run(self):
+        while True:
+            priority, _, job = await self.queue.get()
+            encounter_id = job.pokemon['encounter_id']
+            if priority != job.priority or self.pending.get(encounter_id) is not job:
+                continue
+            job.priority = None
+            try:
+                await self.serve(job)
+            except CancelledError:
+                raise
+            except Exception:
+                self.log.exception('An exception occurred while encountering')
+            finally:
+                del self.pending[encounter_id]
+
+    async def serve(self, job):
+        pokemon = job.pokemon
+        now = time()
+        expires = pokemon.get('expire_timestamp') or now + self.give_up
+        if expires - now < 10:
+            self.expired += 1
+        else:
+            point = pokemon['lat'], pokemon['lon']
+            skip_time = monotonic() + min(self.give_up, expires - now - 10)
+            worker = await self.overseer.best_worker(point, skip_time)
+            if not worker:
+                self.expired += 1
+            else:
+                METRICS.record('encounter wait', monotonic() - job.queued)
+                async with worker.busy:
+                    start = monotonic()
+                    encountered = await worker.try_encounter(pokemon, job.spawn_point_id)
+                    METRICS.record('encounter', monotonic() - start)
+                if encountered:
+                    self.done += 1
+                    db_proc.add(dict(pokemon, type='encounter', kind=pokemon['type']))
+                else:
+                    self.failed += 1
+        if job.notify and self.notifier:
+            LOOP.create_task(self.notifier.notify(pokemon, job.time_of_day))
+
+    def close(self):
+        for runner in self.runners:
+            runner.cancel()
+
+    @property
+    def status(self):
+        return 'Encounters pending: {}, done: {}, failed: {}, expired: {}'.format(
+            len(self), self.done, self.failed, self.expired)
@@ -0,0 +1,179 @@
+from heapq import heappush, heappop
+from threading import Lock
+from time import time
+from weakref import WeakSet
+
+from .shared import call_later
+
+_MISSING = object()
+
+# every map, swept together once start_sweeps() is called
+MAPS = WeakSet()
+
+
+def start_sweeps(interval=60):
+    """Sweep every map each interval seconds, called by the scanner."""
+    def sweep():
+        try:
+            for expiring_map in list(MAPS):
+                expiring_map.sweep()
+        finally:
+            call_later(interval, sweep)
+    call_later(interval, sweep)
+
+
+class ExpiringMap:
+    """Thread-safe mapping of keys to values that expire at a unix time
+
+    Keys are grouped into buckets by expiration time, granularity seconds
+    wide. Expired keys are dropped when they're accessed and whole buckets
+    are dropped by a periodic sweep, so no callback is scheduled per key.
+    Buckets stay in the heap until they're swept, even if they're empty.
+
+    If maxsize is set, the keys expiring soonest are evicted to make room.
+    on_expire is called with each key and value that expired or was evicted.
+    """
+    def __init__(self, granularity=30, maxsize=None, on_expire=None):
+        # {key: value}
+        self.store = {}
+        # {key: expiration}
+        self.expires = {}
+        # {bucket: {key}}
+        self.buckets = {}
+        # heap of the bucket numbers in buckets
+        self.heap = []
+        self.granularity = granularity
+        self.maxsize = maxsize
+        self.on_expire = on_expire
+        self.expired = 0
+        self.evicted = 0
+        self.lock = Lock()
+        MAPS.add(self)
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                expires = self.expires[key]
+            except KeyError:
+                return default
+            if expires > time():
+                return self.store[key]
+            value = self._pop(key)
+            self.expired += 1
+        self._notify(((key, value),))
+        return default
+
+    def set(self, key, value, expires):
+        with self.lock:
+            if key in self.expires:
+                self._unbucket(key, self.expires[key])
+            self.store[key] = value
+            self.expires[key] = expires
+            bucket = int(expires // self.granularity)
+            try:
+                self.buckets[bucket].add(key)
+            except KeyError:
+                self.buckets[bucket] = {key}
+                heappush(self.heap, bucket)
+            evicted = self._evict() if self.maxsize else None
+        if evicted:
+            self._notify(evicted)
+
+    def discard(self, key):
+        with self.lock:
+            if key in self.expires:
+                self._pop(key)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key in self.expires:
+                return self._pop(key)
+            return default
+
+    def items(self, include_expired=False):
+        """Return a list of (key, value) pairs.
+
+        Pairs that expired but weren't removed yet are only included if
+        include_expired is set.
+        """
+        with self.lock:
+            if include_expired:
+                return list(self.store.items())
+            now = time()
+            expires = self.expires
+            return [(k, v) for k, v in self.store.items() if expires[k] > now]
+
+    def clear(self):
+        with self.lock:
+            self.store.clear()
+            self.expires.clear()
+            self.buckets.clear()
+            self.heap.clear()
+
+    def sweep(self, now=None):
+        """Remove every key in buckets that have completely expired."""
+        if now is None:
+            now = time()
+        current = int(now // self.granularity)
+        expired = []
+        with self.lock:
+            heap = self.heap
+            while heap and heap[0] < current:
+                bucket = heappop(heap)
+                for key in self.buckets.pop(bucket, ()):
+                    expired.append((key, self.store.pop(key)))
+                    del self.expires[key]
+            self.expired += len(expired)
+        if expired:
+            self._notify(expired)
+        return len(expired)
+
+    def _pop(self, key):
+        self._unbucket(key, self.expires.pop(key))
+        return self.store.pop(key)
+
+    def _unbucket(self, key, expires):
+        # empty buckets are left for the sweep, so they're pushed only once
+        self.buckets[int(expires // self.granularity)].discard(key)
+
+    def _evict(self):
+        excess = len(self.store) - self.maxsize
+        if excess <= 0:
+            return None
+        evicted = []
+        heap = self.heap
+        while excess > 0 and heap:
+            bucket = heap[0]
+            keys = self.buckets[bucket]
+            if not keys:
+                heappop(heap)
+                del self.buckets[bucket]
+                continue
+            while excess > 0 and keys:
+                key = keys.pop()
+                del self.expires[key]
+                evicted.append((key, self.store.pop(key)))
+                excess -= 1
+            if not keys:
+                del self.buckets[bucket]
+                heappop(heap)
+        self.evicted += len(evicted)
+        return evicted
+
+    def _notify(self, entries):
+        if self.on_expire:
+            for key, value in entries:
+                self.on_expire(key, value)
+
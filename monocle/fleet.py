@@ -0,0 +1,409 @@
+from array import array
+from asyncio import Future, Lock
+from heapq import heapify, heappop, heappush
+from itertools import count
+from math import ceil, radians
+from time import monotonic, time
+
+from pogeo import get_distance
+
+from .spatial import GridMap
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# mean radius of the Earth for each of utils.Units
+RADII = {1: 3958.7613, 2: 6371.0088, 3: 6371008.8}
+METERS_PER_UNIT = {1: 1609.344, 2: 1000.0, 3: 1.0}
+
+
+def distances(lats, lons, point, unit):
+    """Return the distance from each of the points in lats and lons to point,
+    as an array if NumPy is installed.
+    """
+    if np is None:
+        return [get_distance((lat, lon), point, unit)
+                for lat, lon in zip(lats, lons)]
+    lat, lon = radians(point[0]), radians(point[1])
+    lats = np.radians(lats)
+    a = (np.sin((lats - lat) * 0.5) ** 2 + np.cos(lats) * np.cos(lat) *
+         np.sin((np.radians(lons) - lon) * 0.5) ** 2)
+    return (2 * RADII[unit]) * np.arcsin(np.sqrt(a))
+
+
+class BusyLock(Lock):
+    """Lock that marks its worker as busy in the fleet while held"""
+    def __init__(self, fleet, index, **kwargs):
+        super().__init__(**kwargs)
+        self.fleet = fleet
+        self.index = index
+
+    async def acquire(self):
+        await super().acquire()
+        self.fleet.set_busy(self.index, True)
+        return True
+
+    def release(self):
+        self.fleet.set_busy(self.index, False)
+        super().release()
+
+
+class Fleet:
+    """Positions, last request times and busy flags of every worker, kept in
+    contiguous arrays so travel speeds can be computed all at once.
+
+    Idle workers are also kept in a grid so the best one for a point can
+    usually be found by only looking at the workers that could reach it.
+    NumPy is used if it's installed, otherwise the speeds are calculated
+    one at a time.
+    """
+    def __init__(self, size, ref_lat=0.0, cell_size=500):
+        self.size = size
+        if np:
+            self.lats = np.zeros(size)
+            self.lons = np.zeros(size)
+            self.last_request = np.zeros(size)
+            self.busy = np.zeros(size, dtype=bool)
+        else:
+            self.lats = array('d', bytes(8 * size))
+            self.lons = array('d', bytes(8 * size))
+            self.last_request = array('d', bytes(8 * size))
+            self.busy = [False] * size
+        # {worker index: point} of idle workers
+        self.idle = GridMap(cell_size, ref_lat)
+        # heap of (last_request, worker index), for finding the idle worker
+        # that's been waiting longest. Entries for workers that are busy or
+        # have made requests since are removed lazily.
+        self.waiting = []
+        # called with the index of each worker that becomes idle
+        self.on_idle = None
+
+    def set_location(self, index, point):
+        lat, lon = point
+        self.lats[index], self.lons[index] = lat, lon
+        if not self.busy[index]:
+            self.idle.set(index, (lat, lon))
+
+    def set_last_request(self, index, timestamp):
+        self.last_request[index] = timestamp
+        if not self.busy[index]:
+            self._wait(index)
+
+    def set_busy(self, index, busy):
+        self.busy[index] = busy
+        if busy:
+            self.idle.discard(index)
+        else:
+            self.idle.set(index, (float(self.lats[index]), float(self.lons[index])))
+            self._wait(index)
+            if self.on_idle:
+                self.on_idle(index)
+
+    def _wait(self, index):
+        waiting = self.waiting
+        heappush(waiting, (float(self.last_request[index]), index))
+        if len(waiting) > 2 * self.size + 64:
+            busy = self.busy
+            last_request = self.last_request
+            waiting[:] = [(t, i) for t, i in waiting
+                          if not busy[i] and last_request[i] == t]
+            heapify(waiting)
+
+    def longest_wait(self):
+        """Return the earliest last request of any idle worker, or None."""
+        waiting = self.waiting
+        busy = self.busy
+        last_request = self.last_request
+        while waiting:
+            timestamp, index = waiting[0]
+            if busy[index] or last_request[index] != timestamp:
+                heappop(waiting)
+            else:
+                return timestamp
+        return None
+
+    def distances(self, point, unit):
+        """Return the distance from every worker to point."""
+        return distances(self.lats, self.lons, point, unit)
+
+    def speeds(self, point, now, scan_delay, unit):
+        """Return the speed each worker would need to travel to point, in
+        units per hour. Busy workers get an infinite speed.
+        """
+        if np is None:
+            return self._speeds(point, now, scan_delay, unit)
+        time_diffs = np.maximum(now - self.last_request, scan_delay)
+        speeds = self.distances(point, unit) / time_diffs * 3600
+        speeds[self.busy] = np.inf
+        return speeds
+
+    def speed(self, index, point, now, scan_delay, unit):
+        """Return the speed one idle worker would need to travel to point."""
+        return (get_distance(self.idle.points[index], point, unit) /
+                max(now - float(self.last_request[index]), scan_delay) * 3600)
+
+    def ready_time(self, point, unit, speed_limit):
+        """Return the earliest time any idle worker could reach point without
+        exceeding speed_limit, or None if every worker is busy.
+        """
+        if not self.idle:
+            return None
+        if np is None or len(self.idle) < 64:
+            points, last_request = self.idle.points, self.last_request
+            return min(last_request[i] + get_distance(p, point, unit) * 3600 / speed_limit
+                       for i, p in points.items())
+        times = self.last_request + self.distances(point, unit) * (3600 / speed_limit)
+        return float(times[~self.busy].min())
+
+    def _speeds(self, point, now, scan_delay, unit):
+        inf = float('inf')
+        return [inf if busy else
+                get_distance((lat, lon), point, unit) / max(now - last, scan_delay) * 3600
+                for lat, lon, last, busy in zip(
+                    self.lats, self.lons, self.last_request, self.busy)]
+
+    def best(self, point, now, scan_delay, unit, good_enough,
+             speed_limit=float('inf')):
+        """Return the index and speed of the idle worker that can reach point
+        the slowest, or the first one found slower than good_enough.
+
+        Returns (None, inf) if every worker is busy. The speed may be over
+        speed_limit if no idle worker is close enough.
+        """
+        oldest = self.longest_wait()
+        if oldest is None:
+            return None, float('inf')
+        # no idle worker can be slower than this per meter of distance
+        per_meter = 3600 / (max(now - oldest, scan_delay) * METERS_PER_UNIT[unit])
+
+        idle = self.idle
+        rings = idle.span(point)
+        reach = speed_limit / per_meter
+        if reach < float('inf'):
+            rings = min(rings, ceil(reach / idle.ring_clearance(point, 1)))
+        if (2 * rings + 1) ** 2 > len(idle):
+            # searching the grid would look at more cells than there are
+            # idle workers, so look at all of them
+            if np is None or len(idle) < 64:
+                return self._best(sorted(idle.points), point, now, scan_delay,
+                                  unit, good_enough)
+            return self._best_all(point, now, scan_delay, unit, good_enough)
+
+        index = None
+        lowest = float('inf')
+        points, last_request = idle.points, self.last_request
+        for distance, candidates in idle.rings(point, rings):
+            for i in candidates:
+                speed = (get_distance(points[i], point, unit) /
+                         max(now - last_request[i], scan_delay) * 3600)
+                if speed < lowest or (speed == lowest and i < index):
+                    index, lowest = i, speed
+            if lowest < good_enough:
+                break
+            # workers further away can't be slower
+            if lowest <= idle.ring_clearance(point, distance) * per_meter:
+                break
+        return index, lowest
+
+    def _best_all(self, point, now, scan_delay, unit, good_enough):
+        speeds = self.speeds(point, now, scan_delay, unit)
+        idle = np.flatnonzero(~self.busy)
+        if not len(idle):
+            return None, float('inf')
+        speeds = speeds[idle]
+        # a worker is chosen early if it's faster than good_enough and
+        # every idle worker before it
+        lowest_before = np.minimum.accumulate(speeds)[:-1]
+        early = np.flatnonzero((speeds[1:] < lowest_before) &
+                               (speeds[1:] < good_enough))
+        position = early[0] + 1 if len(early) else int(np.argmin(speeds))
+        return int(idle[position]), float(speeds[position])
+
+    def _best(self, indices, point, now, scan_delay, unit, good_enough):
+        index = None
+        lowest = float('inf')
+        points, last_request = self.idle.points, self.last_request
+        for i in indices:
+            speed = (get_distance(points[i], point, unit) /
+                     max(now - last_request[i], scan_delay) * 3600)
+            if index is None:
+                index, lowest = i, speed
+            elif speed < lowest:
+                index, lowest = i, speed
+                if speed < good_enough:
+                    break
+        return index, lowest
+
+
+class Waitlist:
+    """Points waiting for a worker that can reach them
+
+    Instead of polling, waiting points are checked again when a worker
+    becomes idle, and when enough time has passed for an idle worker to be
+    slow enough to reach one. Points are matched in order of their
+    deadlines.
+    """
+    def __init__(self, fleet, scan_delay, unit, good_enough, speed_limit,
+                 max_wait, loop):
+        self.fleet = fleet
+        self.scan_delay = scan_delay
+        self.unit = unit
+        self.good_enough = good_enough
+        self.speed_limit = speed_limit
+        # longest a point waits without being checked again
+        self.max_wait = max_wait
+        self.loop = loop
+        # heap of [deadline, sequence, point, future, next check], all times
+        # are monotonic
+        self.waiting = []
+        self.sequence = count()
+        self.timer = None
+        self.timer_at = float('inf')
+        self.dispatching = False
+        self.closed = False
+        fleet.on_idle = self.released
+
+    def __len__(self):
+        return sum(not entry[3].done() for entry in self.waiting)
+
+    def best(self, point):
+        return self.fleet.best(point, time(), self.scan_delay, self.unit,
+                               self.good_enough, self.speed_limit)
+
+    async def get(self, point, deadline=None):
+        """Return the index and speed of a worker that can reach point,
+        waiting for one if necessary.
+
+        Returns None if the monotonic deadline passes first, or if the
+        waitlist is closed. The worker isn't reserved, so the caller must
+        lock it before awaiting anything else.
+        """
+        fleet = self.fleet
+        while not self.closed:
+            index, speed = self.best(point)
+            if speed < self.speed_limit:
+                return index, speed
+            if deadline and monotonic() > deadline:
+                return None
+            future = Future(loop=self.loop)
+            entry = [deadline or float('inf'), next(self.sequence), point, future,
+                     self.next_check(point)]
+            heappush(self.waiting, entry)
+            self.schedule(min(entry[0], entry[4]))
+            try:
+                found = await future
+            finally:
+                # removed lazily if cancelled
+                future.cancel()
+            if found is None:
+                return None
+            # the worker isn't reserved while this resumes, so it may have
+            # been given to another point or have moved in the meantime
+            index = found[0]
+            if not fleet.busy[index]:
+                speed = fleet.speed(index, point, time(), self.scan_delay, self.unit)
+                if speed < self.speed_limit:
+                    return index, speed
+        return None
+
+    def next_check(self, point):
+        """When an idle worker will be slow enough to reach point."""
+        ready = self.fleet.ready_time(point, self.unit, self.speed_limit)
+        now = monotonic()
+        if ready is None:
+            return now + self.max_wait
+        return now + min(max(ready - time(), 0) + 0.01, self.max_wait)
+
+    def schedule(self, when):
+        if when >= self.timer_at:
+            return
+        if self.timer:
+            self.timer.cancel()
+        self.timer = self.loop.call_later(max(when - monotonic(), 0), self.dispatch)
+        self.timer_at = when
+
+    def released(self, index):
+        """Give a newly idle worker to the first point it can reach.
+
+        Every other idle worker was too fast for the waiting points when they
+        were last checked, so only this one needs to be tried.
+        """
+        if self.dispatching:
+            return
+        waiting = self.waiting
+        # finished points are dropped from the top here, and from the rest
+        # of the heap when dispatch() rebuilds it
+        while waiting and waiting[0][3].done():
+            heappop(waiting)
+        if not waiting:
+            return
+        now = time()
+        fleet = self.fleet
+        # walk the heap in deadline order without sorting it, since no
+        # entry comes before its parent
+        frontier = [(waiting[0][0], waiting[0][1], 0)]
+        size = len(waiting)
+        while frontier:
+            i = heappop(frontier)[2]
+            _, _, point, future, _ = waiting[i]
+            if not future.done():
+                speed = fleet.speed(index, point, now, self.scan_delay, self.unit)
+                if speed < self.speed_limit:
+                    future.set_result((index, speed))
+                    return
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size:
+                    entry = waiting[child]
+                    heappush(frontier, (entry[0], entry[1], child))
+
+    def dispatch(self):
+        """Check the points that are due, and expire the ones past their
+        deadlines.
+        """
+        self.timer = None
+        self.timer_at = float('inf')
+        now = monotonic()
+        live = []
+        handed = []
+        fleet = self.fleet
+        self.dispatching = True
+        try:
+            for entry in sorted(self.waiting):
+                deadline, _, point, future, check = entry
+                if future.done():
+                    continue
+                if deadline <= now:
+                    future.set_result(None)
+                    continue
+                if check <= now:
+                    index, speed = self.best(point)
+                    if speed < self.speed_limit:
+                        future.set_result((index, speed))
+                        # don't give the same worker to the next point
+                        fleet.set_busy(index, True)
+                        handed.append(index)
+                        continue
+                    entry[4] = self.next_check(point)
+                live.append(entry)
+        finally:
+            for index in handed:
+                fleet.set_busy(index, False)
+            self.dispatching = False
+        heapify(live)
+        self.waiting = live
+        if live:
+            self.schedule(min(min(entry[0], entry[4]) for entry in live))
+
+    def close(self):
+        """Stop waiting for workers."""
+        self.closed = True
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+            self.timer_at = float('inf')
+        for entry in self.waiting:
+            if not entry[3].done():
+                entry[3].set_result(None)
+        self.waiting = []
@@ -0,0 +1,226 @@
+from asyncio import Future
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic, time
+
+from aiopogo import HashServer
+
+from .shared import LOOP
+
+# priority classes of hashing requests, the lowest goes first
+KNOWN = 0     # visits to known spawns, and logging in to make them
+ENCOUNTER = 1
+UNKNOWN = 2   # visits to unknown points and mysteries, and bootstrapping
+OPTIONAL = 3  # spinning, incubating eggs, cleaning the bag, standby logins
+PRIORITIES = ('known', 'encounters', 'unknown', 'optional')
+
+
+class KeyPool:
+    """Tracks how much of each hash key's quota is left
+
+    HashServer records the remaining requests, maximum and period end of
+    every key from the headers of its responses, and rotates through the
+    keys itself. A key's headroom is its remaining requests, and the rate
+    it can sustain is its headroom spread over the seconds left in its
+    period. The scheduler paces requests by the rate all keys can sustain,
+    and workers wait on quota errors until a key has requests to spare.
+    """
+    def __init__(self, reserve=3, period=60):
+        # requests to leave on every key for the ones already in flight
+        self.reserve = reserve
+        # length of a quota period
+        self.period = period
+        self.keys = []
+
+    def install(self, keys):
+        if not keys:
+            return
+        if isinstance(keys, str):
+            keys = (keys,)
+        self.keys = list(keys)
+
+    @staticmethod
+    def status(key):
+        try:
+            return HashServer.key_statuses.get(key)
+        except AttributeError:
+            return HashServer.key_status
+
+    def headroom(self, key, status, now):
+        """Return the number of requests a key has left, the number of
+        seconds until it refreshes, and its quota, or None if its quota
+        isn't known yet.
+        """
+        try:
+            remaining = status['remaining']
+            period = status['period']
+            maximum = status['maximum']
+        except (KeyError, TypeError):
+            return None
+        if now >= period:
+            # a new period has started since the last response
+            return maximum, self.period, maximum
+        return remaining, period - now, maximum
+
+    def wait_time(self, now=None):
+        """Return the number of seconds until any key has requests to spare,
+        or None if that isn't known.
+        """
+        now = now or time()
+        wait = None
+        unknown = False
+        for key in self.keys:
+            status = self.status(key)
+            if status is None:
+                continue
+            headroom = self.headroom(key, status, now)
+            if headroom is None:
+                unknown = True
+            elif headroom[0] > self.reserve:
+                return 0
+            elif wait is None or headroom[1] < wait:
+                wait = headroom[1]
+        return None if unknown else wait
+
+    def rate(self, now=None):
+        """Return the requests per second that the keys can sustain until
+        their periods end, or None if a quota isn't known yet.
+        """
+        now = now or time()
+        total = 0
+        for key in self.keys:
+            status = self.status(key)
+            if status is None:
+                continue
+            headroom = self.headroom(key, status, now)
+            if headroom is None:
+                return None
+            left, seconds, _ = headroom
+            total += max(left - self.reserve, 0) / max(seconds, 1)
+        return total if self.keys else None
+
+    def surplus(self, spare, now=None):
+        """Return how many requests can be spent now, on top of spending
+        the rest evenly over every key's period while keeping the fraction
+        spare of each quota, or None if a quota isn't known yet.
+        """
+        now = now or time()
+        total = 0
+        for key in self.keys:
+            status = self.status(key)
+            if status is None:
+                continue
+            headroom = self.headroom(key, status, now)
+            if headroom is None:
+                return None
+            left, seconds, maximum = headroom
+            reserved = spare * maximum
+            total += left - (maximum - reserved) / self.period * seconds - reserved
+        return total
+
+    @property
+    def lines(self):
+        now = time()
+        lines = []
+        for key in self.keys:
+            status = self.status(key)
+            if status is None:
+                lines.append('Hash key {:.10}...: expired'.format(key))
+                continue
+            headroom = self.headroom(key, status, now)
+            if headroom is None:
+                lines.append('Hash key {:.10}...: unknown'.format(key))
+            else:
+                lines.append('Hash key {:.10}...: {}/{}, refresh in {:.0f}'.format(
+                    key, headroom[0], headroom[2], headroom[1]))
+        return lines
+
+
+class HashScheduler:
+    """Hands out hashing requests at the rate the keys can sustain, the
+    most valuable ones first
+
+    Tokens accrue at the rate given by the key pool, up to burst seconds'
+    worth. Requests that find no token wait in order of their priority
+    class, then in the order they came in, so that when quota runs low the
+    visits to known spawns keep going and the optional requests wait.
+    There's no limit until the quotas are known.
+    """
+    def __init__(self, keys, burst=2, recheck=1, loop=LOOP):
+        self.keys = keys
+        self.burst = burst
+        # longest time to wait before checking the rate again
+        self.recheck = recheck
+        self.loop = loop
+        self.tokens = 1.0
+        self.updated = monotonic()
+        self.current_rate = None
+        # heap of (priority, sequence, future, time queued)
+        self.waiting = []
+        self.sequence = count()
+        self.handle = None
+        self.granted = [0] * len(PRIORITIES)
+        self.delays = [0.0] * len(PRIORITIES)
+
+    def refill(self):
+        now = monotonic()
+        rate = self.current_rate = self.keys.rate()
+        if rate is None:
+            self.tokens = 1.0
+        else:
+            self.tokens = min(self.tokens + rate * (now - self.updated),
+                              max(rate * self.burst, 1.0))
+        self.updated = now
+
+    async def acquire(self, priority):
+        self.refill()
+        if not self.waiting and self.tokens >= 1:
+            self.tokens -= 1
+            self.granted[priority] += 1
+            return
+        future = Future(loop=self.loop)
+        heappush(self.waiting, (priority, next(self.sequence), future, monotonic()))
+        self.schedule()
+        await future
+
+    def schedule(self):
+        if self.handle is not None or not self.waiting:
+            return
+        rate = self.current_rate
+        if rate:
+            delay = min((1 - self.tokens) / rate, self.recheck)
+        else:
+            delay = 0 if rate is None else self.recheck
+        self.handle = self.loop.call_later(max(delay, 0), self.release)
+
+    def release(self):
+        self.handle = None
+        self.refill()
+        waiting = self.waiting
+        now = monotonic()
+        while waiting and self.tokens >= 1:
+            priority, _, future, queued = heappop(waiting)
+            if future.done():
+                # cancelled
+                continue
+            self.tokens -= 1
+            self.granted[priority] += 1
+            self.delays[priority] += now - queued
+            future.set_result(None)
+        self.schedule()
+
+    @property
+    def status(self):
+        waiting = [0] * len(PRIORITIES)
+        for priority, *_ in self.waiting:
+            waiting[priority] += 1
+        rate = self.current_rate
+        return 'Hash rate: {}, waiting (average wait): {}'.format(
+            'unlimited' if rate is None else '{:.2f}/s'.format(rate),
+            ', '.join('{} {} ({:.1f}s)'.format(
+                name, waiting[i], self.delays[i] / self.granted[i] if self.granted[i] else 0)
+                for i, name in enumerate(PRIORITIES)))
+
+
+HASH_KEYS = KeyPool()
+HASH_SCHEDULER = HashScheduler(HASH_KEYS)
@@ -0,0 +1,136 @@
+from asyncio import CancelledError, Future
+from collections import deque
+from time import monotonic
+
+from .metrics import METRICS
+from .shared import get_logger, LOOP
+
+
+class AdaptiveLimiter:
+    """Limits the visits in progress, like a semaphore with an adjustable
+    number of slots
+
+    With a maximum, the limit is tuned every interval seconds, additive
+    increase and multiplicative decrease: it's cut by backoff when the event
+    loop lagged by more than max_lag or visits waited longer than
+    target_wait for a worker on average, since then there are more visits
+    than workers to make them. Otherwise it's raised by step when spawns
+    were skipped or visits had to wait for a slot, since then there are
+    workers that could be making them.
+    """
+    def __init__(self, limit, minimum=None, maximum=None, interval=10,
+                 target_wait=5, max_lag=0.25, step=1, backoff=0.8, loop=LOOP):
+        self.limit = limit
+        self.minimum = min(minimum or limit, limit)
+        self.maximum = max(maximum or limit, limit)
+        self.interval = interval
+        self.target_wait = target_wait
+        self.max_lag = max_lag
+        self.step = step
+        self.backoff = backoff
+        self.loop = loop
+        self.log = get_logger('limiter')
+        self.active = 0
+        self.waiters = deque()
+        # observations since the last adjustment
+        self.skips = 0
+        self.delayed = 0
+        self.worker_waits = 0
+        self.worker_wait = 0.0
+        self.history = deque(maxlen=12)
+        # why the limit last changed
+        self.reason = None
+        self.handle = None
+
+    @property
+    def adaptive(self):
+        return self.maximum > self.minimum
+
+    def start(self):
+        if self.adaptive:
+            self.handle = self.loop.call_later(self.interval, self.adjust)
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.cancel()
+
+    def locked(self):
+        return self.active >= self.limit
+
+    async def acquire(self):
+        if not self.waiters and self.active < self.limit:
+            self.active += 1
+            METRICS.record('coroutine limit', 0.0)
+            return True
+        self.delayed += 1
+        start = monotonic()
+        future = Future(loop=self.loop)
+        self.waiters.append(future)
+        try:
+            await future
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                # given a slot just before being cancelled
+                self.release()
+            raise
+        METRICS.record('coroutine limit', monotonic() - start)
+        return True
+
+    def release(self):
+        self.active -= 1
+        self.wake()
+
+    def wake(self):
+        waiters = self.waiters
+        while waiters and self.active < self.limit:
+            future = waiters.popleft()
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def skipped(self):
+        self.skips += 1
+
+    def waited(self, seconds):
+        """Record how long a visit waited for a worker."""
+        self.worker_waits += 1
+        self.worker_wait += seconds
+
+    def adjust(self):
+        wait = self.worker_wait / self.worker_waits if self.worker_waits else 0.0
+        lag = METRICS.take_lag()
+        limit = self.limit
+        if lag > self.max_lag:
+            limit = int(limit * self.backoff)
+            reason = 'loop lag {:.2f}s'.format(lag)
+        elif wait > self.target_wait:
+            limit = int(limit * self.backoff)
+            reason = 'worker wait {:.1f}s'.format(wait)
+        elif self.skips or self.delayed:
+            limit += self.step
+            reason = '{} skipped, {} delayed'.format(self.skips, self.delayed)
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit != self.limit:
+            self.reason = reason
+            self.log.debug('Coroutine limit {} -> {}: {}', self.limit, limit, reason)
+            self.limit = limit
+            self.wake()
+        self.history.append(limit)
+        self.skips = self.delayed = self.worker_waits = 0
+        self.worker_wait = 0.0
+        self.handle = self.loop.call_later(self.interval, self.adjust)
+
+    @property
+    def status(self):
+        return ('Coroutine limit: {} ({}-{}), in progress: {}, waiting: {}{}\n'
+                'Limit history: {}').format(
+                    self.limit, self.minimum, self.maximum, self.active,
+                    len(self.waiters),
+                    ', last changed for {}'.format(self.reason) if self.reason else '',
+                    ' '.join(str(x) for x in self.history))
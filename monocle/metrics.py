@@ -0,0 +1,140 @@
+"""Where the time of a visit goes
+
+Durations are counted in log-scaled histograms: every bucket is a fixed
+ratio wider than the last, so each stage only needs a list of counts, and
+the percentiles are accurate to within that ratio. Every interval the
+histograms are summarized in the log and on the status screen, and start
+over.
+"""
+
+from math import log
+
+from .shared import get_logger, LOOP
+
+# the stages measured, in the order they're shown
+STAGES = (
+    'coroutine limit',  # waiting for the overseer to allow another visit
+    'best worker',      # waiting for a worker that can reach the point
+    'scan delay',       # waiting for the account's last scan to be old enough
+    'request',          # round trip of requests, hashing included
+    'map objects',      # processing GetMapObjects responses
+    'encounter wait',   # waiting in the queue of encounters
+    'encounter',
+    'DB queue',         # waiting to be saved by the DB processor
+    'loop lag'          # how late the event loop runs callbacks
+)
+
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return '{:.0f}ms'.format(seconds * 1000)
+    return '{:.1f}s'.format(seconds)
+
+
+class Histogram:
+    """Counts of durations in buckets from minimum up, each ratio times
+    wider than the last
+    """
+    def __init__(self, minimum=0.001, ratio=2 ** 0.25, size=80):
+        self.minimum = minimum
+        self.ratio = ratio
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        # the first bucket counts everything shorter than minimum
+        self.counts = [0] * (self.size + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds < self.minimum:
+            bucket = 0
+        else:
+            bucket = min(int(log(seconds / self.minimum, self.ratio)) + 1, self.size)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket of the given percentile."""
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self.minimum * self.ratio ** bucket, self.max)
+        return self.max
+
+    def summary(self, name):
+        return '{}: {}, mean {}, p50 {}, p90 {}, p99 {}, max {}'.format(
+            name, self.count, format_seconds(self.total / self.count),
+            format_seconds(self.percentile(0.5)),
+            format_seconds(self.percentile(0.9)),
+            format_seconds(self.percentile(0.99)),
+            format_seconds(self.max))
+
+
+class Metrics:
+    """Histograms of every stage, and a probe of the event loop's lag"""
+    def __init__(self, interval=60, probe_interval=0.5, loop=LOOP):
+        self.interval = interval
+        self.probe_interval = probe_interval
+        self.loop = loop
+        self.log = get_logger('metrics')
+        self.histograms = {name: Histogram() for name in STAGES}
+        # summaries of the last interval
+        self.lines = []
+        # the most the loop lagged since take_lag was last called
+        self.peak_lag = 0.0
+        self.handles = {}
+
+    def record(self, name, seconds):
+        self.histograms[name].record(seconds)
+
+    def record_many(self, name, durations):
+        record = self.histograms[name].record
+        for seconds in durations:
+            record(seconds)
+
+    def start(self):
+        expected = self.loop.time() + self.probe_interval
+        self.handles['probe'] = self.loop.call_at(expected, self.probe, expected)
+        self.handles['dump'] = self.loop.call_later(self.interval, self.dump)
+
+    def close(self):
+        for handle in self.handles.values():
+            handle.cancel()
+
+    def probe(self, expected):
+        now = self.loop.time()
+        lag = max(now - expected, 0.0)
+        self.record('loop lag', lag)
+        if lag > self.peak_lag:
+            self.peak_lag = lag
+        expected = now + self.probe_interval
+        self.handles['probe'] = self.loop.call_at(expected, self.probe, expected)
+
+    def take_lag(self):
+        lag = self.peak_lag
+        self.peak_lag = 0.0
+        return lag
+
+    def dump(self):
+        lines = []
+        for name in STAGES:
+            histogram = self.histograms[name]
+            if histogram.count:
+                lines.append(histogram.summary(name))
+                histogram.reset()
+        for line in lines:
+            self.log.info(line)
+        self.lines = lines
+        self.handles['dump'] = self.loop.call_later(self.interval, self.dump)
+
+
+METRICS = Metrics()
+
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from collections import deque
 from math import sqrt
 from time import monotonic, time
@@ -12,7 +13,8 @@ from aiopogo import json_dumps, json_loads
 from .utils import load_pickle, dump_pickle
 from .db import session_scope, get_pokemon_ranking, estimate_remaining_time
 from .names import MOVES, POKEMON
-from .shared import get_logger, SessionManager, LOOP, run_threaded
+from .shared import get_logger, SessionManager, LOOP, POOLS, run_threaded
+from .expiring import ExpiringMap
 from . import sanitized as conf
 
 
@@ -82,19 +84,26 @@ if conf.NOTIFY:
 
 class NotificationCache:
     def __init__(self):
-        self.store = set()
+        self.store = ExpiringMap(maxsize=conf.CACHE_LIMIT)
+
+    def __len__(self):
+        return len(self.store)
 
     def __contains__(self, item):
         return item in self.store
 
     def add(self, item, delay):
-        self.store.add(item)
-        return LOOP.call_later(delay, self.remove, item)
+        self.store.set(item, True, time() + delay)
 
     def remove(self, item):
         self.store.discard(item)
 
 
+def create_image(pokemon, move1, move2, time_of_day):
+    """Return a notification image as PNG data, run in the CPU pool."""
+    return PokeImage(pokemon, move1, move2, time_of_day).create()
+
+
 class PokeImage:
     def __init__(self, pokemon, move1, move2, time_of_day=0, stats=conf.IMAGE_STATS):
         self.pokemon_id = pokemon['pokemon_id']
@@ -123,9 +132,9 @@ class PokeImage:
             self.draw_stats()
         self.draw_image(pokepic, 204, 224)
         self.draw_name(50 if stats else 120)
-        image = TemporaryFile(suffix='.png')
+        image = BytesIO()
         ims.write_to_png(image)
-        return image
+        return image.getvalue()
 
     def draw_stats(self, iv_font=conf.IV_FONT, move_font=conf.MOVE_FONT):
         """Draw the Pokemon's IV's and moves."""
@@ -507,7 +516,10 @@ class Notification:
         client = self.get_twitter_client()
         if conf.TWEET_IMAGES:
             try:
-                image = PokeImage(self.pokemon, self.move1, self.move2, self.time_of_day).create()
+                data = await POOLS['cpu'].run(create_image, self.pokemon, self.move1,
+                                              self.move2, self.time_of_day)
+                image = TemporaryFile(suffix='.png')
+                image.write(data)
             except Exception:
                 self.log.exception('Failed to create a Tweet image.')
             else:
@@ -593,7 +605,7 @@ class Notifier:
         LOOP.call_later(3600, self.set_notify_ids)
 
     async def _set_notify_ids(self):
-        await run_threaded(self.set_ranking)
+        await run_threaded(self.set_ranking, pool='db')
         self.notify_ids = self.pokemon_ranking[0:self.notify_ranking]
         self.always_notify = set(self.pokemon_ranking[0:conf.ALWAYS_NOTIFY])
         self.always_notify |= set(conf.ALWAYS_NOTIFY_IDS)
@@ -662,9 +674,8 @@ class Notifier:
         score_required = self.get_required_score()
         return highest_score > score_required
 
-    def cleanup(self, encounter_id, handle):
+    def cleanup(self, encounter_id):
         self.cache.remove(encounter_id)
-        handle.cancel()
         return False
 
     async def notify(self, pokemon, time_of_day):
@@ -719,15 +730,17 @@ class Notifier:
 
         if 'time_till_hidden' not in pokemon:
             seen = pokemon['seen'] % 3600
-            self.cache.store.add(pokemon['encounter_id'])
+            # hold the spot while the remaining time is estimated
+            self.cache.add(encounter_id, 3600)
             try:
                 with session_scope() as session:
-                    tth = await run_threaded(estimate_remaining_time, session, pokemon['spawn_id'], seen)
+                    tth = await run_threaded(estimate_remaining_time, session,
+                                             pokemon['spawn_id'], seen, pool='db')
             except Exception:
                 self.log.exception('An exception occurred while trying to estimate remaining time.')
                 now_epoch = time()
                 tth = (pokemon['seen'] + 90 - now_epoch, pokemon['seen'] + 3600 - now_epoch)
-            LOOP.call_later(tth[1], self.cache.remove, pokemon['encounter_id'])
+            self.cache.add(encounter_id, tth[1])
             if pokemon_id not in self.always_notify:
                 mean = sum(tth) / 2
                 if mean < conf.TIME_REQUIRED:
@@ -735,7 +748,7 @@ class Notifier:
                     return False
             pokemon['earliest_tth'], pokemon['latest_tth'] = tth
         else:
-            cache_handle = self.cache.add(pokemon['encounter_id'], pokemon['time_till_hidden'])
+            self.cache.add(encounter_id, pokemon['time_till_hidden'])
 
         if WEBHOOK and NATIVE:
             notified, whpushed = await gather(
@@ -752,7 +765,7 @@ class Notifier:
             self.sent += 1
             return True
         else:
-            return self.cleanup(encounter_id, cache_handle)
+            return self.cleanup(encounter_id)
 
     async def webhook(self, pokemon):
         """ Send a notification via webhook
@@ -1,4 +1,4 @@
-from asyncio import gather, Semaphore, sleep, Task, CancelledError
+from asyncio import gather, sleep, Task, CancelledError
 from datetime import datetime
 from statistics import median
 from sys import platform
@@ -7,14 +7,22 @@ from collections import deque
 from itertools import dropwhile
 from time import time, monotonic
 
-from aiopogo import HashServer
 from sqlalchemy.exc import OperationalError
 
-from .db import SIGHTING_CACHE, MYSTERY_CACHE
+from .db import SIGHTING_CACHE, MYSTERY_CACHE, SPAWNPOINT_CACHE
 from .utils import get_current_hour, dump_pickle, get_start_coords, get_bootstrap_points, randomize_point, best_factors, percentage_split
-from .shared import get_logger, LOOP, run_threaded, ACCOUNTS
+from .shared import get_logger, LOOP, POOLS, run_threaded, ACCOUNTS
 from . import bounds, db_proc, spawns, sanitized as conf
-from .worker import Worker
+from .accounts import CAPTCHA_QUEUE, EXTRA_QUEUE
+from .coalesce import Coalescer
+from .encounters import EncounterQueue
+from .fleet import Waitlist
+from .hashkeys import HASH_KEYS, HASH_SCHEDULER
+from .limiter import AdaptiveLimiter
+from .metrics import METRICS
+from .planner import Planner
+from .standby import StandbyPool
+from .worker import Worker, UNIT
 
 ANSI = '\x1b[2J\x1b[H'
 if platform == 'win32':
@@ -55,31 +63,55 @@ BAD_STATUSES = (
 
 
 class Overseer:
-    def __init__(self, manager):
+    def __init__(self):
         self.log = get_logger('overseer')
         self.workers = []
-        self.manager = manager
+        self.captcha_queue = CAPTCHA_QUEUE
+        self.extra_queue = EXTRA_QUEUE
         self.things_count = deque(maxlen=9)
         self.paused = False
         self.coroutines_count = 0
         self.skipped = 0
         self.visits = 0
-        self.coroutine_semaphore = Semaphore(conf.COROUTINES_LIMIT, loop=LOOP)
+        count = conf.GRID[0] * conf.GRID[1]
+        self.coroutine_semaphore = AdaptiveLimiter(
+            conf.COROUTINES_LIMIT,
+            minimum=min(conf.COROUTINES_LIMIT, max(count // 2, 1)),
+            maximum=conf.COROUTINES_MAX,
+            step=max(count // 20, 1),
+            target_wait=conf.GIVE_UP_KNOWN / 10)
         self.redundant = 0
         self.running = True
+        self.waitlist = Waitlist(Worker.fleet, Worker.scan_delay, UNIT,
+                                 conf.GOOD_ENOUGH, conf.SPEED_LIMIT,
+                                 conf.SEARCH_SLEEP, LOOP)
+        if conf.PLANNER_WINDOW:
+            self.planner = Planner(Worker.fleet, conf.PLANNER_WINDOW,
+                                   Worker.scan_delay, UNIT, conf.SPEED_LIMIT,
+                                   conf.GIVE_UP_KNOWN)
+        else:
+            self.planner = None
+        if conf.STANDBY_ACCOUNTS:
+            self.standby = StandbyPool(conf.STANDBY_ACCOUNTS)
+        else:
+            self.standby = None
+        if conf.ENCOUNTER:
+            self.encounters = EncounterQueue(
+                self, conf.ENCOUNTER_LIMIT,
+                Worker.notifier if conf.NOTIFY else None)
+        else:
+            self.encounters = None
+        if conf.COALESCE_WINDOW:
+            self.coalescer = Coalescer(conf.COALESCE_WINDOW, conf.COALESCE_RADIUS,
+                                       bounds.center[0])
+        else:
+            self.coalescer = None
         self.all_seen = False
         self.idle_seconds = 0
         self.log.info('Overseer initialized')
         self.pokemon_found = ''
 
     def start(self, status_bar):
-        self.captcha_queue = self.manager.captcha_queue()
-        Worker.captcha_queue = self.manager.captcha_queue()
-        self.extra_queue = self.manager.extra_queue()
-        Worker.extra_queue = self.manager.extra_queue()
-        if conf.MAP_WORKERS:
-            Worker.worker_dict = self.manager.worker_dict()
-
         for username, account in ACCOUNTS.items():
             account['username'] = username
             if account.get('banned'):
@@ -90,10 +122,22 @@ class Overseer:
                 self.extra_queue.put(account)
 
         self.workers = tuple(Worker(worker_no=x) for x in range(conf.GRID[0] * conf.GRID[1]))
+        if self.standby is not None:
+            Worker.standby = self.standby
+            self.standby.start()
+        if self.encounters is not None:
+            Worker.encounters = self.encounters
+            self.encounters.start()
+        self.coroutine_semaphore.start()
+        METRICS.start()
         db_proc.start()
         LOOP.call_later(10, self.update_count)
         LOOP.call_later(max(conf.SWAP_OLDEST, conf.MINIMUM_RUNTIME), self.swap_oldest)
         LOOP.call_soon(self.update_stats)
+        if conf.CACHE_PICKLE_INTERVAL:
+            LOOP.call_later(conf.CACHE_PICKLE_INTERVAL, self.pickle_caches)
+        if conf.MAP_WORKERS:
+            LOOP.call_soon(self.publish_workers)
         if status_bar:
             LOOP.call_soon(self.print_status)
 
@@ -105,8 +149,19 @@ class Overseer:
             + '\n')
         LOOP.call_later(10, self.update_count)
 
+    def pickle_caches(self, interval=conf.CACHE_PICKLE_INTERVAL):
+        LOOP.create_task(run_threaded(SIGHTING_CACHE.pickle))
+        LOOP.create_task(run_threaded(MYSTERY_CACHE.pickle))
+        LOOP.call_later(interval, self.pickle_caches)
+
+    def publish_workers(self, interval=2):
+        sections = Worker.roster.copy()
+        if sections is not None:
+            LOOP.create_task(run_threaded(Worker.roster.dump, sections))
+        LOOP.call_later(interval, self.publish_workers)
+
     def swap_oldest(self, interval=conf.SWAP_OLDEST, minimum=conf.MINIMUM_RUNTIME):
-        if not self.paused and not self.extra_queue.empty():
+        if not self.paused and (self.standby or not self.extra_queue.empty()):
             oldest, minutes = self.longest_running()
             if minutes > minimum:
                 LOOP.create_task(oldest.lock_and_swap(minutes))
@@ -172,11 +227,13 @@ class Overseer:
         self.counts = (
             'Known spawns: {}, unknown: {}, more: {}\n'
             '{} workers, {} coroutines\n'
-            'sightings cache: {}, mystery cache: {}, DB queue: {}\n'
+            'sightings cache: {}, mystery cache: {}, evicted: {}, DB queue: {}, DB rows/s: {:.1f}\n'
         ).format(
             len(spawns), len(spawns.unknown), spawns.cells_count,
             count, self.coroutines_count,
-            len(SIGHTING_CACHE), len(MYSTERY_CACHE), len(db_proc)
+            len(SIGHTING_CACHE), len(MYSTERY_CACHE),
+            SIGHTING_CACHE.store.evicted + MYSTERY_CACHE.store.evicted,
+            len(db_proc), db_proc.rate
         )
         LOOP.call_later(refresh, self.update_stats)
 
@@ -247,6 +304,19 @@ class Overseer:
                 self.visits, self.visits / seconds_since_start,
                 self.skipped, self.redundant)
         ]
+        if self.coroutine_semaphore.adaptive:
+            output.append(self.coroutine_semaphore.status)
+        if self.planner:
+            output.append(self.planner.status)
+        if self.coalescer:
+            output.append(self.coalescer.status)
+        if self.standby is not None:
+            output.append(self.standby.status)
+        if self.encounters is not None:
+            output.append(self.encounters.status)
+        if Worker.multiproxy:
+            output.append(Worker.proxies.status)
+        output.extend(pool.status for pool in POOLS.values() if pool.completed)
 
         try:
             seen = Worker.g['seen']
@@ -263,15 +333,10 @@ class Overseer:
         except ZeroDivisionError:
             pass
 
-        try:
-            hash_status = HashServer.status
-            output.append('Hashes: {}/{}, refresh in {:.0f}'.format(
-                hash_status['remaining'],
-                hash_status['maximum'],
-                hash_status['period'] - time()
-            ))
-        except (KeyError, TypeError):
-            pass
+        output.extend(HASH_KEYS.lines)
+        output.extend(METRICS.lines)
+        if HASH_SCHEDULER.current_rate is not None:
+            output.append(HASH_SCHEDULER.status)
 
         if _notify:
             sent = Worker.notifier.sent
@@ -328,7 +393,7 @@ class Overseer:
     async def update_spawns(self, initial=False):
         while True:
             try:
-                await run_threaded(spawns.update)
+                await run_threaded(spawns.update, pool='db')
                 LOOP.create_task(run_threaded(spawns.pickle))
             except OperationalError as e:
                 self.log.exception('Operational error while trying to update spawns.')
@@ -349,6 +414,8 @@ class Overseer:
 
         if not pickle or not spawns.unpickle():
             await self.update_spawns(initial=True)
+        else:
+            await run_threaded(SPAWNPOINT_CACHE.load, pool='db')
 
         if not spawns or bootstrap:
             try:
@@ -393,16 +460,19 @@ class Overseer:
 
         captcha_limit = conf.MAX_CAPTCHAS
         skip_spawn = conf.SKIP_SPAWN
+        planner = self.planner
+        coalescer = self.coalescer
+        if coalescer and coalescer.schedule is not spawns.known:
+            await run_threaded(coalescer.reindex, spawns.known, time())
         for point, (spawn_id, spawn_seconds) in spawns_iter:
-            try:
-                if self.captcha_queue.qsize() > captcha_limit:
-                    self.paused = True
-                    self.idle_seconds += await run_threaded(self.captcha_queue.full_wait, conf.MAX_CAPTCHAS)
-                    self.paused = False
-            except (EOFError, BrokenPipeError, FileNotFoundError):
-                pass
+            if self.captcha_queue.qsize() > captcha_limit:
+                self.paused = True
+                self.idle_seconds += await self.captcha_queue.wait_below(captcha_limit)
+                self.paused = False
 
             spawn_time = spawn_seconds + current_hour
+            if coalescer and coalescer.covers(spawn_id, spawn_time):
+                continue
 
             # negative = hasn't happened yet
             # positive = already happened
@@ -427,10 +497,32 @@ class Overseer:
                 continue
             elif time_diff > skip_spawn:
                 self.skipped += 1
+                self.coroutine_semaphore.skipped()
                 continue
 
-            await self.coroutine_semaphore.acquire()
-            LOOP.create_task(self.try_point(point, spawn_time, spawn_id))
+            if planner:
+                if time() > planner.next_update:
+                    await run_threaded(planner.update, spawns.known, time())
+                planned = planner.take(spawn_id)
+            else:
+                planned = None
+
+            if coalescer:
+                point, visit_time, covered = coalescer.group(point, spawn_id, spawn_time)
+            else:
+                visit_time, covered = spawn_time, ()
+
+            if planned:
+                # wait for the planned worker without holding a slot
+                visit_time = max(visit_time, planned[1])
+
+            if visit_time > time():
+                LOOP.create_task(self.try_later(visit_time, point, spawn_time,
+                                                spawn_id, planned, covered))
+            else:
+                await self.coroutine_semaphore.acquire()
+                LOOP.create_task(self.try_point(point, spawn_time, spawn_id,
+                                                planned, covered))
 
     async def try_again(self, point):
         async with self.coroutine_semaphore:
@@ -499,11 +591,30 @@ class Overseer:
         tasks = (bootstrap_try(x) for x in get_bootstrap_points(bounds))
         await gather(*tasks, loop=LOOP)
 
-    async def try_point(self, point, spawn_time=None, spawn_id=None):
+    async def try_later(self, visit_time, *args):
+        """Wait for the last of the spawns a coalesced visit covers, or for
+        the planned worker, without holding a slot of the coroutine limit,
+        then visit.
+        """
+        await sleep(visit_time - time(), loop=LOOP)
+        await self.coroutine_semaphore.acquire()
+        await self.try_point(*args)
+
+    async def try_point(self, point, spawn_time=None, spawn_id=None, planned=None,
+                        covered=()):
+        visited = False
         try:
-            point = randomize_point(point)
+            if not covered:
+                # the centroids of coalesced visits are left as they are, so
+                # that every spawn they cover stays in range
+                point = randomize_point(point)
             skip_time = monotonic() + (conf.GIVE_UP_KNOWN if spawn_time else conf.GIVE_UP_UNKNOWN)
-            worker = await self.best_worker(point, skip_time)
+            if planned:
+                worker = await self.planned_worker(point, *planned)
+            else:
+                worker = None
+            if not worker:
+                worker = await self.best_worker(point, skip_time)
             if not worker:
                 if spawn_time:
                     self.skipped += 1
@@ -512,40 +623,66 @@ class Overseer:
                 if spawn_time:
                     worker.after_spawn = time() - spawn_time
 
-                if await worker.visit(point, spawn_id):
+                if await worker.visit(point, spawn_id, covered=covered):
                     self.visits += 1
+                    visited = True
         except CancelledError:
             raise
         except Exception:
             self.log.exception('An exception occurred in try_point')
         finally:
             self.coroutine_semaphore.release()
+            if covered and not visited:
+                self.uncover(covered)
 
-    async def best_worker(self, point, skip_time):
-        good_enough = conf.GOOD_ENOUGH
-        while self.running:
-            gen = (w for w in self.workers if not w.busy.locked())
-            try:
-                worker = next(gen)
-                lowest_speed = worker.travel_speed(point)
-            except StopIteration:
-                lowest_speed = float('inf')
-            for w in gen:
-                speed = w.travel_speed(point)
-                if speed < lowest_speed:
-                    lowest_speed = speed
-                    worker = w
-                    if speed < good_enough:
-                        break
-            if lowest_speed < conf.SPEED_LIMIT:
-                worker.speed = lowest_speed
+    def uncover(self, covered):
+        """Launch the spawns a coalesced visit would have covered on their
+        own, since the visit didn't happen.
+        """
+        if not self.running:
+            return
+        skip_spawn = conf.SKIP_SPAWN
+        for spawn_id, point, spawn_time in self.coalescer.release(covered):
+            if spawn_id in SIGHTING_CACHE.store:
+                self.redundant += 1
+            elif time() - spawn_time > skip_spawn:
+                self.skipped += 1
+                self.coroutine_semaphore.skipped()
+            else:
+                LOOP.create_task(self.try_later(time(), point, spawn_time, spawn_id))
+
+    async def planned_worker(self, point, index, visit_time):
+        """Return the worker planned to visit point if it's ready for it.
+
+        The visit is only started after visit_time, see _launch.
+        """
+        worker = self.workers[index]
+        if not worker.busy.locked():
+            speed = worker.travel_speed(point)
+            if speed < conf.SPEED_LIMIT:
+                worker.speed = speed
+                self.planner.followed += 1
                 return worker
-            if skip_time and monotonic() > skip_time:
-                return None
-            await sleep(conf.SEARCH_SLEEP, loop=LOOP)
+        self.planner.missed += 1
+        return None
+
+    async def best_worker(self, point, skip_time):
+        if not self.running:
+            return None
+        start = monotonic()
+        found = await self.waitlist.get(point, skip_time)
+        waited = monotonic() - start
+        self.coroutine_semaphore.waited(waited)
+        METRICS.record('best worker', waited)
+        if not found:
+            return None
+        index, speed = found
+        worker = self.workers[index]
+        worker.speed = speed
+        return worker
 
     def refresh_dict(self):
         while not self.extra_queue.empty():
-            account = self.extra_queue.get()
+            account = self.extra_queue.get_nowait()
             username = account['username']
             ACCOUNTS[username] = account
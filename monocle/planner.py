@@ -0,0 +1,265 @@
+from bisect import bisect_left
+from heapq import nsmallest
+from itertools import islice
+
+from .fleet import distances, np
+
+# cost of visits that can't happen before giving up on a spawn
+INFEASIBLE = 1e9
+
+
+def assign(costs):
+    """Solve the assignment problem for a matrix of costs, given as a list of
+    rows with no more rows than columns.
+
+    Returns the column assigned to each row so that the total cost is the
+    lowest possible, using the Hungarian algorithm with shortest augmenting
+    paths. The inner loops run over columns so they're vectorized if NumPy
+    is installed.
+    """
+    if not costs:
+        return []
+    if np is not None:
+        return _assign_numpy(costs)
+    rows, columns = len(costs), len(costs[0])
+    inf = float('inf')
+    # potentials, and the row matched to each column, with 0 as a dummy
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (columns + 1)
+    matched = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+    for i in range(1, rows + 1):
+        matched[0] = i
+        j0 = 0
+        minv = [inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while matched[j0]:
+            used[j0] = True
+            i0 = matched[j0]
+            row = costs[i0 - 1]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    reduced = row[j - 1] - ui0 - v[j]
+                    if reduced < minv[j]:
+                        minv[j] = reduced
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[matched[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            matched[j0] = matched[j1]
+            j0 = j1
+    result = [None] * rows
+    for j in range(1, columns + 1):
+        if matched[j]:
+            result[matched[j] - 1] = j - 1
+    return result
+
+
+def _assign_numpy(costs):
+    costs = np.asarray(costs, dtype=float)
+    rows, columns = costs.shape
+    u = np.zeros(rows + 1)
+    v = np.zeros(columns + 1)
+    matched = np.zeros(columns + 1, dtype=int)
+    way = np.zeros(columns + 1, dtype=int)
+    reduced = np.empty(columns + 1)
+    for i in range(1, rows + 1):
+        matched[0] = i
+        j0 = 0
+        minv = np.full(columns + 1, np.inf)
+        used = np.zeros(columns + 1, dtype=bool)
+        while matched[j0]:
+            used[j0] = True
+            i0 = matched[j0]
+            reduced[0] = np.inf
+            reduced[1:] = costs[i0 - 1] - u[i0] - v[1:]
+            better = ~used & (reduced < minv)
+            minv[better] = reduced[better]
+            way[better] = j0
+            candidates = np.where(used, np.inf, minv)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            u[matched[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            matched[j0] = matched[j1]
+            j0 = j1
+    result = [None] * rows
+    for j in range(1, columns + 1):
+        if matched[j]:
+            result[matched[j] - 1] = j - 1
+    return result
+
+
+def upcoming(schedule, start, end):
+    """Yield (point, spawn_id, spawn_time) for the spawns in a SpawnSchedule
+    that happen at or after start and before end.
+    """
+    seconds = schedule.seconds
+    hour = start - start % 3600
+    while hour < end:
+        first = bisect_left(seconds, max(start - hour, 0))
+        last = bisect_left(seconds, min(end - hour, 3600))
+        for i in range(first, last):
+            yield ((schedule.lats[i], schedule.lons[i]), schedule.spawn_ids[i],
+                   hour + seconds[i])
+        hour += 3600
+
+
+class Planner:
+    """Plans which worker should visit each upcoming known spawn
+
+    The spawns of the next window seconds are taken in batches, in order of
+    their spawn times. Each batch is assigned to workers by solving a
+    minimum-cost assignment over where each worker will be, and when it
+    will have made its last request, after the visits planned before. The
+    cost of a visit is how late the worker would be without exceeding the
+    speed limit, plus a little for the distance so workers don't wander.
+    Spawns no worker could reach before giving up aren't planned, and are
+    given to the best available worker at their spawn time like before.
+    """
+    def __init__(self, fleet, window, scan_delay, unit, speed_limit, give_up,
+                 batch_size=32, candidates=3):
+        self.fleet = fleet
+        self.window = window
+        self.scan_delay = scan_delay
+        self.unit = unit
+        self.speed_limit = speed_limit
+        self.give_up = give_up
+        # each worker can only be assigned one spawn of a batch
+        self.batch_size = min(batch_size, fleet.size)
+        # cheapest workers for each spawn that are considered
+        self.candidates = candidates
+        # {spawn_id: (worker index, planned visit time)}
+        self.plan = {}
+        # {worker index: (point, planned visit time)} of each worker's last
+        # planned visit
+        self.projected = {}
+        self.planned_until = 0
+        self.next_update = 0
+        # counters for judging the plans
+        self.planned = 0
+        self.unplanned = 0
+        self.followed = 0
+        self.missed = 0
+        self.lateness = 0.0
+
+    def __len__(self):
+        return len(self.plan)
+
+    def update(self, schedule, now):
+        """Plan the spawns that haven't been planned yet up to window
+        seconds from now.
+        """
+        self.next_update = now + self.window / 4
+        start = max(self.planned_until, now)
+        end = now + self.window
+        if end <= start:
+            return
+        self.planned_until = end
+        for spawn_id, (_, when) in list(self.plan.items()):
+            if when < now - self.give_up:
+                del self.plan[spawn_id]
+
+        fleet = self.fleet
+        lats = list(fleet.lats)
+        lons = list(fleet.lons)
+        last_request = list(fleet.last_request)
+        for i, busy in enumerate(fleet.busy):
+            if busy:
+                # assume a busy worker is about to make a request
+                last_request[i] = max(last_request[i], now)
+        for i, (point, when) in list(self.projected.items()):
+            if when < now:
+                del self.projected[i]
+            else:
+                lats[i], lons[i] = point
+                last_request[i] = when
+
+        spawns = upcoming(schedule, start, end)
+        while True:
+            batch = list(islice(spawns, self.batch_size))
+            if not batch:
+                break
+            self.plan_batch(batch, lats, lons, last_request)
+
+    def costs(self, point, spawn_time, lats, lons, last_request):
+        """Return the cost of each worker visiting a spawn, and when they'd
+        visit it.
+        """
+        travel_times = distances(lats, lons, point, self.unit)
+        scan_delay = self.scan_delay
+        if np is not None:
+            travel_times = travel_times * (3600 / self.speed_limit)
+            visits = np.maximum(spawn_time, np.asarray(last_request) +
+                                np.maximum(travel_times, scan_delay))
+            costs = visits - spawn_time + travel_times * 0.01
+            costs[visits - spawn_time > self.give_up] = INFEASIBLE
+            return costs.tolist(), visits.tolist()
+        speed_limit = self.speed_limit
+        give_up = self.give_up
+        costs = []
+        visits = []
+        for distance, last in zip(travel_times, last_request):
+            travel_time = distance * 3600 / speed_limit
+            visit = max(spawn_time, last + max(travel_time, scan_delay))
+            late = visit - spawn_time
+            costs.append(INFEASIBLE if late > give_up else late + travel_time * 0.01)
+            visits.append(visit)
+        return costs, visits
+
+    def plan_batch(self, batch, lats, lons, last_request):
+        rows = [self.costs(point, spawn_time, lats, lons, last_request)
+                for point, _, spawn_time in batch]
+
+        # only consider the few cheapest workers for each spawn
+        columns = set()
+        for costs, _ in rows:
+            columns.update(nsmallest(self.candidates, range(len(costs)),
+                                     key=costs.__getitem__))
+        if len(columns) < len(batch):
+            columns.update(range(len(lats)))
+        columns = sorted(columns)
+
+        matrix = [[costs[j] for j in columns] for costs, _ in rows]
+        for (point, spawn_id, spawn_time), (costs, visits), column in zip(
+                batch, rows, assign(matrix)):
+            worker = columns[column]
+            if costs[worker] >= INFEASIBLE:
+                self.unplanned += 1
+                continue
+            visit = visits[worker]
+            self.plan[spawn_id] = (worker, visit)
+            self.projected[worker] = (point, visit)
+            lats[worker], lons[worker] = point
+            last_request[worker] = visit
+            self.planned += 1
+            self.lateness += visit - spawn_time
+
+    def take(self, spawn_id):
+        """Return the planned worker index and visit time for a spawn, or
+        None if it wasn't planned.
+        """
+        return self.plan.pop(spawn_id, None)
+
+    @property
+    def status(self):
+        return ('Planned: {}, unplanned: {}, followed: {}, missed: {}, '
+                'average lateness: {:.1f}s').format(
+                    self.planned, self.unplanned, self.followed, self.missed,
+                    self.lateness / self.planned if self.planned else 0)
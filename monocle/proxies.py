@@ -0,0 +1,128 @@
+from statistics import median
+from time import monotonic
+
+
+class ProxyStats:
+    __slots__ = ('latency', 'errors', 'users', 'requests', 'failures', 'bans',
+                 'backoff', 'quarantined_until')
+
+    def __init__(self):
+        # moving averages of the seconds per request and of the share of
+        # requests that failed
+        self.latency = None
+        self.errors = 0.0
+        # workers using the proxy
+        self.users = 0
+        self.requests = 0
+        self.failures = 0
+        self.bans = 0
+        self.backoff = 0
+        self.quarantined_until = 0
+
+
+class ProxyPool:
+    """Assigns proxies to workers by how well they've been doing
+
+    Each proxy's latency and error rate are tracked as exponentially
+    weighted moving averages. A worker that needs a proxy gets the one with
+    the lowest expected latency, which is scaled up by the number of
+    workers already using it and by its error rate, so the load spreads out
+    over the fast and reliable ones. Proxies that are banned or fail too
+    often are quarantined, for twice as long every time it happens in a
+    row, unless every proxy is quarantined.
+    """
+    def __init__(self, proxies, alpha=0.1, max_errors=0.5, backoff=60, max_backoff=3600):
+        self.stats = {proxy: ProxyStats() for proxy in proxies}
+        self.alpha = alpha
+        self.max_errors = max_errors
+        self.min_backoff = backoff
+        self.max_backoff = max_backoff
+
+    def __len__(self):
+        return len(self.stats)
+
+    def score(self, stats, default_latency):
+        latency = default_latency if stats.latency is None else stats.latency
+        return latency * (stats.users + 1) / (1.01 - stats.errors)
+
+    def acquire(self, exclude=None, now=None):
+        """Return the best proxy other than exclude and count it as used."""
+        now = now or monotonic()
+        known = [s.latency for s in self.stats.values() if s.latency is not None]
+        # proxies without requests yet are assumed to be typical
+        default_latency = median(known) if known else 1.0
+        best = None
+        best_key = None
+        for proxy, stats in self.stats.items():
+            if proxy == exclude and len(self.stats) > 1:
+                continue
+            key = (max(stats.quarantined_until - now, 0),
+                   self.score(stats, default_latency))
+            if best_key is None or key < best_key:
+                best = proxy
+                best_key = key
+        self.stats[best].users += 1
+        return best
+
+    def release(self, proxy):
+        try:
+            stats = self.stats[proxy]
+        except KeyError:
+            return
+        if stats.users > 0:
+            stats.users -= 1
+
+    def swap(self, proxy):
+        """Release a proxy and return a different one."""
+        self.release(proxy)
+        return self.acquire(exclude=proxy)
+
+    def succeeded(self, proxy, latency):
+        stats = self.stats.get(proxy)
+        if stats is None:
+            return
+        alpha = self.alpha
+        stats.requests += 1
+        if stats.latency is None:
+            stats.latency = latency
+        else:
+            stats.latency += alpha * (latency - stats.latency)
+        stats.errors -= alpha * stats.errors
+        stats.backoff = 0
+
+    def failed(self, proxy, banned=False):
+        stats = self.stats.get(proxy)
+        if stats is None:
+            return
+        stats.requests += 1
+        stats.failures += 1
+        stats.errors += self.alpha * (1 - stats.errors)
+        if banned:
+            stats.bans += 1
+            self.quarantine(stats)
+        elif stats.errors > self.max_errors:
+            self.quarantine(stats)
+
+    def quarantine(self, stats, now=None):
+        now = now or monotonic()
+        if stats.quarantined_until > now:
+            return
+        stats.backoff = min(stats.backoff * 2 or self.min_backoff, self.max_backoff)
+        stats.quarantined_until = now + stats.backoff
+        # start over once the quarantine is served
+        stats.errors = self.max_errors / 2
+
+    @property
+    def status(self):
+        now = monotonic()
+        stats = self.stats.values()
+        quarantined = sum(s.quarantined_until > now for s in stats)
+        latencies = [s.latency * 1000 for s in stats if s.latency is not None] or [0]
+        requests = sum(s.requests for s in stats)
+        failures = sum(s.failures for s in stats)
+        return ('Proxies: {} usable, {} quarantined, {} bans, latency: min {:.0f}ms, '
+                'med {:.0f}ms, max {:.0f}ms, errors: {:.1%}').format(
+                    len(self.stats) - quarantined, quarantined,
+                    sum(s.bans for s in stats),
+                    min(latencies), median(latencies), max(latencies),
+                    failures / requests if requests else 0)
@@ -0,0 +1,109 @@
+"""Latest state of every worker, for the live worker map
+
+The scanner writes each worker's state into flat arrays after every visit
+and saves them as a snapshot every few seconds. Web processes read the
+latest snapshot, which is replaced atomically, so neither side waits for
+the other.
+"""
+
+from array import array
+from os import stat
+from time import monotonic, time
+
+from .snapshot import dump_snapshot, load_snapshot, snapshot_path, iter_points, SnapshotError
+
+VERSION = 1
+
+
+class Roster:
+    """States of the workers as of their last visits"""
+    def __init__(self, size):
+        self.size = size
+        self.points = array('d', bytes(16 * size))
+        self.times = array('d', bytes(8 * size))
+        self.speeds = array('d', bytes(8 * size))
+        # total seen, visits, and seen on the last visit of each worker
+        self.counts = array('I', bytes(12 * size))
+        # workers that have visited a point so far
+        self.visited = bytearray(size)
+        # whether a worker changed since the last copy
+        self.changed = False
+        self.copied = 0.0
+
+    def update(self, worker_no, point, timestamp, speed, total_seen, visits, seen_here):
+        self.points[worker_no * 2] = point[0]
+        self.points[worker_no * 2 + 1] = point[1]
+        self.times[worker_no] = timestamp
+        self.speeds[worker_no] = speed
+        position = worker_no * 3
+        self.counts[position] = total_seen
+        self.counts[position + 1] = visits
+        self.counts[position + 2] = seen_here
+        self.visited[worker_no] = 1
+        self.changed = True
+
+    def copy(self, heartbeat=30):
+        """Return copies of the arrays to dump in another thread, or None if
+        no worker changed since the last copy.
+
+        A copy is made every heartbeat seconds regardless, so that readers
+        can tell the scanner is still running.
+        """
+        now = monotonic()
+        if not self.changed and now - self.copied < heartbeat:
+            return None
+        self.changed = False
+        self.copied = now
+        return {
+            'points': self.points[:],
+            'times': self.times[:],
+            'speeds': self.speeds[:],
+            'counts': self.counts[:],
+            'visited': bytes(self.visited)
+        }
+
+    @staticmethod
+    def dump(sections):
+        dump_snapshot('workers', {'version': VERSION, 'time': time()}, sections)
+
+
+class RosterReader:
+    """Reads the worker states saved by the scanner, only loading the
+    snapshot again when it has been replaced.
+    """
+    def __init__(self, max_age=60):
+        self.location = snapshot_path('workers')
+        self.max_age = max_age
+        self.modified = None
+        self.saved = 0
+        self.items = []
+
+    def load(self):
+        snapshot = load_snapshot('workers')
+        if snapshot.meta.get('version') != VERSION:
+            return []
+        self.saved = snapshot.meta['time']
+        counts = snapshot['counts']
+        times = snapshot['times']
+        speeds = snapshot['speeds']
+        return [(worker_no, (point, times[worker_no], speeds[worker_no],
+                             counts[worker_no * 3], counts[worker_no * 3 + 1],
+                             counts[worker_no * 3 + 2]))
+                for worker_no, (point, visited) in enumerate(
+                    zip(iter_points(snapshot['points']), snapshot['visited']))
+                if visited]
+
+    @property
+    def data(self):
+        try:
+            modified = stat(self.location).st_mtime_ns
+            if modified != self.modified:
+                self.items = self.load()
+                self.modified = modified
+        except (FileNotFoundError, SnapshotError, KeyError):
+            self.items = []
+            self.modified = None
+        if time() - self.saved > self.max_age:
+            # the scanner isn't running
+            return []
+        return self.items
@@ -30,16 +30,24 @@ _valid_types = {
     'BOOTSTRAP_RADIUS': Number,
     'BOUNDARIES': object,
     'CACHE_CELLS': bool,
+    'CACHE_LIMIT': int,
+    'CACHE_PICKLE_INTERVAL': Number,
     'CAPTCHAS_ALLOWED': int,
     'CAPTCHA_KEY': str,
+    'COALESCE_RADIUS': Number,
+    'COALESCE_WINDOW': Number,
     'COMPLETE_TUTORIAL': bool,
     'COROUTINES_LIMIT': int,
+    'COROUTINES_MAX': int,
     'DB': dict,
+    'DB_BATCH_SIZE': int,
+    'DB_BATCH_WAIT': Number,
     'DB_ENGINE': str,
     'DIRECTORY': path,
     'DISCORD_INVITE_ID': str,
     'ENCOUNTER': str,
     'ENCOUNTER_IDS': set_sequence_range,
+    'ENCOUNTER_LIMIT': int,
     'FAILURES_ALLOWED': int,
     'FAVOR_CAPTCHA': bool,
     'FB_PAGE_ID': str,
@@ -89,6 +97,8 @@ _valid_types = {
     'PASS': str,
     'PB_API_KEY': str,
     'PB_CHANNEL': int,
+    'PLANNER_WINDOW': Number,
+    'PRECOMPUTE_CELLS': int,
     'PLAYER_LOCALE': dict,
     'PROVIDER': str,
     'PROXIES': set_sequence,
@@ -110,6 +120,7 @@ _valid_types = {
     'SPEED_UNIT': str,
     'SPIN_COOLDOWN': Number,
     'SPIN_POKESTOPS': bool,
+    'STANDBY_ACCOUNTS': int,
     'STAT_REFRESH': Number,
     'STAY_WITHIN_MAP': bool,
     'SWAP_OLDEST': Number,
@@ -142,15 +153,23 @@ _defaults = {
     'BOOTSTRAP_RADIUS': 120,
     'BOUNDARIES': None,
     'CACHE_CELLS': False,
+    'CACHE_LIMIT': None,
+    'CACHE_PICKLE_INTERVAL': None,
     'CAPTCHAS_ALLOWED': 3,
     'CAPTCHA_KEY': None,
+    'COALESCE_RADIUS': 25,
+    'COALESCE_WINDOW': None,
     'COMPLETE_TUTORIAL': False,
     'CONTROL_SOCKS': None,
     'COROUTINES_LIMIT': worker_count,
+    'COROUTINES_MAX': None,
+    'DB_BATCH_SIZE': 500,
+    'DB_BATCH_WAIT': 1,
     'DIRECTORY': '.',
     'DISCORD_INVITE_ID': None,
     'ENCOUNTER': None,
     'ENCOUNTER_IDS': None,
+    'ENCOUNTER_LIMIT': max(worker_count // 4, 1),
     'FAVOR_CAPTCHA': True,
     'FAILURES_ALLOWED': 2,
     'FB_PAGE_ID': None,
@@ -194,6 +213,8 @@ _defaults = {
     'PASS': None,
     'PB_API_KEY': None,
     'PB_CHANNEL': None,
+    'PLANNER_WINDOW': None,
+    'PRECOMPUTE_CELLS': None,
     'PLAYER_LOCALE': {'country': 'US', 'language': 'en', 'timezone': 'America/Denver'},
     'PROVIDER': None,
     'PROXIES': None,
@@ -215,6 +236,7 @@ _defaults = {
     'SPEED_UNIT': 'miles',
     'SPIN_COOLDOWN': 300,
     'SPIN_POKESTOPS': True,
+    'STANDBY_ACCOUNTS': 0,
     'STAT_REFRESH': 5,
     'STAY_WITHIN_MAP': True,
     'SWAP_OLDEST': 21600 / worker_count,
@@ -0,0 +1,197 @@
+from array import array
+from heapq import merge
+from operator import itemgetter
+
+_seconds = itemgetter(3)
+
+
+def _id_array(spawn_ids):
+    """Store integer spawn IDs in an array, or a list if they're strings"""
+    try:
+        return array('Q', spawn_ids)
+    except (TypeError, OverflowError):
+        return list(spawn_ids)
+
+
+class SpawnSchedule:
+    """Spawns with known times, stored in parallel arrays sorted by time
+
+    Iterating, items() and values() give the same results as the
+    OrderedDict of {(lat, lon): (spawn_id, spawn_seconds)} it replaces.
+    Schedules aren't modified once built, so they can be read from any
+    thread while a new one is being built, and their arrays may be read-only
+    views of a snapshot.
+    """
+    __slots__ = ('lats', 'lons', 'spawn_ids', 'seconds', 'despawns', 'order')
+
+    def __init__(self, rows=()):
+        """rows are (lat, lon, spawn_id, spawn_seconds, despawn_seconds)
+        tuples, already sorted by spawn_seconds.
+        """
+        self.lats = array('d')
+        self.lons = array('d')
+        self.seconds = array('H')
+        self.despawns = array('H')
+        spawn_ids = []
+        for lat, lon, spawn_id, spawn_seconds, despawn_seconds in rows:
+            self.lats.append(lat)
+            self.lons.append(lon)
+            spawn_ids.append(spawn_id)
+            self.seconds.append(spawn_seconds)
+            self.despawns.append(despawn_seconds)
+        self.spawn_ids = _id_array(spawn_ids)
+        self._index()
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(sorted(rows, key=_seconds))
+
+    def _index(self):
+        # row numbers sorted by spawn ID, for binary searches
+        spawn_ids = self.spawn_ids
+        self.order = array('I', sorted(range(len(spawn_ids)),
+                                       key=spawn_ids.__getitem__))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Use the sections of a snapshot without copying them."""
+        schedule = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(schedule, name, snapshot[name])
+        return schedule
+
+    def sections(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def __bool__(self):
+        return len(self.seconds) > 0
+
+    def __iter__(self):
+        return zip(self.lats, self.lons)
+
+    def items(self):
+        for lat, lon, spawn_id, seconds in zip(
+                self.lats, self.lons, self.spawn_ids, self.seconds):
+            yield (lat, lon), (spawn_id, seconds)
+
+    def values(self):
+        return zip(self.spawn_ids, self.seconds)
+
+    def rows(self):
+        return zip(self.lats, self.lons, self.spawn_ids, self.seconds,
+                   self.despawns)
+
+    def last(self):
+        """Return the point and (spawn_id, spawn_seconds) of the latest spawn."""
+        return ((self.lats[-1], self.lons[-1]),
+                (self.spawn_ids[-1], self.seconds[-1]))
+
+    def row(self, spawn_id):
+        spawn_ids = self.spawn_ids
+        order = self.order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if spawn_ids[order[mid]] < spawn_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and spawn_ids[order[lo]] == spawn_id:
+            return order[lo]
+        raise KeyError(spawn_id)
+
+    def __contains__(self, spawn_id):
+        try:
+            self.row(spawn_id)
+            return True
+        except KeyError:
+            return False
+
+    def despawn_time(self, spawn_id):
+        return self.despawns[self.row(spawn_id)]
+
+    def merged(self, rows, exclude):
+        """Return a new schedule with rows added, and without the spawns at
+        the points in exclude.
+        """
+        kept = (row for row in self.rows() if (row[0], row[1]) not in exclude)
+        return SpawnSchedule(merge(kept, sorted(rows, key=_seconds), key=_seconds))
+
+
+class DespawnTimes:
+    """Mapping of {spawn_id: despawn_seconds}
+
+    Values are read from a SpawnSchedule, changes made since the schedule
+    was built are kept in a small dict.
+    """
+    def __init__(self, schedule=None):
+        self.schedule = schedule or SpawnSchedule()
+        # {spawn_id: despawn_seconds, or None if removed}
+        self.changes = {}
+
+    def __getitem__(self, spawn_id):
+        try:
+            despawn_time = self.changes[spawn_id]
+        except KeyError:
+            return self.schedule.despawn_time(spawn_id)
+        if despawn_time is None:
+            raise KeyError(spawn_id)
+        return despawn_time
+
+    def __setitem__(self, spawn_id, despawn_time):
+        self.changes[spawn_id] = despawn_time
+
+    def __delitem__(self, spawn_id):
+        self[spawn_id]
+        self.changes[spawn_id] = None
+
+    def __contains__(self, spawn_id):
+        try:
+            self[spawn_id]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        schedule = self.schedule
+        length = len(schedule)
+        for spawn_id, despawn_time in list(self.changes.items()):
+            scheduled = spawn_id in schedule
+            if despawn_time is None and scheduled:
+                length -= 1
+            elif despawn_time is not None and not scheduled:
+                length += 1
+        return length
+
+    def get(self, spawn_id, default=None):
+        try:
+            return self[spawn_id]
+        except KeyError:
+            return default
+
+    def pop(self, spawn_id, default=None):
+        try:
+            despawn_time = self[spawn_id]
+        except KeyError:
+            return default
+        self.changes[spawn_id] = None
+        return despawn_time
+
+    def rebase(self, schedule):
+        """Switch to a new schedule, dropping the changes it already has.
+
+        The changes are pruned in place since they may be modified by the
+        DB processor at the same time.
+        """
+        self.schedule = schedule
+        changes = self.changes
+        for spawn_id, despawn_time in list(changes.items()):
+            try:
+                scheduled = schedule.despawn_time(spawn_id)
+            except KeyError:
+                scheduled = None
+            if despawn_time == scheduled and changes.get(spawn_id) == scheduled:
+                changes.pop(spawn_id, None)
@@ -1,6 +1,8 @@
 from logging import getLogger, LoggerAdapter
-from concurrent.futures import ThreadPoolExecutor
-from time import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import cpu_count
+from signal import signal, SIGINT, SIG_IGN
+from time import monotonic, time
 from asyncio import get_event_loop
 
 from aiohttp import ClientSession
@@ -75,6 +77,80 @@ def call_at(when, cb, *args):
     return call_later(delay, cb, *args)
 
 
-async def run_threaded(cb, *args):
-    with ThreadPoolExecutor(max_workers=1) as x:
-        return await LOOP.run_in_executor(x, cb, *args)
+def pool_init():
+    # the scanner handles Ctrl-C and shuts the pools down when it's done
+    signal(SIGINT, SIG_IGN)
+
+
+class Pool:
+    """Executor that's created when first used and keeps track of how many
+    jobs are queued and how long they take
+    """
+    def __init__(self, name, workers, processes=False):
+        self.name = name
+        self.workers = workers
+        self.processes = processes
+        self.executor = None
+        # submitted but not finished
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        # seconds from submission to completion
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    async def run(self, cb, *args):
+        if self.executor is None:
+            if self.processes:
+                try:
+                    self.executor = ProcessPoolExecutor(self.workers, initializer=pool_init)
+                except TypeError:
+                    # initializer requires Python 3.7
+                    self.executor = ProcessPoolExecutor(self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(self.workers)
+        start = monotonic()
+        self.queued += 1
+        try:
+            return await LOOP.run_in_executor(self.executor, cb, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = monotonic() - start
+            self.queued -= 1
+            self.completed += 1
+            self.latency += elapsed
+            if elapsed > self.max_latency:
+                self.max_latency = elapsed
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait)
+            self.executor = None
+
+    @property
+    def status(self):
+        return '{}: {} queued, {} done, {} failed, {:.0f}ms avg, {:.0f}ms max'.format(
+            self.name, self.queued, self.completed, self.failed,
+            self.latency / self.completed * 1000 if self.completed else 0,
+            self.max_latency * 1000)
+
+
+POOLS = {
+    # file dumps and other short jobs
+    'io': Pool('io', 4),
+    # database queries
+    'db': Pool('db', 2),
+    # CPU-heavy jobs, their callables and arguments must be picklable
+    'cpu': Pool('cpu', cpu_count() or 1, processes=True)
+}
+
+
+async def run_threaded(cb, *args, pool='io'):
+    return await POOLS[pool].run(cb, *args)
+
+
+def shutdown_pools(wait=True):
+    for pool in POOLS.values():
+        pool.shutdown(wait)
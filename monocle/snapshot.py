@@ -0,0 +1,164 @@
+"""Versioned binary snapshots of arrays that can be memory-mapped
+
+A snapshot file is laid out as:
+
+    magic (8 bytes), header length (uint32), header CRC-32 (uint32)
+    header (UTF-8 JSON)
+    sections, each aligned to 8 bytes
+
+The header holds arbitrary metadata and the typecode, offset, length and
+CRC-32 of every section. Sections are only read and verified when they're
+first accessed. Snapshots are written to a temporary file that's renamed
+over the old one, so a crash never leaves a partial snapshot behind.
+"""
+
+from array import array
+from itertools import chain
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+from os import mkdir, replace
+from os.path import join
+from struct import Struct
+from sys import platform
+from zlib import crc32
+
+from . import sanitized as conf
+
+MAGIC = b'MONOCLE\x01'
+PREFIX = Struct('<8sII')
+ALIGNMENT = 8
+
+
+class SnapshotError(ValueError):
+    """Raised for corrupt snapshots or ones in an unknown format"""
+
+
+def snapshot_path(name):
+    return join(conf.DIRECTORY, 'pickles', '{}.snapshot'.format(name))
+
+
+def points_array(points):
+    """Flatten (lat, lon) pairs into an array of doubles."""
+    return array('d', chain.from_iterable(points))
+
+
+def iter_points(flat):
+    """Iterate over (lat, lon) pairs flattened by points_array()."""
+    return zip(flat[0::2], flat[1::2])
+
+
+def dump_snapshot(name, meta, sections):
+    """Save metadata that can be encoded as JSON, and sections.
+
+    Sections may be arrays, bytes, or lists of strings.
+    """
+    folder = join(conf.DIRECTORY, 'pickles')
+    try:
+        mkdir(folder)
+    except FileExistsError:
+        pass
+    except Exception as e:
+        raise OSError("Failed to create 'pickles' folder, please create it manually") from e
+
+    buffers = []
+    table = {}
+    offset = 0
+    for section, data in sections.items():
+        if isinstance(data, array):
+            typecode = data.typecode
+        elif isinstance(data, memoryview):
+            typecode = data.format
+        elif isinstance(data, list):
+            typecode = 'str'
+            data = '\n'.join(data).encode('utf-8')
+        else:
+            typecode = 'B'
+        data = memoryview(data).cast('B')
+        table[section] = {
+            'typecode': typecode,
+            'offset': offset,
+            'length': len(data),
+            'crc32': crc32(data)
+        }
+        padding = -len(data) % ALIGNMENT
+        buffers.append((data, padding))
+        offset += len(data) + padding
+
+    header = dumps({'meta': meta, 'sections': table}).encode('utf-8')
+    # sections start on an aligned offset after the header
+    header += b' ' * (-(PREFIX.size + len(header)) % ALIGNMENT)
+
+    location = snapshot_path(name)
+    temporary = location + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(header), crc32(header)))
+        f.write(header)
+        for data, padding in buffers:
+            f.write(data)
+            f.write(b'\0' * padding)
+    replace(temporary, location)
+
+
+def load_snapshot(name):
+    """Open a snapshot, raises FileNotFoundError if there isn't one."""
+    return Snapshot(snapshot_path(name))
+
+
+class Snapshot:
+    """Read-only view of a snapshot file"""
+    def __init__(self, location):
+        with open(location, 'rb') as f:
+            if platform == 'win32':
+                # mapped files can't be replaced on Windows
+                self.buffer = memoryview(f.read())
+            else:
+                try:
+                    self.buffer = memoryview(mmap(f.fileno(), 0, access=ACCESS_READ))
+                except ValueError:
+                    # empty file
+                    self.buffer = memoryview(b'')
+        if len(self.buffer) < PREFIX.size:
+            raise SnapshotError('Truncated snapshot: {}'.format(location))
+        magic, length, checksum = PREFIX.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise SnapshotError('Unknown snapshot format: {}'.format(location))
+        header = self.buffer[PREFIX.size:PREFIX.size + length]
+        if len(header) != length or crc32(header) != checksum:
+            raise SnapshotError('Corrupt snapshot header: {}'.format(location))
+        header = loads(bytes(header).decode('utf-8'))
+        self.meta = header['meta']
+        self.sections = header['sections']
+        self.start = PREFIX.size + length
+        self.location = location
+        self.cache = {}
+
+    def __contains__(self, section):
+        return section in self.sections
+
+    def __getitem__(self, section):
+        """Return a section as a memoryview, or a list for strings."""
+        try:
+            return self.cache[section]
+        except KeyError:
+            pass
+        info = self.sections[section]
+        start = self.start + info['offset']
+        data = self.buffer[start:start + info['length']]
+        if len(data) != info['length'] or crc32(data) != info['crc32']:
+            raise SnapshotError('Corrupt {} section in {}'.format(section, self.location))
+        typecode = info['typecode']
+        if typecode == 'str':
+            value = bytes(data).decode('utf-8').split('\n') if data else []
+        else:
+            value = data.cast(typecode)
+        self.cache[section] = value
+        return value
+
+    def array(self, section):
+        """Return a modifiable copy of a section."""
+        data = self[section]
+        if isinstance(data, list):
+            return list(data)
+        copy = array(data.format)
+        copy.frombytes(data.cast('B'))
+        return copy
@@ -0,0 +1,211 @@
+from math import ceil, cos, floor, radians
+
+from pogeo import get_distance
+
+# approximate length of one degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+class Grid:
+    """Square cells cell_size meters wide at the reference latitude"""
+    def __init__(self, cell_size=100, ref_lat=0.0):
+        self.cell_size = cell_size
+        self.ref_cos = max(cos(radians(ref_lat)), 0.01)
+        self.lat_step = cell_size / METERS_PER_DEGREE
+        self.lon_step = cell_size / (METERS_PER_DEGREE * self.ref_cos)
+
+    def cell(self, point):
+        return floor(point[0] / self.lat_step), floor(point[1] / self.lon_step)
+
+    def ring(self, cell, distance):
+        """Return the cells exactly distance cells away from cell."""
+        row, column = cell
+        if distance == 0:
+            return (cell,)
+        top, bottom = row - distance, row + distance
+        left, right = column - distance, column + distance
+        cells = [(top, c) for c in range(left, right + 1)]
+        cells.extend((bottom, c) for c in range(left, right + 1))
+        cells.extend((r, left) for r in range(top + 1, bottom))
+        cells.extend((r, right) for r in range(top + 1, bottom))
+        return cells
+
+    def ring_clearance(self, point, distance):
+        """Minimum distance in meters from point to anything outside the
+        first distance rings around its cell.
+        """
+        scale = min(1.0, max(cos(radians(point[0])), 0.01) / self.ref_cos)
+        # a little slack for the difference between haversine and the grid
+        return distance * self.cell_size * scale * 0.99
+
+
+class GridIndex(Grid):
+    """Set of (lat, lon) points, bucketed into a grid of square cells
+
+    Membership tests are a single set lookup and proximity queries only look
+    at the cells within range, so neither depends on the number of points.
+    Cells are cell_size meters wide at the reference latitude.
+    """
+    def __init__(self, points=(), cell_size=100, ref_lat=0.0):
+        super().__init__(cell_size, ref_lat)
+        # {point}
+        self.points = set()
+        # {(row, column): {point}}
+        self.cells = {}
+        for point in points:
+            self.add(point)
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, point):
+        return point in self.points
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def add(self, point):
+        if point in self.points:
+            return
+        self.points.add(point)
+        key = self.cell(point)
+        try:
+            self.cells[key].add(point)
+        except KeyError:
+            self.cells[key] = {point}
+
+    def discard(self, point):
+        if point not in self.points:
+            return
+        self.points.discard(point)
+        key = self.cell(point)
+        cell = self.cells[key]
+        cell.discard(point)
+        if not cell:
+            del self.cells[key]
+
+    def move(self, old, new):
+        self.discard(old)
+        self.add(new)
+
+    def clear(self):
+        self.points.clear()
+        self.cells.clear()
+
+    def within(self, point, radius):
+        """Yield the points within radius meters of point."""
+        rings = ceil(radius / self.cell_size)
+        row, column = self.cell(point)
+        cells = self.cells
+        for r in range(row - rings, row + rings + 1):
+            for c in range(column - rings, column + rings + 1):
+                try:
+                    cell = cells[r, c]
+                except KeyError:
+                    continue
+                for p in cell:
+                    if get_distance(point, p) <= radius:
+                        yield p
+
+    def near(self, point, radius):
+        """Are there any points within radius meters of point?"""
+        if point in self.points:
+            return True
+        for _ in self.within(point, radius):
+            return True
+        return False
+
+
+class GridMap(Grid):
+    """Mapping of {key: (lat, lon)}, with the keys bucketed into a grid of
+    square cells by their point
+
+    Several keys may share a point. The rows and columns that have ever been
+    occupied are tracked so searches around a point know when to stop.
+    """
+    def __init__(self, cell_size=100, ref_lat=0.0):
+        super().__init__(cell_size, ref_lat)
+        # {key: point}
+        self.points = {}
+        # {(row, column): {key}}
+        self.cells = {}
+        # (min row, max row, min column, max column)
+        self.extent = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def __getitem__(self, key):
+        return self.points[key]
+
+    def set(self, key, point):
+        try:
+            old = self.points[key]
+        except KeyError:
+            pass
+        else:
+            if old == point:
+                return
+            self._remove(key, old)
+        self.points[key] = point
+        cell = self.cell(point)
+        try:
+            self.cells[cell].add(key)
+        except KeyError:
+            self.cells[cell] = {key}
+        row, column = cell
+        extent = self.extent
+        if extent is None:
+            self.extent = (row, row, column, column)
+        elif not (extent[0] <= row <= extent[1] and extent[2] <= column <= extent[3]):
+            self.extent = (min(extent[0], row), max(extent[1], row),
+                           min(extent[2], column), max(extent[3], column))
+
+    def discard(self, key):
+        try:
+            point = self.points.pop(key)
+        except KeyError:
+            return
+        self._remove(key, point)
+
+    def _remove(self, key, point):
+        cell = self.cell(point)
+        keys = self.cells[cell]
+        keys.discard(key)
+        if not keys:
+            del self.cells[cell]
+
+    def clear(self):
+        self.points.clear()
+        self.cells.clear()
+        self.extent = None
+
+    def span(self, point):
+        """Number of rings around point needed to reach every occupied cell."""
+        if self.extent is None:
+            return -1
+        row, column = self.cell(point)
+        top, bottom, left, right = self.extent
+        return max(row - top, bottom - row, column - left, right - column, 0)
+
+    def rings(self, point, limit=None):
+        """Yield (distance, keys) for each ring of cells around point, nearest
+        first, stopping after limit rings or once every occupied cell has
+        been passed.
+        """
+        span = self.span(point)
+        if limit is not None:
+            span = min(span, limit)
+        center = self.cell(point)
+        cells = self.cells
+        for distance in range(span + 1):
+            keys = []
+            for cell in self.ring(center, distance):
+                try:
+                    keys.extend(cells[cell])
+                except KeyError:
+                    continue
+            yield distance, keys
@@ -1,29 +1,40 @@
 import sys
 
-from collections import deque, OrderedDict
+from collections import deque
 from time import time
 from itertools import chain
 from hashlib import sha256
+from threading import Lock
+
+from sqlalchemy import or_
 
 from . import bounds, db, sanitized as conf
+from .schedule import SpawnSchedule, DespawnTimes
 from .shared import get_logger
-from .utils import dump_pickle, load_pickle, get_current_hour, time_until_time
+from .spatial import GridIndex
+from .snapshot import dump_snapshot, load_snapshot, iter_points, points_array
+from .utils import get_current_hour, time_until_time
 
 
 class BaseSpawns:
     """Manage spawn points and times"""
     def __init__(self):
         ## Spawns with known times
-        # {(lat, lon): (spawn_id, spawn_seconds)}
-        self.known = OrderedDict()
+        # sorted by spawn time, iterates like {(lat, lon): (spawn_id, spawn_seconds)}
+        self.known = SpawnSchedule()
         # {spawn_id: despawn_seconds}
-        self.despawn_times = {}
+        self.despawn_times = DespawnTimes(self.known)
 
         ## Spawns with unknown times
         # {(lat, lon)}
         self.unknown = set()
 
-        self.class_version = 3
+        # spawn IDs changed without their updated time being bumped
+        self.changed = set()
+        # only rows updated after this time need to be reloaded
+        self.watermark = 0
+
+        self.class_version = 6
         self.db_hash = sha256(conf.DB_ENGINE.encode()).digest()
         self.log = get_logger('spawns')
 
@@ -34,43 +45,84 @@ class BaseSpawns:
         return len(self.despawn_times) > 0
 
     def update(self):
-        bound = bool(bounds)
-        last_migration = conf.LAST_MIGRATION
+        """Load spawn points from the database.
 
+        After the first load only rows updated since the previous one, or
+        changed by update_failures, are read and merged in.
+        """
+        start = time()
         with db.session_scope() as session:
             query = session.query(db.Spawnpoint)
-            if bound or conf.STAY_WITHIN_MAP:
+            if bounds or conf.STAY_WITHIN_MAP:
                 query = query.filter(db.Spawnpoint.lat >= bounds.south,
                                      db.Spawnpoint.lat <= bounds.north,
                                      db.Spawnpoint.lon >= bounds.west,
                                      db.Spawnpoint.lon <= bounds.east)
-            known = {}
-            for spawn in query:
-                point = spawn.lat, spawn.lon
-
-                # skip if point is not within boundaries (if applicable)
-                if bound and point not in bounds:
-                    continue
-
-                if not spawn.updated or spawn.updated <= last_migration:
-                    self.unknown.add(point)
-                    continue
+            if self.watermark:
+                changed, self.changed = self.changed, set()
+                condition = db.Spawnpoint.updated > self.watermark
+                if changed:
+                    condition = or_(condition, db.Spawnpoint.spawn_id.in_(changed))
+                known, unknown = self.read(query.filter(condition))
+                self.merge(known, unknown)
+                self.log.debug('Refreshed {} known and {} unknown spawns.', len(known), len(unknown))
+            else:
+                self.changed.clear()
+                known, unknown = self.read(query)
+                self.unknown.update(unknown)
+                self.known = SpawnSchedule.from_rows(
+                    (point[0], point[1]) + spawn for point, spawn in known.items())
+                self.despawn_times.rebase(self.known)
+        # overlap in case rows were written while querying
+        self.watermark = start - 60
+
+    def read(self, query):
+        """Return {(lat, lon): (spawn_id, spawn_seconds, despawn_seconds)}
+        for known spawns, and the points of unknown spawns.
+        """
+        bound = bool(bounds)
+        last_migration = conf.LAST_MIGRATION
+        cache = db.SPAWNPOINT_CACHE
+        known = {}
+        unknown = set()
+        for spawn in query:
+            cache.add(spawn)
+            point = spawn.lat, spawn.lon
+
+            # skip if point is not within boundaries (if applicable)
+            if bound and point not in bounds:
+                continue
+
+            # the cache may hold changes that haven't been written yet
+            state = cache.store.get(spawn.spawn_id, spawn)
+
+            if not state.updated or state.updated <= last_migration:
+                self.despawn_times.pop(spawn.spawn_id, None)
+                unknown.add(point)
+                continue
+
+            if state.duration == 60:
+                spawn_time = state.despawn_time
+            else:
+                spawn_time = (state.despawn_time + 1800) % 3600
 
-                if spawn.duration == 60:
-                    spawn_time = spawn.despawn_time
-                else:
-                    spawn_time = (spawn.despawn_time + 1800) % 3600
+            known[point] = spawn.spawn_id, spawn_time, state.despawn_time
+        return known, unknown
 
-                self.despawn_times[spawn.spawn_id] = spawn.despawn_time
-                known[point] = spawn.spawn_id, spawn_time
-        self.known = OrderedDict(sorted(known.items(), key=lambda k: k[1][1]))
+    def merge(self, known, unknown):
+        """Merge refreshed spawns into the sorted known spawns."""
+        self.known = self.known.merged(
+            ((point[0], point[1]) + spawn for point, spawn in known.items()),
+            known.keys() | unknown)
+        self.despawn_times.rebase(self.known)
+        self.unknown.difference_update(known)
+        self.unknown.update(unknown)
 
     def after_last(self):
         try:
-            k = next(reversed(self.known))
-            seconds = self.known[k][1]
+            seconds = self.known.last()[1][1]
             return time() % 3600 > seconds
-        except (StopIteration, KeyError, TypeError):
+        except IndexError:
             return False
 
     def get_despawn_time(self, spawn_id, seen):
@@ -85,28 +137,48 @@ class BaseSpawns:
 
     def unpickle(self):
         try:
-            state = load_pickle('spawns', raise_exception=True)
-            if all((state['class_version'] == self.class_version,
-                    state['db_hash'] == self.db_hash,
-                    state['bounds_hash'] == hash(bounds),
-                    state['last_migration'] == conf.LAST_MIGRATION)):
-                self.__dict__.update(state)
+            snapshot = load_snapshot('spawns')
+            meta = snapshot.meta
+            if all((meta['class_version'] == self.class_version,
+                    meta['db_hash'] == self.db_hash.hex(),
+                    meta['bounds_hash'] == hash(bounds),
+                    meta['last_migration'] == conf.LAST_MIGRATION)):
+                self.restore(snapshot)
                 return True
             else:
                 self.log.warning('Configuration changed, reloading spawns from DB.')
         except FileNotFoundError:
-            self.log.warning('No spawns pickle found, will create one.')
-        except (TypeError, KeyError):
-            self.log.warning('Obsolete or invalid spawns pickle type, reloading from DB.')
+            self.log.warning('No spawns snapshot found, will create one.')
+        except (ValueError, TypeError, KeyError):
+            self.log.warning('Obsolete or invalid spawns snapshot, reloading from DB.')
         return False
 
+    def restore(self, snapshot):
+        meta = snapshot.meta
+        self.known = SpawnSchedule.from_snapshot(snapshot)
+        self.despawn_times = DespawnTimes(self.known)
+        self.despawn_times.changes.update(meta['despawn_changes'])
+        self.unknown = set(iter_points(snapshot['unknown']))
+        self.changed = set(meta['changed'])
+        self.watermark = meta['watermark']
+
     def pickle(self):
-        state = self.__dict__.copy()
-        del state['log']
-        state.pop('cells_count', None)
-        state['bounds_hash'] = hash(bounds)
-        state['last_migration'] = conf.LAST_MIGRATION
-        dump_pickle('spawns', state)
+        """Save a snapshot of the spawns"""
+        meta = {
+            'class_version': self.class_version,
+            'db_hash': self.db_hash.hex(),
+            'bounds_hash': hash(bounds),
+            'last_migration': conf.LAST_MIGRATION,
+            'watermark': self.watermark,
+            'changed': list(self.changed.copy()),
+            'despawn_changes': list(self.despawn_times.changes.copy().items())
+        }
+        sections = self.known.sections()
+        sections.update(self.sections())
+        dump_snapshot('spawns', meta, sections)
+
+    def sections(self):
+        return {'unknown': points_array(self.unknown.copy())}
 
     @property
     def total_length(self):
@@ -128,14 +200,6 @@ class Spawns(BaseSpawns):
     def add_unknown(self, point):
         self.unknown.add(point)
 
-    def unpickle(self):
-        result = super().unpickle()
-        try:
-            del self.cell_points
-        except AttributeError:
-            pass
-        return result
-
     def mystery_gen(self):
         for mystery in self.unknown.copy():
             yield mystery
@@ -150,23 +214,75 @@ class MoreSpawns(BaseSpawns):
         # {(lat, lon)}
         self.cell_points = set()
 
+        # every known, unknown, and cell point
+        self.index = GridIndex(ref_lat=bounds.center[0])
+        # points added while the index is rebuilt on another thread
+        self.added = None
+        self.lock = Lock()
+
+    def update(self):
+        super().update()
+        self.reindex()
+
+    def unpickle(self):
+        result = super().unpickle()
+        if result:
+            self.reindex()
+        return result
+
+    def restore(self, snapshot):
+        super().restore(snapshot)
+        self.cell_points = set(iter_points(snapshot['cell_points']))
+
+    def sections(self):
+        sections = super().sections()
+        sections['cell_points'] = points_array(self.cell_points.copy())
+        return sections
+
+    def reindex(self):
+        """Rebuild the index from copies of the points, then add any points
+        that were added meanwhile before replacing it.
+        """
+        with self.lock:
+            self.added = []
+        index = GridIndex(chain(self.cell_points.copy(), self.known, self.unknown.copy()),
+                          ref_lat=bounds.center[0])
+        with self.lock:
+            for point in self.added:
+                index.add(point)
+            self.added = None
+            self.index = index
+
+    def index_point(self, point):
+        with self.lock:
+            self.index.add(point)
+            if self.added is not None:
+                self.added.append(point)
+
     def items(self):
-        # return a copy since it may be modified
-        return self.known.copy().items()
+        return self.known.items()
 
     def add_known(self, spawn_id, despawn_time, point):
         self.despawn_times[spawn_id] = despawn_time
         # add so that have_point() will be up to date
-        self.known[point] = None
+        self.index_point(point)
         self.unknown.discard(point)
         self.cell_points.discard(point)
 
     def add_unknown(self, point):
         self.unknown.add(point)
+        self.index_point(point)
         self.cell_points.discard(point)
 
+    def add_cell_point(self, point):
+        self.cell_points.add(point)
+        self.index_point(point)
+
     def have_point(self, point):
-        return point in chain(self.cell_points, self.known, self.unknown)
+        return point in self.index
+
+    def near_point(self, point, radius):
+        return self.index.near(point, radius)
 
     def mystery_gen(self):
         for mystery in chain(self.unknown.copy(), self.cell_points.copy()):
@@ -0,0 +1,200 @@
+"""Extra accounts that are logged in ahead of time
+
+Swapping accounts normally leaves a worker idle while the new account logs
+in and simulates the app's startup. A StandbyPool logs a few extra accounts
+in while no worker needs them, keeps their access tokens fresh, and hands
+them to workers that swap.
+"""
+
+from asyncio import CancelledError
+from collections import deque
+from queue import Empty
+from time import time
+
+from aiopogo import exceptions as ex
+
+from . import altitudes, sanitized as conf
+from .hashkeys import OPTIONAL
+from .shared import get_logger, LOOP
+from .worker import Worker, CaptchaException
+
+
+class StandbyError(Exception):
+    """Raised instead of swapping out a standby account"""
+
+
+class Standby(Worker):
+    """An extra account that logs in while no worker needs it"""
+    # not a member of the fleet, so these are plain attributes
+    location = None
+    last_request = 0
+    # logging in ahead of time can wait for requests that are needed now
+    priority = OPTIONAL
+
+    def __init__(self, account, number):
+        self.worker_no = number % (conf.GRID[0] * conf.GRID[1])
+        self.log = get_logger('standby-{}'.format(number))
+        self.account = account
+        self.altitude = None
+        self.item_capacity = 350
+        self.error_code = None
+        self.load_account()
+
+    async def swap_account(self, reason=''):
+        raise StandbyError(reason)
+
+    @property
+    def expiry(self):
+        try:
+            return self.api.auth_provider._access_token_expiry
+        except AttributeError:
+            return None
+
+    async def prepare(self):
+        """Log in and simulate the app's startup, return True if the account
+        is ready to be used.
+        """
+        try:
+            try:
+                self.altitude = altitudes.get(self.location)
+            except KeyError:
+                self.altitude = await altitudes.fetch(self.location)
+            self.api.set_position(*self.location, self.altitude)
+            if not self.authenticated:
+                await self.login()
+            return True
+        except CancelledError:
+            raise
+        except CaptchaException:
+            self.log.warning('{} needs a CAPTCHA solved.', self.username)
+            self.update_accounts_dict(captcha=True)
+            self.captcha_queue.put(self.account)
+        except ex.BannedAccountException:
+            self.log.warning('{} is banned', self.username)
+            self.update_accounts_dict(banned=True)
+        except (StandbyError, ex.AiopogoError, ex.AuthException) as e:
+            self.log.warning('Failed to log in {}: {}', self.username, e)
+            self.release()
+        except Exception as e:
+            self.log.exception('A wild {} appeared!', e.__class__.__name__)
+            self.release()
+        return False
+
+    def release(self):
+        """Put the account back in the queue of extra accounts."""
+        self.update_accounts_dict()
+        if self.proxies:
+            self.proxies.release(self.api.proxy)
+        self.extra_queue.put(self.account)
+
+
+class StandbyPool:
+    """Keeps up to size extra accounts logged in for workers to take
+
+    Accounts whose access tokens expire within margin seconds are logged in
+    again, checking every interval seconds.
+    """
+    def __init__(self, size, margin=300, interval=60):
+        self.size = size
+        self.margin = margin
+        self.interval = interval
+        self.log = get_logger('standby')
+        self.ready = deque()
+        # {task: standby} of accounts that are logging in
+        self.preparing = {}
+        self.created = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.handle = None
+        self.closed = False
+
+    def __len__(self):
+        return len(self.ready)
+
+    def start(self):
+        self.maintain()
+
+    def fill(self):
+        while not self.closed and len(self.ready) + len(self.preparing) < self.size:
+            try:
+                account = Worker.extra_queue.get_nowait()
+            except Empty:
+                break
+            standby = Standby(account, self.created)
+            self.created += 1
+            self._launch(standby, standby.prepare())
+
+    def take(self):
+        """Return a standby that's logged in, or None if there aren't any."""
+        try:
+            standby = self.ready.popleft()
+            self.hits += 1
+        except IndexError:
+            standby = None
+            self.misses += 1
+        self.fill()
+        return standby
+
+    def maintain(self):
+        """Refresh access tokens that are about to expire and fill the pool."""
+        expiring = time() + self.margin
+        for standby in list(self.ready):
+            expiry = standby.expiry
+            if expiry is not None and expiry < expiring:
+                self.ready.remove(standby)
+                self._launch(standby, self.refresh(standby))
+        self.fill()
+        self.handle = LOOP.call_later(self.interval, self.maintain)
+
+    async def refresh(self, standby):
+        try:
+            if await standby.login(reauth=True):
+                self.refreshed += 1
+                return True
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.log.warning('Failed to refresh {}: {}', standby.username, e)
+        standby.release()
+        return False
+
+    def _launch(self, standby, coro):
+        task = LOOP.create_task(coro)
+        self.preparing[task] = standby
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        standby = self.preparing.pop(task)
+        if task.cancelled():
+            standby.release()
+        elif task.exception() is not None:
+            self.failed += 1
+            standby.release()
+        elif not task.result():
+            # the pool is filled again by the next maintain()
+            self.failed += 1
+        elif self.closed:
+            standby.release()
+        else:
+            self.ready.append(standby)
+
+    def close(self):
+        """Put every standby account back in the queue of extra accounts."""
+        self.closed = True
+        if self.handle:
+            self.handle.cancel()
+        for task in self.preparing:
+            task.cancel()
+        while self.ready:
+            self.ready.popleft().release()
+
+    @property
+    def status(self):
+        requests = self.hits + self.misses
+        return ('Standby accounts: {} ready, {} logging in, hits: {}, misses: {} '
+                '({:.0%} hit rate), refreshed: {}, failed: {}').format(
+                    len(self.ready), len(self.preparing), self.hits, self.misses,
+                    self.hits / requests if requests else 0,
+                    self.refreshed, self.failed)
@@ -1,11 +1,10 @@
 from argparse import ArgumentParser
 from datetime import datetime
-from multiprocessing.managers import BaseManager, RemoteError
 from time import time
 
 from monocle import sanitized as conf
 from monocle.db import get_forts, Pokestop, session_scope, Sighting, Spawnpoint
-from monocle.utils import Units, get_address
+from monocle.utils import Units
 from monocle.names import DAMAGE, MOVES, POKEMON
 
 if conf.MAP_WORKERS:
@@ -42,35 +41,6 @@ def get_args():
     return parser.parse_args()
 
 
-class AccountManager(BaseManager): pass
-AccountManager.register('worker_dict')
-
-
-class Workers:
-    def __init__(self):
-        self._data = {}
-        self._manager = AccountManager(address=get_address(), authkey=conf.AUTHKEY)
-
-    def connect(self):
-        try:
-            self._manager.connect()
-            self._data = self._manager.worker_dict()
-        except (FileNotFoundError, AttributeError, RemoteError, ConnectionRefusedError, BrokenPipeError):
-            print('Unable to connect to manager for worker data.')
-            self._data = {}
-
-    @property
-    def data(self):
-        try:
-            if self._data:
-                return self._data.items()
-            else:
-                raise ValueError
-        except (FileNotFoundError, RemoteError, ConnectionRefusedError, ValueError, BrokenPipeError):
-            self.connect()
-            return self._data.items()
-
-
 def get_worker_markers(workers):
     return [{
         'lat': lat,
@@ -1,29 +1,31 @@
-from asyncio import gather, Lock, Semaphore, sleep, CancelledError
+from asyncio import gather, Semaphore, sleep, CancelledError
 from cyrandom import choice, randint, uniform
 from time import time, monotonic
 from queue import Empty
-from itertools import cycle
 from sys import exit
 from distutils.version import StrictVersion
 
-from aiopogo import PGoApi, HashServer, json_loads, exceptions as ex
+from aiopogo import PGoApi, json_loads, exceptions as ex
 from aiopogo.auth_ptc import AuthPtc
 from pogeo import get_distance
 
 from .db import SIGHTING_CACHE, MYSTERY_CACHE
-from .utils import round_coords, load_pickle, get_device_info, get_spawn_id, get_start_coords, Units, randomize_point
-from .shared import get_logger, LOOP, SessionManager, run_threaded, ACCOUNTS
+from .encounters import NOTIFY, WANTED, OTHER
+from .utils import get_device_info, get_spawn_id, get_start_coords, Units, randomize_point
+from .shared import get_logger, LOOP, SessionManager, ACCOUNTS
+from .accounts import CAPTCHA_QUEUE, EXTRA_QUEUE
+from .fleet import Fleet, BusyLock
+from .hashkeys import HASH_KEYS, HASH_SCHEDULER, KNOWN, ENCOUNTER, UNKNOWN, OPTIONAL
+from .metrics import METRICS
+from .proxies import ProxyPool
+from .roster import Roster
 from . import altitudes, avatar, bounds, db_proc, spawns, sanitized as conf
 
 if conf.NOTIFY:
     from .notification import Notifier
 
 if conf.CACHE_CELLS:
-    from array import typecodes
-    if 'Q' in typecodes:
-        from pogeo import get_cell_ids_compact as _pogeo_cell_ids
-    else:
-        from pogeo import get_cell_ids as _pogeo_cell_ids
+    from .cells import CellGrid
 else:
     from pogeo import get_cell_ids as _pogeo_cell_ids
 
@@ -42,6 +44,12 @@ if conf.SPIN_POKESTOPS:
 UNIT = _unit.value
 del _unit
 
+# attributes that belong to the account a worker is using
+ACCOUNT_STATE = (
+    'account', 'username', 'api', 'altitude', 'empty_visits', 'eggs',
+    'inventory_timestamp', 'item_capacity', 'items', 'last_action', 'last_gmo',
+    'num_captchas', 'player_level', 'unused_incubators')
+
 
 class Worker:
     """Single worker walking on the map"""
@@ -49,32 +57,33 @@ class Worker:
     download_hash = "7b9c5056799a2c5c7d48a62c497736cbcf8c4acb"
     scan_delay = conf.SCAN_DELAY if conf.SCAN_DELAY >= 10 else 10
     g = {'seen': 0, 'captchas': 0}
+    fleet = Fleet(conf.GRID[0] * conf.GRID[1], bounds.center[0])
+    captcha_queue = CAPTCHA_QUEUE
+    extra_queue = EXTRA_QUEUE
+    # pool of accounts that are logged in ahead of time, if enabled
+    standby = None
+    # priority class of hashing requests, set for each visit
+    priority = UNKNOWN
+    # queue of encounters, set by the overseer if encounters are enabled
+    encounters = None
+    if conf.MAP_WORKERS:
+        roster = Roster(conf.GRID[0] * conf.GRID[1])
 
     if conf.CACHE_CELLS:
-        cells = load_pickle('cells') or {}
-
-        @classmethod
-        def get_cell_ids(cls, point):
-            rounded = round_coords(point, 4)
-            try:
-                return cls.cells[rounded]
-            except KeyError:
-                cells = _pogeo_cell_ids(rounded)
-                cls.cells[rounded] = cells
-                return cells
+        cells = CellGrid.load(bounds)
+        get_cell_ids = cells.get
     else:
         get_cell_ids = _pogeo_cell_ids
 
     login_semaphore = Semaphore(conf.SIMULTANEOUS_LOGINS, loop=LOOP)
     sim_semaphore = Semaphore(conf.SIMULTANEOUS_SIMULATION, loop=LOOP)
 
-    multiproxy = False
     if conf.PROXIES:
-        if len(conf.PROXIES) > 1:
-            multiproxy = True
-        proxies = cycle(conf.PROXIES)
+        proxies = ProxyPool(conf.PROXIES)
+        multiproxy = len(proxies) > 1
     else:
         proxies = None
+        multiproxy = False
 
     if conf.NOTIFY:
         notifier = Notifier()
@@ -90,38 +99,39 @@ class Worker:
                 self.account = self.captcha_queue.get_nowait()
             except Empty as e:
                 raise ValueError("You don't have enough accounts for the number of workers specified in GRID.") from e
-        self.username = self.account['username']
-        try:
-            self.location = self.account['location'][:2]
-        except KeyError:
-            self.location = get_start_coords(worker_no)
         self.altitude = None
-        self.inventory_timestamp = self.account.get('inventory_timestamp')
-        # last time of any request
-        self.last_request = self.account.get('time', 0)
-        # last time of a request that requires user interaction in the game
-        self.last_action = self.last_request
-        # last time of a GetMapObjects request
-        self.last_gmo = self.last_request
-        self.items = self.account.get('items', {})
-        self.player_level = self.account.get('level')
-        self.num_captchas = 0
-        self.eggs = {}
-        self.unused_incubators = []
-        self.initialize_api()
+        self.item_capacity = 350
+        self.load_account()
         # State variables
-        self.busy = Lock(loop=LOOP)
+        self.busy = BusyLock(self.fleet, worker_no, loop=LOOP)
         # Other variables
         self.after_spawn = 0
         self.speed = 0
         self.total_seen = 0
         self.error_code = 'INIT'
-        self.item_capacity = 350
         self.visits = 0
         self.pokestops = conf.SPIN_POKESTOPS
         self.next_spin = 0
         self.handle = HandleStub()
 
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, point):
+        self._location = point
+        self.fleet.set_location(self.worker_no, point)
+
+    @property
+    def last_request(self):
+        return self._last_request
+
+    @last_request.setter
+    def last_request(self, timestamp):
+        self._last_request = timestamp
+        self.fleet.set_last_request(self.worker_no, timestamp)
+
     def initialize_api(self):
         device_info = get_device_info(self.account)
         self.empty_visits = 0
@@ -129,7 +139,7 @@ class Worker:
         self.api = PGoApi(device_info=device_info)
         self.api.set_position(*self.location, self.altitude)
         if self.proxies:
-            self.api.proxy = next(self.proxies)
+            self.api.proxy = self.proxies.acquire()
         try:
             if self.account['provider'] == 'ptc' and 'auth' in self.account:
                 self.api.auth_provider = AuthPtc(username=self.username, password=self.account['password'], timeout=conf.LOGIN_TIMEOUT)
@@ -141,9 +151,7 @@ class Worker:
             pass
 
     def swap_proxy(self):
-        proxy = self.api.proxy
-        while proxy == self.api.proxy:
-            self.api.proxy = next(self.proxies)
+        self.api.proxy = self.proxies.swap(self.api.proxy)
 
     async def login(self, reauth=False):
         """Logs worker in and prepares for scanning"""
@@ -423,7 +431,7 @@ class Worker:
                         else:
                             self.unused_incubators.insert(0, item)
 
-    async def call(self, request, chain=True, stamp=True, buddy=True, settings=False, dl_hash=True, action=None):
+    async def call(self, request, chain=True, stamp=True, buddy=True, settings=False, dl_hash=True, action=None, priority=None):
         if chain:
             request.check_challenge()
             request.get_hatched_eggs()
@@ -452,7 +460,13 @@ class Worker:
         err = None
         for attempt in range(-1, conf.MAX_RETRIES):
             try:
+                await HASH_SCHEDULER.acquire(self.priority if priority is None else priority)
+                started = monotonic()
                 response = await request.call()
+                latency = monotonic() - started
+                METRICS.record('request', latency)
+                if self.proxies:
+                    self.proxies.succeeded(self.api.proxy, latency)
                 try:
                     responses = response['responses']
                 except KeyError:
@@ -472,6 +486,8 @@ class Worker:
                 if not await self.login(reauth=True):
                     await self.swap_account(reason='reauth failed')
             except ex.TimeoutException as e:
+                if self.proxies:
+                    self.proxies.failed(self.api.proxy)
                 self.error_code = 'TIMEOUT'
                 if not isinstance(e, type(err)):
                     err = e
@@ -494,15 +510,10 @@ class Worker:
                     err = e
                     self.log.warning('Exceeded your hashing quota, sleeping.')
                 self.error_code = 'QUOTA EXCEEDED'
-                refresh = HashServer.status.get('period')
-                now = time()
-                if refresh:
-                    if refresh > now:
-                        await sleep(refresh - now + 1, loop=LOOP)
-                    else:
-                        await sleep(5, loop=LOOP)
-                else:
-                    await sleep(30, loop=LOOP)
+                # wait for whichever key refreshes first, or retry right
+                # away if another key has requests left
+                wait = HASH_KEYS.wait_time()
+                await sleep(30 if wait is None else wait + 1, loop=LOOP)
             except ex.BadRPCException:
                 raise
             except ex.InvalidRPCException as e:
@@ -516,6 +527,8 @@ class Worker:
                 if not isinstance(e, type(err)):
                     err = e
                 self.error_code = 'PROXY ERROR'
+                if self.proxies:
+                    self.proxies.failed(self.api.proxy)
 
                 if self.multiproxy:
                     self.log.error('{}, swapping proxy.', e)
@@ -588,11 +601,13 @@ class Worker:
             self.simulate_jitter(0.00005)
         return False
 
-    async def visit(self, point, spawn_id=None, bootstrap=False):
+    async def visit(self, point, spawn_id=None, bootstrap=False, covered=()):
         """Wrapper for self.visit_point - runs it a few times before giving up
 
-        Also is capable of restarting in case an error occurs.
+        Also is capable of restarting in case an error occurs. covered are
+        the IDs of other spawns the visit is expected to see.
         """
+        self.priority = KNOWN if spawn_id else UNKNOWN
         try:
             try:
                 self.altitude = altitudes.get(point)
@@ -602,13 +617,13 @@ class Worker:
             self.api.set_position(*self.location, self.altitude)
             if not self.authenticated:
                 await self.login()
-            return await self.visit_point(point, spawn_id, bootstrap)
+            return await self.visit_point(point, spawn_id, bootstrap, covered)
         except ex.NotLoggedInException:
             self.error_code = 'NOT AUTHENTICATED'
             await sleep(1, loop=LOOP)
             if not await self.login(reauth=True):
                 await self.swap_account(reason='reauth failed')
-            return await self.visit(point, spawn_id, bootstrap)
+            return await self.visit(point, spawn_id, bootstrap, covered)
         except ex.AuthException as e:
             self.log.warning('Auth error on {}: {}', self.username, e)
             self.error_code = 'NOT AUTHENTICATED'
@@ -644,6 +659,8 @@ class Worker:
             self.log.warning('{} Giving up.', e)
         except ex.NianticIPBannedException:
             self.error_code = 'IP BANNED'
+            if self.proxies:
+                self.proxies.failed(self.api.proxy, banned=True)
 
             if self.multiproxy:
                 self.log.warning('Swapping out {} due to IP ban.', self.api.proxy)
@@ -686,7 +703,7 @@ class Worker:
             self.error_code = 'EXCEPTION'
         return False
 
-    async def visit_point(self, point, spawn_id, bootstrap):
+    async def visit_point(self, point, spawn_id, bootstrap, covered=()):
         self.handle.cancel()
         self.error_code = '∞' if bootstrap else '!'
 
@@ -704,6 +721,7 @@ class Worker:
         diff = self.last_gmo + self.scan_delay - time()
         if diff > 0:
             await sleep(diff, loop=LOOP)
+        METRICS.record('scan delay', max(diff, 0))
         responses = await self.call(request)
         self.last_gmo = self.last_request
 
@@ -727,6 +745,7 @@ class Worker:
         forts_seen = 0
         points_seen = 0
         seen_target = not spawn_id
+        seen_covered = set()
 
         try:
             time_of_day = map_objects['time_of_day']
@@ -737,9 +756,12 @@ class Worker:
         if conf.ITEM_LIMITS and self.bag_full():
             await self.clean_bag()
 
+        encounters = self.encounters
         encounter_conf = conf.ENCOUNTER
+        encounter_ids = conf.ENCOUNTER_IDS or ()
         notify_conf = conf.NOTIFY
         more_points = conf.MORE_POINTS
+        processing = monotonic()
         for map_cell in map_objects['map_cells']:
             request_time_ms = map_cell['current_timestamp_ms']
             for pokemon in map_cell.get('wild_pokemons', ()):
@@ -747,29 +769,22 @@ class Worker:
 
                 normalized = self.normalize_pokemon(pokemon)
                 seen_target = seen_target or normalized['spawn_id'] == spawn_id
-
-                if (normalized not in SIGHTING_CACHE and
-                        normalized not in MYSTERY_CACHE):
-                    if (encounter_conf == 'all'
-                            or (encounter_conf == 'some'
-                            and normalized['pokemon_id'] in conf.ENCOUNTER_IDS)):
-                        try:
-                            await self.encounter(normalized, pokemon['spawn_point_id'])
-                        except CancelledError:
-                            db_proc.add(normalized)
-                            raise
-                        except Exception as e:
-                            self.log.warning('{} during encounter', e.__class__.__name__)
-
-                if notify_conf and self.notifier.eligible(normalized):
-                    if encounter_conf and 'move_1' not in normalized:
-                        try:
-                            await self.encounter(normalized, pokemon['spawn_point_id'])
-                        except CancelledError:
-                            db_proc.add(normalized)
-                            raise
-                        except Exception as e:
-                            self.log.warning('{} during encounter', e.__class__.__name__)
+                if normalized['spawn_id'] in covered:
+                    seen_covered.add(normalized['spawn_id'])
+
+                notify = notify_conf and self.notifier.eligible(normalized)
+                if encounters is not None:
+                    if notify:
+                        encounters.add(normalized, pokemon['spawn_point_id'], NOTIFY,
+                                       notify=True, time_of_day=time_of_day)
+                    elif (normalized not in SIGHTING_CACHE
+                            and normalized not in MYSTERY_CACHE):
+                        if (encounter_conf in ('all', 'some')
+                                and normalized['pokemon_id'] in encounter_ids):
+                            encounters.add(normalized, pokemon['spawn_point_id'], WANTED)
+                        elif encounter_conf == 'all':
+                            encounters.add(normalized, pokemon['spawn_point_id'], OTHER)
+                elif notify:
                     LOOP.create_task(self.notifier.notify(normalized, time_of_day))
                 db_proc.add(normalized)
 
@@ -802,15 +817,22 @@ class Worker:
                         p = p['latitude'], p['longitude']
                         if spawns.have_point(p) or p not in bounds:
                             continue
-                        spawns.cell_points.add(p)
+                        spawns.add_cell_point(p)
                 except KeyError:
                     pass
+        METRICS.record('map objects', monotonic() - processing)
 
         if spawn_id:
             db_proc.add({
                 'type': 'target',
                 'seen': seen_target,
                 'spawn_id': spawn_id})
+        for covered_id in seen_covered:
+            # only the target of a visit counts a miss as a failure
+            db_proc.add({
+                'type': 'target',
+                'seen': True,
+                'spawn_id': covered_id})
 
         if (conf.INCUBATE_EGGS and self.unused_incubators
                 and self.eggs and self.smart_throttle()):
@@ -834,9 +856,8 @@ class Worker:
         self.visits += 1
 
         if conf.MAP_WORKERS:
-            self.worker_dict.update([(self.worker_no,
-                (point, start, self.speed, self.total_seen,
-                self.visits, pokemon_seen))])
+            self.roster.update(self.worker_no, point, start, self.speed,
+                               self.total_seen, self.visits, pokemon_seen)
         self.log.info(
             'Point processed, {} Pokemon and {} forts seen!',
             pokemon_seen,
@@ -848,16 +869,11 @@ class Worker:
         return pokemon_seen + forts_seen + points_seen
 
     def smart_throttle(self, requests=1):
-        try:
-            # https://en.wikipedia.org/wiki/Linear_equation#Two_variables
-            # e.g. hashes_left > 2.25*seconds_left+7.5, spare = 0.05, max = 150
-            spare = conf.SMART_THROTTLE * HashServer.status['maximum']
-            hashes_left = HashServer.status['remaining'] - requests
-            usable_per_second = (HashServer.status['maximum'] - spare) / 60
-            seconds_left = HashServer.status['period'] - time()
-            return hashes_left > usable_per_second * seconds_left + spare
-        except (TypeError, KeyError):
-            return False
+        # https://en.wikipedia.org/wiki/Linear_equation#Two_variables
+        # e.g. hashes_left > 2.25*seconds_left+7.5, spare = 0.05, max = 150
+        # for each key, summed over all of them
+        surplus = HASH_KEYS.surplus(conf.SMART_THROTTLE)
+        return surplus is not None and surplus > requests
 
     async def spin_pokestop(self, pokestop):
         self.error_code = '$'
@@ -876,7 +892,7 @@ class Worker:
         request.fort_details(fort_id = pokestop['external_id'],
                              latitude = pokestop['lat'],
                              longitude = pokestop['lon'])
-        responses = await self.call(request, action=1.2)
+        responses = await self.call(request, action=1.2, priority=OPTIONAL)
         name = responses.get('FORT_DETAILS', {}).get('name')
 
         request = self.api.create_request()
@@ -885,7 +901,7 @@ class Worker:
                             player_longitude = self.location[1],
                             fort_latitude = pokestop['lat'],
                             fort_longitude = pokestop['lon'])
-        responses = await self.call(request, action=2)
+        responses = await self.call(request, action=2, priority=OPTIONAL)
 
         result = responses.get('FORT_SEARCH', {}).get('result', 0)
         if result == 1:
@@ -935,7 +951,7 @@ class Worker:
                                     player_latitude=self.location[0],
                                     player_longitude=self.location[1])
 
-        responses = await self.call(request, action=2.25)
+        responses = await self.call(request, action=2.25, priority=ENCOUNTER)
 
         try:
             pdata = responses['ENCOUNTER']['wild_pokemon']['pokemon_data']
@@ -951,6 +967,22 @@ class Worker:
             self.log.error('Missing Pokemon data in encounter response.')
         self.error_code = '!'
 
+    async def try_encounter(self, pokemon, spawn_id):
+        """Encounter a Pokemon for the queue of encounters, return True if
+        its IVs and moves were added.
+        """
+        if not self.authenticated:
+            return False
+        try:
+            await self.encounter(pokemon, spawn_id)
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.log.warning('{} during encounter', e.__class__.__name__)
+            self.error_code = '!'
+            return False
+        return 'move_1' in pokemon
+
     def bag_full(self):
         return sum(self.items.values()) >= self.item_capacity
 
@@ -970,7 +1002,7 @@ class Worker:
         for item, count in rec_items.items():
             request = self.api.create_request()
             request.recycle_inventory_item(item_id=item, count=count)
-            responses = await self.call(request, action=2)
+            responses = await self.call(request, action=2, priority=OPTIONAL)
 
             if responses.get('RECYCLE_INVENTORY_ITEM', {}).get('result', 0) != 1:
                 self.log.warning("Failed to remove item {}", item)
@@ -993,7 +1025,7 @@ class Worker:
             if inc.get('item_id') == 901 or egg.get('egg_km_walked_target', 0) > 9:
                 request = self.api.create_request()
                 request.use_item_egg_incubator(item_id=inc.get('id'), pokemon_id=egg.get('id'))
-                responses = await self.call(request, action=5)
+                responses = await self.call(request, action=5, priority=OPTIONAL)
 
                 ret = responses.get('USE_ITEM_EGG_INCUBATOR', {}).get('result', 0)
                 if ret == 4:
@@ -1133,31 +1165,53 @@ class Worker:
         await self.new_account()
 
     async def new_account(self):
+        if self.proxies:
+            self.proxies.release(self.api.proxy)
+        account = None
         if (conf.CAPTCHA_KEY
-                and (conf.FAVOR_CAPTCHA or self.extra_queue.empty())
-                and not self.captcha_queue.empty()):
-            self.account = self.captcha_queue.get()
-        else:
+                and (conf.FAVOR_CAPTCHA or (self.extra_queue.empty() and not self.standby))):
             try:
-                self.account = self.extra_queue.get_nowait()
+                # the CAPTCHA solver may empty the queue at any time
+                account = self.captcha_queue.get_nowait()
             except Empty:
-                self.account = await run_threaded(self.extra_queue.get)
+                pass
+        if account is None:
+            standby = self.standby.take() if self.standby is not None else None
+            if standby:
+                self.adopt(standby)
+                self.error_code = None
+                return
+            account = await self.extra_queue.get()
+        self.account = account
+        self.load_account()
+        self.error_code = None
+
+    def load_account(self):
         self.username = self.account['username']
         try:
             self.location = self.account['location'][:2]
         except KeyError:
             self.location = get_start_coords(self.worker_no)
         self.inventory_timestamp = self.account.get('inventory_timestamp')
-        self.player_level = self.account.get('level')
+        # last time of any request
         self.last_request = self.account.get('time', 0)
+        # last time of a request that requires user interaction in the game
         self.last_action = self.last_request
+        # last time of a GetMapObjects request
         self.last_gmo = self.last_request
         self.items = self.account.get('items', {})
+        self.player_level = self.account.get('level')
         self.num_captchas = 0
         self.eggs = {}
         self.unused_incubators = []
         self.initialize_api()
-        self.error_code = None
+
+    def adopt(self, standby):
+        """Take over the account and API of a standby that's logged in."""
+        for name in ACCOUNT_STATE:
+            setattr(self, name, getattr(standby, name))
+        self.location = standby.location
+        self.last_request = standby.last_request
 
     def unset_code(self):
         self.error_code = None
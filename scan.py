@@ -10,24 +10,28 @@ try:
 except ImportError:
     pass
 
-from multiprocessing.managers import BaseManager, DictProxy
-from queue import Queue, Full
+from multiprocessing.managers import BaseManager
+from threading import Thread
 from argparse import ArgumentParser
-from signal import signal, SIGINT, SIGTERM, SIG_IGN
+from signal import SIGINT, SIGTERM
 from logging import getLogger, basicConfig, WARNING, INFO
 from logging.handlers import RotatingFileHandler
 from os.path import exists, join
 from sys import platform
-from time import monotonic, sleep
+from time import sleep
 
 from sqlalchemy.exc import DBAPIError
 from aiopogo import close_sessions, activate_hash_server
 
-from monocle.shared import LOOP, get_logger, SessionManager, ACCOUNTS
+from monocle.accounts import CAPTCHA_QUEUE, EXTRA_QUEUE, QueueFacade
+from monocle.shared import LOOP, get_logger, SessionManager, ACCOUNTS, shutdown_pools
 from monocle.utils import get_address, dump_pickle
 from monocle.worker import Worker
+from monocle.hashkeys import HASH_KEYS
+from monocle.metrics import METRICS
 from monocle.overseer import Overseer
-from monocle.db import FORT_CACHE
+from monocle.db import FORT_CACHE, SIGHTING_CACHE, MYSTERY_CACHE
+from monocle.expiring import start_sweeps
 from monocle import altitudes, db_proc, spawns
 
 
@@ -35,32 +39,8 @@ class AccountManager(BaseManager):
     pass
 
 
-class CustomQueue(Queue):
-    def full_wait(self, maxsize=0, timeout=None):
-        '''Block until queue size falls below maxsize'''
-        starttime = monotonic()
-        with self.not_full:
-            if maxsize > 0:
-                if timeout is None:
-                    while self._qsize() >= maxsize:
-                        self.not_full.wait()
-                elif timeout < 0:
-                    raise ValueError("'timeout' must be a non-negative number")
-                else:
-                    endtime = monotonic() + timeout
-                    while self._qsize() >= maxsize:
-                        remaining = endtime - monotonic()
-                        if remaining <= 0.0:
-                            raise Full
-                        self.not_full.wait(remaining)
-            self.not_empty.notify()
-        endtime = monotonic()
-        return endtime - starttime
-
-
-_captcha_queue = CustomQueue()
-_extra_queue = Queue()
-_worker_dict = {}
+_captcha_queue = QueueFacade(CAPTCHA_QUEUE)
+_extra_queue = QueueFacade(EXTRA_QUEUE)
 
 def get_captchas():
     return _captcha_queue
@@ -68,12 +48,6 @@ def get_captchas():
 def get_extras():
     return _extra_queue
 
-def get_workers():
-    return _worker_dict
-
-def mgr_init():
-    signal(SIGINT, SIG_IGN)
-
 
 def parse_args():
     parser = ArgumentParser()
@@ -126,10 +100,17 @@ def exception_handler(loop, context):
         print('Exception in exception handler.')
 
 
-def cleanup(overseer, manager):
+def cleanup(overseer):
     try:
         overseer.print_handle.cancel()
         overseer.running = False
+        overseer.waitlist.close()
+        overseer.coroutine_semaphore.close()
+        METRICS.close()
+        if overseer.standby is not None:
+            overseer.standby.close()
+        if overseer.encounters is not None:
+            overseer.encounters.close()
         print('Exiting, please wait until all tasks finish')
 
         log = get_logger('cleanup')
@@ -151,9 +132,11 @@ def cleanup(overseer, manager):
         print('Dumping pickles...')
         dump_pickle('accounts', ACCOUNTS)
         FORT_CACHE.pickle()
+        SIGHTING_CACHE.pickle()
+        MYSTERY_CACHE.pickle()
         altitudes.pickle()
         if conf.CACHE_CELLS:
-            dump_pickle('cells', Worker.cells)
+            Worker.cells.dump()
 
         spawns.pickle()
         while not db_proc.queue.empty():
@@ -164,7 +147,7 @@ def cleanup(overseer, manager):
             sleep(.5)
     finally:
         print('Closing pipes, sessions, and event loop...')
-        manager.shutdown()
+        shutdown_pools()
         SessionManager.close()
         close_sessions()
         LOOP.close()
@@ -184,25 +167,33 @@ def main():
 
     AccountManager.register('captcha_queue', callable=get_captchas)
     AccountManager.register('extra_queue', callable=get_extras)
-    if conf.MAP_WORKERS:
-        AccountManager.register('worker_dict', callable=get_workers,
-                                proxytype=DictProxy)
     address = get_address()
     manager = AccountManager(address=address, authkey=conf.AUTHKEY)
     try:
-        manager.start(mgr_init)
+        # served from this process so that workers use the queues directly
+        server = manager.get_server()
     except (OSError, EOFError) as e:
         if platform == 'win32' or not isinstance(address, str):
             raise OSError('Another instance is running with the same manager address. Stop that process or change your MANAGER_ADDRESS.') from e
         else:
             raise OSError('Another instance is running with the same socket. Stop that process or: rm {}'.format(address)) from e
+    # the thread stops when the scanner exits, multiprocessing removes the
+    # socket at exit
+    Thread(target=server.serve_forever, name='manager', daemon=True).start()
 
     LOOP.set_exception_handler(exception_handler)
 
-    overseer = Overseer(manager)
+    SIGHTING_CACHE.unpickle()
+    MYSTERY_CACHE.unpickle()
+    start_sweeps()
+    if conf.CACHE_CELLS and conf.PRECOMPUTE_CELLS:
+        Worker.cells.precompute(conf.PRECOMPUTE_CELLS)
+
+    overseer = Overseer()
     overseer.start(args.status_bar)
     launcher = LOOP.create_task(overseer.launch(args.bootstrap, args.pickle))
     activate_hash_server(conf.HASH_KEY)
+    HASH_KEYS.install(conf.HASH_KEY)
     if platform != 'win32':
         LOOP.add_signal_handler(SIGINT, launcher.cancel)
         LOOP.add_signal_handler(SIGTERM, launcher.cancel)
@@ -211,7 +202,7 @@ def main():
     except (KeyboardInterrupt, SystemExit):
         launcher.cancel()
     finally:
-        cleanup(overseer, manager)
+        cleanup(overseer)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Compare choosing the best worker with the fleet arrays against the
+per-worker loop they replaced.
+"""
+
+import sys
+
+from argparse import ArgumentParser
+from pathlib import Path
+from random import Random
+from time import perf_counter, time
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from pogeo import get_distance
+
+from monocle import fleet
+from monocle.fleet import Fleet
+
+SCAN_DELAY = 10
+UNIT = 2
+GOOD_ENOUGH = 0.1
+SPEED_LIMIT = 30
+
+
+class LoopWorker:
+    def __init__(self, location, last_request, busy):
+        self.location = location
+        self.last_request = last_request
+        self.busy = busy
+
+    def travel_speed(self, point, now=None):
+        time_diff = max((now or time()) - self.last_request, SCAN_DELAY)
+        distance = get_distance(self.location, point, UNIT)
+        return (distance / time_diff) * 3600
+
+
+def loop_best(workers, point, good_enough, now=None):
+    gen = (w for w in workers if not w.busy)
+    try:
+        worker = next(gen)
+        lowest_speed = worker.travel_speed(point, now)
+    except StopIteration:
+        return None, float('inf')
+    for w in gen:
+        speed = w.travel_speed(point, now)
+        if speed < lowest_speed:
+            lowest_speed = speed
+            worker = w
+            if speed < good_enough:
+                break
+    return worker, lowest_speed
+
+
+def random_workers(count, busy):
+    rand = Random(1)
+    now = time()
+    for _ in range(count):
+        yield ((rand.uniform(40.6, 40.9), rand.uniform(-112.1, -111.7)),
+               now - rand.uniform(0, 60), rand.random() < busy)
+
+
+def timed(name, best, points, baseline=None):
+    began = perf_counter()
+    for point in points:
+        best(point)
+    elapsed = (perf_counter() - began) / len(points)
+    if baseline:
+        print('{:<16} {:>10.1f} µs {:>6.1f}x'.format(
+            name, elapsed * 1000000, baseline / elapsed))
+    else:
+        print('{:<16} {:>10.1f} µs'.format(name, elapsed * 1000000))
+    return elapsed
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-w', '--workers', type=int, default=1000)
+    parser.add_argument('-b', '--busy', type=float, default=0.5,
+                        help='fraction of workers that are busy')
+    parser.add_argument('-n', '--points', type=int, default=1000)
+    parser.add_argument('-g', '--good-enough', type=float, default=GOOD_ENOUGH)
+    parser.add_argument('-s', '--speed-limit', type=float, default=SPEED_LIMIT,
+                        help='in km/h')
+    args = parser.parse_args()
+    good_enough = args.good_enough
+    speed_limit = args.speed_limit
+
+    rows = list(random_workers(args.workers, args.busy))
+    rand = Random(2)
+    points = [(rand.uniform(40.6, 40.9), rand.uniform(-112.1, -111.7))
+              for _ in range(args.points)]
+
+    workers = [LoopWorker(*row) for row in rows]
+    numpy = fleet.np
+    fleets = {}
+    for name, module in (('fleet (numpy)', numpy), ('fleet (python)', None)):
+        if name == 'fleet (numpy)' and numpy is None:
+            continue
+        fleet.np = module
+        f = Fleet(len(rows), 40.75)
+        for i, (location, last_request, busy) in enumerate(rows):
+            f.set_location(i, location)
+            f.set_last_request(i, last_request)
+            f.set_busy(i, busy)
+        fleets[name] = (f, module)
+
+    print('{} workers, {:.0%} busy'.format(args.workers, args.busy))
+    baseline = timed('loop', lambda p: loop_best(workers, p, good_enough), points)
+    for name, (f, module) in fleets.items():
+        fleet.np = module
+        timed(name, lambda p: f.best(p, time(), SCAN_DELAY, UNIT, good_enough,
+                                     speed_limit), points, baseline)
+
+    # check that the fleet makes an equally good choice
+    for name, (f, module) in fleets.items():
+        fleet.np = module
+        now = time()
+        for point in points[:100]:
+            _, expected = loop_best(workers, point, good_enough, now)
+            _, speed = f.best(point, now, SCAN_DELAY, UNIT, good_enough,
+                              speed_limit)
+            if expected < good_enough:
+                correct = speed < good_enough
+            elif expected < speed_limit:
+                correct = abs(speed - expected) < 1e-9 * expected
+            else:
+                correct = speed >= speed_limit
+            if not correct:
+                print('{} chose a {} km/h worker instead of {} km/h for {}'.format(
+                    name, speed, expected, point))
+    fleet.np = numpy
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Compare MoreSpawns.have_point lookups with and without the grid index."""
+
+import sys
+
+from argparse import ArgumentParser
+from itertools import chain
+from pathlib import Path
+from random import Random
+from timeit import timeit
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.spatial import GridIndex
+
+
+def random_points(rand, count, center=(40.76, -111.89), spread=0.15):
+    lat, lon = center
+    return [(round(lat + rand.uniform(-spread, spread), 6),
+             round(lon + rand.uniform(-spread, spread), 6))
+            for _ in range(count)]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--points', type=int, default=500000)
+    parser.add_argument('-l', '--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    rand = Random(1)
+    points = random_points(rand, args.points)
+    thirds = len(points) // 3
+    cell_points = set(points[:thirds])
+    known = dict.fromkeys(points[thirds:thirds * 2])
+    unknown = set(points[thirds * 2:])
+    index = GridIndex(points, ref_lat=40.76)
+
+    hits = rand.sample(points, args.lookups // 2)
+    misses = random_points(rand, args.lookups - len(hits))
+    queries = hits + misses
+
+    def indexed():
+        for p in queries:
+            p in index
+
+    def nearby():
+        for p in queries:
+            index.near(p, 50)
+
+    # the old implementation is linear, only time a few lookups
+    linear_queries = queries[:20]
+
+    def linear():
+        for p in linear_queries:
+            p in chain(cell_points, known, unknown)
+
+    print('{} points, {} cells'.format(len(index), len(index.cells)))
+    per_linear = timeit(linear, number=1) / len(linear_queries)
+    per_indexed = timeit(indexed, number=1) / len(queries)
+    per_nearby = timeit(nearby, number=1) / len(queries)
+    print('chain lookup:  {:>12.3f} µs'.format(per_linear * 1e6))
+    print('index lookup:  {:>12.3f} µs'.format(per_indexed * 1e6))
+    print('within 50m:    {:>12.3f} µs'.format(per_nearby * 1e6))
+    print('speedup:       {:>12.0f}x'.format(per_linear / per_indexed))
+
+
+if __name__ == '__main__':
+    main()
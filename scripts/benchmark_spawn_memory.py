@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Compare the memory and pickling cost of the spawn schedule with the
+OrderedDict and dict it replaced.
+"""
+
+import sys
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from pathlib import Path
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+from random import Random
+from time import perf_counter
+from tracemalloc import start, stop, take_snapshot
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.schedule import SpawnSchedule, DespawnTimes
+
+
+def random_spawns(count):
+    rand = Random(1)
+    spawn_ids = rand.sample(range(2 ** 40), count)
+    for spawn_id in spawn_ids:
+        despawn = rand.randrange(3600)
+        yield (round(rand.uniform(40.6, 40.9), 14),
+               round(rand.uniform(-112.1, -111.7), 14),
+               spawn_id, (despawn + 1800) % 3600, despawn)
+
+
+def build_dicts(rows):
+    known = OrderedDict(
+        ((lat, lon), (spawn_id, seconds)) for lat, lon, spawn_id, seconds, _ in
+        sorted(rows, key=lambda r: r[3]))
+    despawn_times = {row[2]: row[4] for row in rows}
+    return known, despawn_times
+
+
+def build_schedule(rows):
+    known = SpawnSchedule.from_rows(rows)
+    return known, DespawnTimes(known)
+
+
+def measure(name, build, rows):
+    start()
+    before = take_snapshot()
+    began = perf_counter()
+    structures = build(rows)
+    built = perf_counter() - began
+    after = take_snapshot()
+    stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    began = perf_counter()
+    pickled = dumps(structures, HIGHEST_PROTOCOL)
+    dumped = perf_counter() - began
+    began = perf_counter()
+    loads(pickled)
+    loaded = perf_counter() - began
+
+    print('{:<14} {:>9.1f} MB {:>9.2f}s build {:>9.1f} MB pickle '
+          '{:>6.2f}s dump {:>6.2f}s load'.format(
+              name, size / 1048576, built, len(pickled) / 1048576,
+              dumped, loaded))
+    return structures
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--spawns', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rows = list(random_spawns(args.spawns))
+    print('{} spawns'.format(len(rows)))
+    measure('OrderedDict', build_dicts, rows)
+    known, despawn_times = measure('SpawnSchedule', build_schedule, rows)
+
+    spawn_id = rows[len(rows) // 2][2]
+    began = perf_counter()
+    for _ in range(100000):
+        despawn_times[spawn_id]
+    print('despawn time lookup: {:.2f} µs'.format(
+        (perf_counter() - began) * 10))
+
+
+if __name__ == '__main__':
+    main()
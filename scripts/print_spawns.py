@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 
-from pickle import load
+import sys
+
 from pprint import PrettyPrinter
 from pathlib import Path
 
-pickle_path = Path(__file__).resolve().parents[1] / 'pickles' / 'spawns.pickle'
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.snapshot import Snapshot, iter_points
+
+snapshot_path = monocle_dir / 'pickles' / 'spawns.snapshot'
+snapshot = Snapshot(str(snapshot_path))
 
-with pickle_path.open('rb') as f:
-    spawns = load(f)
+spawns = snapshot.meta.copy()
+spawns['known'] = [
+    ((lat, lon), (spawn_id, seconds)) for lat, lon, spawn_id, seconds in zip(
+        snapshot['lats'], snapshot['lons'], snapshot['spawn_ids'],
+        snapshot['seconds'])]
+spawns['despawn_times'] = dict(zip(snapshot['spawn_ids'], snapshot['despawns']))
+spawns['despawn_times'].update(spawns.pop('despawn_changes'))
+spawns['unknown'] = list(iter_points(snapshot['unknown']))
+if 'cell_points' in snapshot:
+    spawns['cell_points'] = list(iter_points(snapshot['cell_points']))
 
 pp = PrettyPrinter(indent=3)
 pp.pprint(spawns)
@@ -0,0 +1,31 @@
+from asyncio import new_event_loop, sleep, wait_for
+
+from monocle.accounts import AccountQueue
+
+
+def test_rested_accounts_first():
+    queue = AccountQueue(loop=new_event_loop())
+    queue.put({'username': 'recent', 'time': 200, 'level': 30})
+    queue.put({'username': 'low', 'time': 100, 'level': 5})
+    queue.put({'username': 'high', 'time': 100, 'level': 20})
+    assert [queue.get_nowait()['username'] for _ in range(3)] == [
+        'high', 'low', 'recent']
+
+
+def test_cancelled_getter_doesnt_take_an_account():
+    loop = new_event_loop()
+    queue = AccountQueue(loop=loop)
+
+    async def scenario():
+        cancelled = loop.create_task(queue.get())
+        live = loop.create_task(queue.get())
+        await sleep(0)
+        cancelled.cancel()
+        await sleep(0)
+        queue.put({'username': 'a'})
+        return await wait_for(live, 1)
+
+    try:
+        assert loop.run_until_complete(scenario())['username'] == 'a'
+    finally:
+        loop.close()
@@ -0,0 +1,42 @@
+from time import time
+
+from monocle import db, sanitized as conf
+
+
+def test_sighting_cache_roundtrip_with_lured(tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, 'DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(conf, 'SPAWN_ID_INT', True)
+    expires = int(time()) + 600
+    sighting = {'spawn_id': 0x89c259a3bd7, 'expire_timestamp': expires}
+    lured = {'spawn_id': -1, 'expire_timestamp': expires}
+
+    cache = db.SightingCache()
+    cache.add(sighting)
+    cache.add(lured)
+    db.JOURNAL.commit()
+    cache.pickle()
+
+    restored = db.SightingCache()
+    restored.unpickle()
+    assert sighting in restored
+    assert len(restored) == 1
+
+
+def test_mystery_cache_roundtrip_with_lured(tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, 'DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(conf, 'SPAWN_ID_INT', True)
+    now = int(time())
+    mystery = {'encounter_id': 2 ** 63 + 5, 'spawn_id': 0x89c259a3bd7,
+               'seen': now}
+    lured = {'encounter_id': 17, 'spawn_id': -1, 'seen': now}
+
+    cache = db.MysteryCache()
+    cache.add(mystery)
+    cache.add(lured)
+    db.JOURNAL.commit()
+    cache.pickle()
+
+    restored = db.MysteryCache()
+    restored.unpickle()
+    assert restored.store.get(db.combine_key(mystery)) == [now, now]
+    assert len(restored) == 1
@@ -0,0 +1,54 @@
+from pytest import approx
+
+from monocle.coalesce import Coalescer
+from monocle.schedule import SpawnSchedule
+
+HOUR = 1000 * 3600
+
+
+def make_coalescer():
+    schedule = SpawnSchedule.from_rows((
+        (40.0, -74.0, 1, 100, 1900),
+        (40.0003, -74.0, 2, 130, 1930),
+        # too far away
+        (40.01, -74.0, 3, 110, 1910),
+        # spawns too late
+        (40.0001, -74.0, 4, 900, 2700)))
+    coalescer = Coalescer(window=60, radius=70, ref_lat=40.0)
+    coalescer.reindex(schedule)
+    return coalescer
+
+
+def test_group_covers_nearby_spawns():
+    coalescer = make_coalescer()
+    point, visit_time, covering = coalescer.group((40.0, -74.0), 1, HOUR + 100)
+    assert set(covering) == {2}
+    assert covering[2] == ((40.0003, -74.0), HOUR + 130)
+    assert visit_time == HOUR + 130
+    assert point == approx((40.00015, -74.0))
+    assert coalescer.covers(2, HOUR + 130)
+    assert not coalescer.covers(3, HOUR + 110)
+    assert coalescer.coalesced == 1
+
+
+def test_ungrouped_spawn():
+    coalescer = make_coalescer()
+    point, visit_time, covering = coalescer.group((40.01, -74.0), 3, HOUR + 110)
+    assert (point, visit_time, covering) == ((40.01, -74.0), HOUR + 110, ())
+
+
+def test_release_before_launch():
+    coalescer = make_coalescer()
+    _, _, covering = coalescer.group((40.0, -74.0), 1, HOUR + 100)
+    # the launcher will reach the spawn and launch it as usual
+    assert coalescer.release(covering) == []
+    assert not coalescer.covers(2, HOUR + 130)
+
+
+def test_release_after_launch():
+    coalescer = make_coalescer()
+    _, _, covering = coalescer.group((40.0, -74.0), 1, HOUR + 100)
+    assert coalescer.covers(2, HOUR + 130)
+    # the launcher skipped it, so it has to be visited on its own
+    assert coalescer.release(covering) == [(2, (40.0003, -74.0), HOUR + 130)]
+    assert coalescer.coalesced == 0
@@ -0,0 +1,72 @@
+from time import time
+
+from monocle.expiring import ExpiringMap
+
+
+def test_get_and_expire():
+    expired = []
+    m = ExpiringMap(on_expire=lambda k, v: expired.append((k, v)))
+    now = time()
+    m.set('a', 1, now + 100)
+    m.set('b', 2, now - 1)
+    assert m.get('a') == 1
+    assert 'b' not in m
+    assert expired == [('b', 2)]
+    assert len(m) == 1
+
+
+def test_reset_keeps_one_heap_entry():
+    m = ExpiringMap()
+    expires = time() + 3600
+    for i in range(1000):
+        m.set('k', i, expires)
+    assert len(m) == 1
+    assert len(m.heap) == 1
+    assert m['k'] == 999
+
+
+def test_discard_then_set_keeps_one_heap_entry():
+    m = ExpiringMap()
+    expires = time() + 3600
+    for i in range(100):
+        m.set('k', i, expires)
+        m.discard('k')
+    assert len(m) == 0
+    assert len(m.heap) == 1
+
+
+def test_sweep():
+    expired = []
+    m = ExpiringMap(granularity=10, on_expire=lambda k, v: expired.append(k))
+    now = time()
+    m.set('old', 1, now - 100)
+    m.set('new', 2, now + 100)
+    assert m.sweep(now) == 1
+    assert expired == ['old']
+    assert m.items() == [('new', 2)]
+    assert m.heap == [int((now + 100) // 10)]
+    # later buckets are swept once they've passed
+    assert m.sweep(now + 200) == 1
+    assert not m.heap and not m.buckets
+
+
+def test_items_include_expired():
+    m = ExpiringMap()
+    now = time()
+    m.set('a', 1, now - 1)
+    m.set('b', 2, now + 100)
+    assert m.items() == [('b', 2)]
+    assert sorted(m.items(include_expired=True)) == [('a', 1), ('b', 2)]
+
+
+def test_evicts_soonest():
+    evicted = []
+    m = ExpiringMap(granularity=1, maxsize=2,
+                    on_expire=lambda k, v: evicted.append(k))
+    now = time()
+    m.set('late', 1, now + 300)
+    m.set('soon', 2, now + 100)
+    m.set('middle', 3, now + 200)
+    assert evicted == ['soon']
+    assert sorted(m.items()) == [('late', 1), ('middle', 3)]
+    assert m.evicted == 1
@@ -0,0 +1,76 @@
+from asyncio import Future, new_event_loop
+from heapq import heappush
+from random import Random
+from time import time
+
+import pytest
+
+from pogeo import get_distance
+
+from monocle.fleet import Fleet, Waitlist
+
+
+def random_fleet(rand, size, now):
+    fleet = Fleet(size, ref_lat=40.7)
+    for i in range(size):
+        fleet.set_location(i, (rand.uniform(40.6, 40.9), rand.uniform(-112.1, -111.7)))
+        fleet.set_last_request(i, now - rand.uniform(0, 120))
+        if rand.random() < 0.3:
+            fleet.set_busy(i, True)
+    return fleet
+
+
+def brute_force(fleet, point, now, scan_delay, unit):
+    speeds = [get_distance((float(fleet.lats[i]), float(fleet.lons[i])), point, unit) /
+              max(now - float(fleet.last_request[i]), scan_delay) * 3600
+              for i in range(fleet.size) if not fleet.busy[i]]
+    return min(speeds, default=float('inf'))
+
+
+@pytest.mark.parametrize('size', [1, 10, 50, 300, 3000])
+def test_best_matches_brute_force(size):
+    rand = Random(size)
+    now = time()
+    fleet = random_fleet(rand, size, now)
+    for _ in range(50):
+        point = rand.uniform(40.5, 41.0), rand.uniform(-112.2, -111.6)
+        lowest = brute_force(fleet, point, now, 10, 2)
+        index, speed = fleet.best(point, now, 10, 2, 0)
+        assert speed == pytest.approx(lowest)
+        if index is not None:
+            assert not fleet.busy[index]
+        # a speed limit only stops the search early if nothing is under it
+        limit = rand.uniform(0, 2 * lowest) if lowest < float('inf') else 30
+        index, speed = fleet.best(point, now, 10, 2, 0, limit)
+        if lowest < limit:
+            assert speed == pytest.approx(lowest)
+
+
+def test_released_worker_goes_to_earliest_reachable_point():
+    loop = new_event_loop()
+    fleet = Fleet(1)
+    fleet.set_location(0, (40.0, -111.0))
+    fleet.set_last_request(0, time() - 3600)
+    waitlist = Waitlist(fleet, 10, 2, 1, 30, 60, loop)
+
+    futures = {}
+    points = (('done', 0, (40.0, -111.0)),
+              ('far', 1, (45.0, -111.0)),
+              ('near late', 3, (40.01, -111.0)),
+              ('near', 2, (40.0, -111.01)))
+    for name, deadline, point in points:
+        future = futures[name] = Future(loop=loop)
+        heappush(waitlist.waiting,
+                 [deadline, next(waitlist.sequence), point, future, 0])
+    futures['done'].cancel()
+
+    try:
+        waitlist.released(0)
+        assert futures['near'].result()[0] == 0
+        assert not futures['far'].done()
+        assert not futures['near late'].done()
+        # finished entries at the top of the heap are dropped
+        assert waitlist.waiting[0][0] == 1
+        assert len(waitlist) == 2
+    finally:
+        loop.close()
@@ -0,0 +1,56 @@
+from asyncio import new_event_loop, sleep
+
+from monocle.hashkeys import HashScheduler, KNOWN, ENCOUNTER, UNKNOWN, OPTIONAL
+
+
+class Keys:
+    def __init__(self, rate):
+        self.current = rate
+
+    def rate(self):
+        return self.current
+
+
+def test_unlimited_until_quota_known():
+    loop = new_event_loop()
+    scheduler = HashScheduler(Keys(None), loop=loop)
+
+    async def scenario():
+        for _ in range(100):
+            await scheduler.acquire(OPTIONAL)
+
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert scheduler.granted[OPTIONAL] == 100
+
+
+def test_waiting_requests_go_by_priority():
+    loop = new_event_loop()
+    keys = Keys(0.0)
+    scheduler = HashScheduler(keys, recheck=0.01, loop=loop)
+    scheduler.tokens = 0.0
+    order = []
+
+    async def request(priority):
+        await scheduler.acquire(priority)
+        order.append(priority)
+
+    async def scenario():
+        tasks = [loop.create_task(request(priority))
+                 for priority in (OPTIONAL, UNKNOWN, KNOWN, ENCOUNTER, KNOWN)]
+        cancelled = loop.create_task(request(KNOWN))
+        await sleep(0.02)
+        assert not order
+        cancelled.cancel()
+        keys.current = 1000.0
+        for task in tasks:
+            await task
+
+    try:
+        loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+    assert order == [KNOWN, KNOWN, ENCOUNTER, UNKNOWN, OPTIONAL]
+    assert scheduler.granted == [2, 1, 1, 1]
@@ -0,0 +1,33 @@
+from itertools import permutations
+from random import Random
+
+import pytest
+
+from monocle import planner
+from monocle.planner import assign
+
+
+def total(costs, columns):
+    return sum(row[column] for row, column in zip(costs, columns))
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_assign_matches_brute_force(numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(planner, 'np', None)
+    elif planner.np is None:
+        pytest.skip('NumPy is not installed')
+    rand = Random(1)
+    for _ in range(200):
+        rows = rand.randint(1, 4)
+        columns = rand.randint(rows, 6)
+        costs = [[rand.choice((rand.uniform(0, 100), planner.INFEASIBLE))
+                  for _ in range(columns)] for _ in range(rows)]
+        result = assign(costs)
+        assert len(set(result)) == rows
+        best = min(total(costs, p) for p in permutations(range(columns), rows))
+        assert total(costs, result) == pytest.approx(best)
+
+
+def test_assign_empty():
+    assert assign([]) == []
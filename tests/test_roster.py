@@ -0,0 +1,22 @@
+from monocle import sanitized as conf
+from monocle.roster import Roster, RosterReader
+
+
+def test_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, 'DIRECTORY', str(tmp_path))
+    roster = Roster(3)
+    roster.update(1, (40.0, -74.0), 1000.0, 5.5, 10, 2, 3)
+    Roster.dump(roster.copy())
+    assert RosterReader().load() == [
+        (1, ((40.0, -74.0), 1000.0, 5.5, 10, 2, 3))]
+
+
+def test_copy_only_when_changed():
+    roster = Roster(2)
+    roster.update(0, (40.0, -74.0), 1000.0, 5.5, 10, 2, 3)
+    assert roster.copy() is not None
+    assert roster.copy() is None
+    # copied again once the heartbeat is due
+    assert roster.copy(heartbeat=0) is not None
+    roster.update(1, (40.1, -74.1), 1001.0, 2.0, 1, 1, 1)
+    assert roster.copy() is not None
@@ -0,0 +1,30 @@
+from monocle.schedule import DespawnTimes, SpawnSchedule
+
+
+def schedule():
+    return SpawnSchedule.from_rows([
+        (40.1, -111.1, 30, 1200, 3000),
+        (40.2, -111.2, 10, 60, 1860),
+        (40.3, -111.3, 20, 600, 2400)])
+
+
+def test_merged_adds_and_excludes_in_time_order():
+    merged = schedule().merged(
+        [(40.5, -111.5, 50, 900, 2700), (40.4, -111.4, 40, 0, 1800)],
+        {(40.3, -111.3)})
+    assert list(merged.values()) == [(40, 0), (10, 60), (50, 900), (30, 1200)]
+    assert 20 not in merged
+    assert merged.despawn_time(50) == 2700
+
+
+def test_despawn_times_length_counts_changes():
+    times = DespawnTimes(schedule())
+    assert len(times) == 3
+    times[40] = 100
+    times[10] = 200
+    assert len(times) == 4
+    del times[20]
+    assert times.pop(40) == 100
+    assert len(times) == 2
+    assert 20 not in times and 40 not in times
+    assert times[10] == 200
@@ -0,0 +1,49 @@
+from array import array
+
+import pytest
+
+from monocle import sanitized as conf
+from monocle.snapshot import SnapshotError, dump_snapshot, load_snapshot, snapshot_path
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(conf, 'DIRECTORY', str(tmp_path))
+
+
+def test_roundtrip(directory):
+    dump_snapshot('test', {'version': 2}, {
+        'ids': array('Q', [3, 1, 2]),
+        'lats': array('d', [40.5, -12.25]),
+        'names': ['a', 'ü'],
+        'raw': b'\x01\x02\x03'})
+    snapshot = load_snapshot('test')
+    assert snapshot.meta == {'version': 2}
+    assert list(snapshot['ids']) == [3, 1, 2]
+    assert snapshot.array('lats') == array('d', [40.5, -12.25])
+    assert snapshot['names'] == ['a', 'ü']
+    assert bytes(snapshot['raw']) == b'\x01\x02\x03'
+    assert 'missing' not in snapshot
+
+
+def test_corrupt_section(directory):
+    dump_snapshot('test', {}, {'ok': array('H', [1, 2]), 'bad': array('H', [3, 4])})
+    snapshot = load_snapshot('test')
+    offset = snapshot.start + snapshot.sections['bad']['offset']
+    del snapshot
+    with open(snapshot_path('test'), 'r+b') as f:
+        f.seek(offset)
+        f.write(b'\xff')
+    snapshot = load_snapshot('test')
+    assert list(snapshot['ok']) == [1, 2]
+    with pytest.raises(SnapshotError):
+        snapshot['bad']
+
+
+def test_corrupt_header(directory):
+    dump_snapshot('test', {'version': 1}, {})
+    with open(snapshot_path('test'), 'r+b') as f:
+        f.seek(20)
+        f.write(b'X')
+    with pytest.raises(SnapshotError):
+        load_snapshot('test')
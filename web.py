@@ -14,6 +14,7 @@ from flask import Flask, jsonify, Markup, render_template, request
 
 from monocle import db, sanitized as conf
 from monocle.names import POKEMON
+from monocle.roster import RosterReader
 from monocle.web_utils import *
 from monocle.bounds import area, center
 
@@ -104,7 +105,7 @@ def scan_coords():
 
 
 if conf.MAP_WORKERS:
-    workers = Workers()
+    workers = RosterReader()
 
     @app.route('/workers_data')
     def workers_data():
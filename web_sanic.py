@@ -11,7 +11,8 @@ from asyncpg import create_pool
 from monocle import sanitized as conf
 from monocle.bounds import center
 from monocle.names import DAMAGE, MOVES, POKEMON
-from monocle.web_utils import get_scan_coords, get_worker_markers, Workers, get_args
+from monocle.roster import RosterReader
+from monocle.web_utils import get_scan_coords, get_worker_markers, get_args
 
 
 env = Environment(loader=PackageLoader('monocle', 'templates'))
@@ -76,7 +77,7 @@ async def fullmap(request, html_map=render_map()):
 
 
 if conf.MAP_WORKERS:
-    workers = Workers()
+    workers = RosterReader()
 
 
     @app.get('/workers_data')